@@ -0,0 +1,283 @@
+"""Microbenchmarks for the server's CPU and SQLite hot paths.
+
+Runs each case in-process through the Flask test client against repeatable
+fixtures (see fixtures.py): a 20-agent conference chain and a 10-pair expert
+panel with ~2000-token responses, and a learning DB seeded with
+--learning-rows rows. OpenRouter is replaced by a local stub server.
+
+Covered: relay HTML reports, status/results serialization, every
+/api/human-simulator endpoint and the agent/plan catalog endpoints.
+
+    python benchmarks/bench_hot_paths.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_hot_paths.py --compare benchmarks/baseline.json --max-regression 0.25
+
+With --compare, exits 1 when any case's median is more than --max-regression
+slower than the baseline (and by more than --min-delta-ms).
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import fixtures
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+BASELINE_FORMAT = 'promptlink-bench/1'
+
+def configure_environment(workdir):
+    """Point every store at the scratch dir before the app is imported"""
+    os.environ.update({
+        'HUMAN_SIMULATOR_DB_PATH': os.path.join(workdir, 'human_simulator_learning.db'),
+        'HUMAN_SIMULATOR_DB_SHARDS': '1',
+        'RELAY_DB_PATH': os.path.join(workdir, 'relay_sessions.db'),
+        'BILLING_DB_PATH': os.path.join(workdir, 'billing.db'),
+        'TRACE_DIR': os.path.join(workdir, 'traces'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'REPORT_DIR': os.path.join(workdir, 'reports'),
+        # Background compaction would race the timed requests
+        'PATTERN_COMPACTION_INTERVAL': '0',
+        'OPENROUTER_API_KEY': os.environ.get('OPENROUTER_API_KEY', 'bench')
+    })
+    sys.path.insert(0, SRC_DIR)
+
+def prepare_learning_db(rows, rebuild=False):
+    """Restore the cached learning fixture, or seed (and cache) it on first use"""
+    from services import learning_store
+
+    if not rebuild and fixtures.restore_learning_db(rows, learning_store.LEARNING_DB_PATH):
+        return 'cached'
+    started = time.perf_counter()
+    with learning_store.connect_shard(0) as conn:
+        fixtures.seed_learning_db(conn, rows)
+    fixtures.save_learning_fixture(rows, learning_store.LEARNING_DB_PATH)
+    return f'seeded in {time.perf_counter() - started:.1f}s'
+
+def stored_session_id(user_id):
+    """A seeded simulator session that only exists in the store (not in memory)"""
+    from services import learning_store
+
+    with learning_store.connect(user_id) as conn:
+        return conn.execute(
+            'SELECT session_id FROM session_learning WHERE user_id = ? ORDER BY id LIMIT 1', (user_id,)
+        ).fetchone()[0]
+
+def expect_ok(response):
+    """Read the whole (possibly streamed) body and fail loudly on an error status"""
+    body = response.get_data()
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request.method} {response.request.path} -> '
+                           f'{response.status_code}: {body[:200]!r}')
+    return body
+
+def build_cases(client, rr, relay_ids, stored_session):
+    """(name, callable) pairs; each callable performs one timed operation"""
+    hot = fixtures.HOT_USER
+    # Writes go to another user so the hot user's history stays the same size
+    writer = 'bench_user_0'
+    chain_id = relay_ids['conference_chain']
+    panel_id = relay_ids['expert_panel']
+    relay = '/api/revolutionary-relay'
+    simulator = '/api/human-simulator'
+
+    def post(path, payload):
+        return lambda: expect_ok(client.post(path, json=payload))
+
+    def get(path, headers=None):
+        return lambda: expect_ok(client.get(path, headers=headers))
+
+    # One finished server-side session for the event/progress/stop cases
+    run_body = client.post(f'{simulator}/run-session', json={
+        'prompt': 'Benchmark the simulator loop', 'rounds': 3, 'user_id': hot
+    }).get_data(as_text=True)
+    finished_session = json.loads(run_body.splitlines()[0])['session_id']
+
+    interaction = {
+        'interaction_type': 'feedback',
+        'user_response': 'Show me the numbers first',
+        'ai_response': 'Here is a plan with three phases and a cost estimate.',
+        'effectiveness': 0.8,
+        'user_id': writer
+    }
+    ai_response = 'I think we should refactor the scheduler before adding more agents, it will take two weeks.'
+
+    return [
+        ('relay.result_dicts.chain', lambda: rr.result_dicts(rr.active_sessions[chain_id])),
+        ('relay.result_dicts.panel', lambda: rr.result_dicts(rr.active_sessions[panel_id])),
+        ('relay.session_status.chain', get(f'{relay}/session-status/{chain_id}')),
+        ('relay.session_results.chain', get(f'{relay}/session-results/{chain_id}')),
+        ('relay.session_results.panel', get(f'{relay}/session-results/{panel_id}')),
+        ('relay.session_results.chain.gzip', get(f'{relay}/session-results/{chain_id}', {'Accept-Encoding': 'gzip'})),
+        ('relay.html_report.chain', get(f'{relay}/generate-html-report/{chain_id}')),
+        ('relay.html_report.panel', get(f'{relay}/generate-html-report/{panel_id}')),
+        ('relay.report_file.chain', get(f'{relay}/report/{chain_id}', {'Accept-Encoding': 'gzip'})),
+        ('relay.report_file.panel', get(f'{relay}/report/{panel_id}', {'Accept-Encoding': 'gzip'})),
+
+        ('simulator.start_session', post(f'{simulator}/start-session', {'prompt': 'Plan a launch', 'user_id': writer})),
+        ('simulator.run_session', post(f'{simulator}/run-session', {'prompt': 'Plan a launch', 'rounds': 3, 'user_id': writer})),
+        ('simulator.session_events', get(f'{simulator}/session-events/{finished_session}')),
+        ('simulator.session_progress.memory', get(f'{simulator}/session-progress/{finished_session}')),
+        ('simulator.session_progress.stored', get(f'{simulator}/session-progress/{stored_session}')),
+        ('simulator.stop_session', post(f'{simulator}/stop-session/{finished_session}', {})),
+        ('simulator.get_characteristic_phrase', post(f'{simulator}/get-characteristic-phrase', {
+            'context': 'The deployment failed again and the rollback took an hour', 'user_id': hot
+        })),
+        ('simulator.simulate_human_response', post(f'{simulator}/simulate-human-response', {
+            'context': 'architecture review', 'ai_response': ai_response, 'user_id': hot
+        })),
+        ('simulator.learn_from_interaction', post(f'{simulator}/learn-from-interaction', interaction)),
+        ('simulator.learn_from_interactions.100', post(f'{simulator}/learn-from-interactions', {
+            'interactions': [dict(interaction, user_response=f'Batch reply {number}') for number in range(100)],
+            'user_id': writer
+        })),
+        ('simulator.get_clone_confidence', get(f'{simulator}/get-clone-confidence?user_id={hot}')),
+        ('simulator.learning_shards', get(f'{simulator}/learning-shards')),
+        ('simulator.export_clone.json', get(f'{simulator}/export-clone?user_id={hot}')),
+        ('simulator.export_clone.ndjson', get(f'{simulator}/export-clone?user_id={hot}&format=ndjson')),
+        ('simulator.compact_patterns', post(f'{simulator}/compact-patterns', {})),
+
+        ('catalog.agents_list', get('/api/list')),
+        ('catalog.agents_all', get('/api/all')),
+        ('catalog.relay_agents', get(f'{relay}/agents')),
+        ('catalog.payment_plans', get('/api/payments/plans'))
+    ]
+
+def measure(fn, iterations, warmup):
+    """Per-call wall times in ms after `warmup` untimed calls"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'median_ms': round(statistics.median(timings), 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        'min_ms': round(timings[0], 4),
+        'mean_ms': round(statistics.fmean(timings), 4)
+    }
+
+def compare(results, baseline, max_regression, min_delta_ms):
+    """Per-case median ratios against a baseline; returns (rows, regressed case names)"""
+    rows = []
+    regressed = []
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            rows.append((name, current['median_ms'], None, None))
+            continue
+        ratio = current['median_ms'] / previous['median_ms'] if previous['median_ms'] else 1.0
+        rows.append((name, current['median_ms'], previous['median_ms'], ratio))
+        if ratio > 1 + max_regression and current['median_ms'] - previous['median_ms'] > min_delta_ms:
+            regressed.append(name)
+    return rows, regressed
+
+def environment_info(args):
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'learning_rows': args.learning_rows,
+        'fixture_version': fixtures.FIXTURE_VERSION
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--learning-rows', type=int, default=1_000_000)
+    parser.add_argument('--rebuild-fixtures', action='store_true', help='re-seed the cached learning DB')
+    parser.add_argument('--only', action='append', metavar='PATTERN', help='run matching cases (glob, repeatable)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results as a baseline file')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a baseline file')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='allowed slowdown of a median (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='ignore slowdowns smaller than this')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        if baseline.get('format') != BASELINE_FORMAT:
+            parser.error(f'{args.compare} is not a {BASELINE_FORMAT} baseline')
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir)
+        import main as app_module
+        from routes import revolutionary_relay as rr
+        from services import openrouter
+
+        fixture_status = prepare_learning_db(args.learning_rows, args.rebuild_fixtures)
+        stub_server, openrouter.OPENROUTER_URL = fixtures.start_stub_openrouter()
+        relay_ids = fixtures.relay_sessions(rr)
+        if not args.json:
+            print(f'learning DB: {args.learning_rows} rows ({fixture_status})')
+
+        client = app_module.app.test_client()
+        try:
+            cases = build_cases(client, rr, relay_ids, stored_session_id(fixtures.HOT_USER))
+            if args.only:
+                cases = [case for case in cases if any(fnmatch.fnmatch(case[0], pattern) for pattern in args.only)]
+
+            results = {}
+            for name, fn in cases:
+                results[name] = measure(fn, args.iterations, args.warmup)
+                if not args.json:
+                    stats = results[name]
+                    print(f"{name:<42} median {stats['median_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms  "
+                          f"min {stats['min_ms']:>10.3f} ms")
+        finally:
+            stub_server.shutdown()
+
+    document = {
+        'format': BASELINE_FORMAT,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment_info(args),
+        'results': results
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as handle:
+            json.dump(document, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+
+    regressed = []
+    if baseline is not None:
+        rows, regressed = compare(results, baseline, args.max_regression, args.min_delta_ms)
+        document['comparison'] = {
+            'baseline': args.compare,
+            'baseline_environment': baseline.get('environment'),
+            'max_regression': args.max_regression,
+            'ratios': {name: round(ratio, 4) for name, _, _, ratio in rows if ratio is not None},
+            'regressed': regressed
+        }
+        if not args.json:
+            if baseline.get('environment') != document['environment']:
+                print('note: baseline was recorded in a different environment or fixture size')
+            print(f"\n{'case':<42} {'current':>10} {'baseline':>10} {'ratio':>7}")
+            for name, current, previous, ratio in rows:
+                if ratio is None:
+                    print(f'{name:<42} {current:>10.3f} {"-":>10} {"new":>7}')
+                else:
+                    flag = '  REGRESSED' if name in regressed else ''
+                    print(f'{name:<42} {current:>10.3f} {previous:>10.3f} {ratio:>7.2f}{flag}')
+
+    if args.json:
+        print(json.dumps(document))
+    elif regressed:
+        print(f'\n{len(regressed)} case(s) regressed by more than {args.max_regression:.0%}')
+
+    sys.exit(1 if regressed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Cold-start guard: time `import main` in fresh interpreters.
+
+Fails (exit 1) when the median import time exceeds --max-ms, or when importing
+the app touches the learning database (which must now happen lazily).
+
+    python benchmarks/bench_import_time.py --runs 10 --max-ms 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+IMPORT_SNIPPET = (
+    'import time; started = time.perf_counter(); import main; '
+    'print(round((time.perf_counter() - started) * 1000, 3))'
+)
+
+def time_import(db_path):
+    """Import src/main.py in a fresh interpreter and return the import time in ms"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR, HUMAN_SIMULATOR_DB_PATH=db_path)
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET],
+        cwd=tempfile.gettempdir(), env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=1000.0)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'human_simulator_learning.db')
+        timings = [time_import(db_path) for _ in range(args.runs)]
+        db_touched = os.path.exists(db_path)
+
+    result = {
+        'benchmark': 'import_main',
+        'runs': args.runs,
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'threshold_ms': args.max_ms,
+        'learning_db_touched': db_touched
+    }
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"import main: median {result['median_ms']} ms, min {result['min_ms']} ms, "
+              f"max {result['max_ms']} ms over {args.runs} runs (limit {args.max_ms} ms)")
+        if db_touched:
+            print('learning database was created at import time')
+
+    failed = db_touched or result['median_ms'] > args.max_ms
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""JSON encode throughput: Flask's default provider vs services.json_provider.
+
+Encodes representative response payloads built from the benchmark fixtures
+(see fixtures.py) with each encoder and reports the median time and MB/s:
+
+- relay.results.chain / relay.results.panel: session-results bodies of the
+  20-agent chain and the 10-pair panel (~2000-token responses)
+- learning.export: a page of clone-export rows
+- catalog.agents / catalog.agents.preserialized: the /api/all body, with the
+  catalog encoded per request or spliced in pre-serialized
+
+Encoders: flask-default (stdlib json with Flask's default settings), stdlib
+and orjson (json_provider's two backends; orjson only when installed).
+
+    python benchmarks/bench_json.py --iterations 30
+"""
+import argparse
+import fnmatch
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import fixtures
+from bench_hot_paths import configure_environment
+
+EXPORT_ROWS = 5000
+
+def export_rows(rows=EXPORT_ROWS, seed=fixtures.SEED):
+    """Rows shaped like the user_patterns section of a clone export"""
+    rng = random.Random(seed)
+    return [
+        {
+            'id': number,
+            'user_id': fixtures.HOT_USER,
+            'pattern_type': rng.choice(fixtures.INTERACTION_TYPES),
+            'pattern_data': json.dumps({
+                'user_response': rng.choice(fixtures.PHRASES),
+                'ai_response': fixtures.synthetic_text(rng, 40),
+                'effectiveness': round(rng.random(), 3)
+            }),
+            'confidence_score': round(rng.random(), 3),
+            'usage_count': rng.randint(1, 20),
+            'created_at': '2024-06-11 12:00:00',
+            'updated_at': '2024-06-11 12:00:00'
+        }
+        for number in range(rows)
+    ]
+
+def build_payloads(rr, relay_ids, agents, json_provider):
+    def results_body(session_id):
+        session = rr.active_sessions[session_id]
+        return {
+            'status': 'success',
+            'session_id': session_id,
+            'mode': session['mode'],
+            'prompt': session['prompt'],
+            'results': rr.result_dicts(session),
+            'total_results': len(session['results']),
+            'context_budget': session.get('context_budget'),
+            'completed': True,
+            'created_at': session['created_at'],
+            'completed_at': session.get('completed_at')
+        }
+
+    def catalog_body(catalog):
+        return {
+            'status': 'success',
+            'agents': catalog,
+            'total_agents': len(agents.AGENTS),
+            'current_working': list(agents.AGENTS.keys())[:10],
+            'revolutionary_additional': list(agents.AGENTS.keys())[10:],
+            'timestamp': '2024-06-11T12:00:00'
+        }
+
+    # (name, payload, payload whose flask-default time is the reference)
+    return [
+        ('relay.results.chain', results_body(relay_ids['conference_chain']), 'relay.results.chain'),
+        ('relay.results.panel', results_body(relay_ids['expert_panel']), 'relay.results.panel'),
+        ('learning.export', {'status': 'success', 'patterns': export_rows()}, 'learning.export'),
+        ('catalog.agents', catalog_body(agents.AGENTS), 'catalog.agents'),
+        # Flask's provider can't embed pre-serialized values: compare with the plain catalog
+        ('catalog.agents.preserialized', catalog_body(json_provider.preserialize(agents.AGENTS)), 'catalog.agents')
+    ]
+
+def build_encoders(json_provider):
+    from flask.json.provider import DefaultJSONProvider
+
+    def flask_default(value):
+        # What jsonify did before: stdlib json, ASCII-escaped, sorted, compact
+        return json.dumps(value, default=DefaultJSONProvider.default, ensure_ascii=True,
+                          sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    def provider(use_orjson):
+        def encode(value):
+            json_provider.USE_ORJSON = use_orjson
+            return json_provider.encode(value)
+        return encode
+
+    encoders = [('flask-default', flask_default), ('stdlib', provider(False))]
+    if json_provider.orjson is not None:
+        encoders.append(('orjson', provider(True)))
+    return encoders
+
+def measure(encode, value, iterations, warmup):
+    size = len(encode(value))
+    for _ in range(warmup):
+        encode(value)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        encode(value)
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        'iterations': iterations,
+        'bytes': size,
+        'median_ms': round(median * 1000, 4),
+        'min_ms': round(min(timings) * 1000, 4),
+        'mb_per_s': round(size / median / 1e6, 2) if median else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', action='append', metavar='PATTERN', help='run matching payloads (glob, repeatable)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir)
+        from routes import agents
+        from routes import revolutionary_relay as rr
+        from services import json_provider
+
+        payloads = build_payloads(rr, fixtures.relay_sessions(rr), agents, json_provider)
+        if args.only:
+            payloads = [payload for payload in payloads
+                        if any(fnmatch.fnmatch(payload[0], pattern) for pattern in args.only)]
+        encoders = build_encoders(json_provider)
+        default_backend = json_provider.USE_ORJSON
+
+        results = {}
+        try:
+            for name, value, reference in payloads:
+                results[name] = {}
+                for encoder_name, encode in encoders:
+                    if encoder_name == 'flask-default' and name != reference:
+                        continue
+                    results[name][encoder_name] = stats = measure(encode, value, args.iterations, args.warmup)
+                    if not args.json:
+                        reference_ms = results.get(reference, {}).get('flask-default', {}).get('median_ms')
+                        speedup = reference_ms / stats['median_ms'] if reference_ms and stats['median_ms'] else 0
+                        print(f"{name:<30} {encoder_name:<14} median {stats['median_ms']:>9.3f} ms  "
+                              f"{stats['mb_per_s']:>8.1f} MB/s  {stats['bytes']:>9} B  x{speedup:.2f}")
+        finally:
+            json_provider.USE_ORJSON = default_backend
+
+    if args.json:
+        print(json.dumps({'benchmark': 'json_encode', 'default_backend': 'orjson' if default_backend else 'stdlib',
+                          'results': results}))
+
+if __name__ == '__main__':
+    sys.exit(main())
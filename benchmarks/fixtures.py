@@ -0,0 +1,218 @@
+"""Repeatable fixtures for the hot-path benchmarks.
+
+Everything is generated from a fixed seed, so two runs (or two machines) see
+the same data: synthetic relay sessions with ~2000-token agent responses, a
+learning database seeded with a large number of rows, and a local stand-in for
+the OpenRouter API so simulator rounds never leave the machine.
+
+The learning database is slow to build at full size, so it is built once per
+row count under benchmarks/.fixtures/ and copied into each run's scratch dir.
+"""
+import json
+import os
+import random
+import shutil
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_VERSION = 1
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fixtures')
+SEED = 20240611
+
+RESPONSE_TOKENS = 2000
+CHAIN_AGENTS = 20
+PANEL_PAIRS = 10
+
+# The user every per-user endpoint is benchmarked against; it holds a heavy
+# but realistic history while the rest of the rows are spread over other users
+HOT_USER = 'bench_hot_user'
+HOT_USER_PATTERNS = 5000
+HOT_USER_PHRASES = 500
+OTHER_USERS = 2000
+
+INTERACTION_TYPES = ['feedback', 'correction', 'approval', 'rejection', 'clarification', 'escalation']
+
+WORDS = (
+    'agent context model prompt response latency throughput budget token insight relay chain panel '
+    'analysis strategy risk market signal evidence tradeoff baseline metric cache index shard session '
+    'customer revenue pipeline deploy rollback failure recovery checkpoint schedule queue worker thread '
+    'the of and to in that is for with as on by this be are from at it an or which'
+).split()
+
+PHRASES = [
+    "You're the AI, not me - you figure it out",
+    'No more false promises',
+    'Show me the numbers first',
+    'That is not what I asked for',
+    'Keep it short and concrete',
+    'Good, now make it production ready',
+    'Why does this take so long?',
+    'Stop hedging and pick one'
+]
+
+def synthetic_text(rng, tokens=RESPONSE_TOKENS):
+    """Paragraphs of filler prose of roughly `tokens` tokens (~4 characters each)"""
+    target = tokens * 4
+    paragraphs = []
+    length = 0
+    while length < target:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(WORDS, k=rng.randint(8, 22))
+            sentences.append(' '.join(words).capitalize() + '.')
+        paragraph = ' '.join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)[:target]
+
+def relay_sessions(rr, seed=SEED):
+    """Insert a completed 20-agent chain and a 10-pair panel into the relay's session table"""
+    from services.relay_results import ChainResult, PairResult
+
+    rng = random.Random(seed)
+    agent_count = min(CHAIN_AGENTS, len(rr.RELAY_AGENTS))
+    created_at = '2024-06-11T12:00:00'
+    budget = {'trimmed_messages': 0, 'original_tokens': 0, 'sent_tokens': 0, 'saved_tokens': 0}
+
+    chain_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    rr.active_sessions[chain_id] = {
+        'mode': 'conference_chain',
+        'prompt': synthetic_text(rng, 300),
+        'user_id': HOT_USER,
+        'tier': 'expert',
+        'status': 'completed',
+        'created_at': created_at,
+        'completed_at': created_at,
+        'max_agents': agent_count,
+        'current_agent': agent_count,
+        'total_agents': agent_count,
+        'current_agent_name': rr.RELAY_AGENTS[agent_count - 1]['name'],
+        'context_budget': budget,
+        'results': [ChainResult(index, index, synthetic_text(rng), index > 0) for index in range(agent_count)]
+    }
+
+    panel_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    rr.active_sessions[panel_id] = {
+        'mode': 'expert_panel',
+        'prompt': synthetic_text(rng, 300),
+        'user_id': HOT_USER,
+        'tier': 'expert',
+        'status': 'completed',
+        'created_at': created_at,
+        'completed_at': created_at,
+        'current_pair': PANEL_PAIRS,
+        'total_pairs': PANEL_PAIRS,
+        'current_agents': [],
+        'context_budget': budget,
+        'results': [
+            PairResult(pair + 1, (pair * 2) % len(rr.RELAY_AGENTS), (pair * 2 + 1) % len(rr.RELAY_AGENTS),
+                       synthetic_text(rng), synthetic_text(rng))
+            for pair in range(PANEL_PAIRS)
+        ]
+    }
+    return {'conference_chain': chain_id, 'expert_panel': panel_id}
+
+def learning_fixture_path(rows):
+    return os.path.join(FIXTURE_DIR, f'learning-v{FIXTURE_VERSION}-{rows}.db')
+
+def restore_learning_db(rows, db_path):
+    """Copy a cached learning fixture to db_path; False if it hasn't been built yet"""
+    cached = learning_fixture_path(rows)
+    if not os.path.exists(cached):
+        return False
+    shutil.copyfile(cached, db_path)
+    return True
+
+def _user_rows(rng, user_id, patterns, phrases, sessions):
+    pattern_rows = []
+    for _ in range(patterns):
+        interaction_type = rng.choice(INTERACTION_TYPES)
+        effectiveness = round(rng.random(), 3)
+        pattern_rows.append((user_id, interaction_type, json.dumps({
+            'interaction_type': interaction_type,
+            'user_response': rng.choice(PHRASES) + ' ' + ' '.join(rng.choices(WORDS, k=6)),
+            'ai_response': ' '.join(rng.choices(WORDS, k=18)),
+            'effectiveness': effectiveness,
+            'timestamp': '2024-06-11T12:00:00'
+        }), effectiveness))
+    phrase_rows = [
+        (user_id, f'{rng.choice(PHRASES)} ({number})', rng.choice(INTERACTION_TYPES), round(rng.random(), 3))
+        for number in range(phrases)
+    ]
+    session_rows = [
+        (str(uuid.UUID(int=rng.getrandbits(128))), user_id,
+         json.dumps({'prompt': ' '.join(rng.choices(WORDS, k=12)), 'strategy': 'balanced', 'rounds': 5,
+                     'status': 'completed', 'current_round': 5}),
+         json.dumps({}))
+        for _ in range(sessions)
+    ]
+    return pattern_rows, phrase_rows, session_rows
+
+def seed_learning_db(conn, rows, seed=SEED):
+    """Bulk-load `rows` learning rows (80% patterns, 10% phrases, 10% sessions) into a fresh store"""
+    rng = random.Random(seed)
+    hot_sessions = 50
+    remaining = max(rows - HOT_USER_PATTERNS - HOT_USER_PHRASES - hot_sessions, 0)
+    per_user = remaining / OTHER_USERS
+
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA synchronous=OFF')
+    batches = [(HOT_USER, HOT_USER_PATTERNS, HOT_USER_PHRASES, hot_sessions)]
+    written = 0
+    for number in range(OTHER_USERS):
+        target = int(per_user * (number + 1)) - written
+        written += target
+        batches.append((f'bench_user_{number}', target - 2 * (target // 10), target // 10, target // 10))
+
+    for user_id, patterns, phrases, sessions in batches:
+        pattern_rows, phrase_rows, session_rows = _user_rows(rng, user_id, patterns, phrases, sessions)
+        cursor.executemany('''
+            INSERT INTO user_patterns (user_id, pattern_type, pattern_data, confidence_score) VALUES (?, ?, ?, ?)
+        ''', pattern_rows)
+        cursor.executemany('''
+            INSERT INTO characteristic_phrases (user_id, phrase, context, effectiveness_score) VALUES (?, ?, ?, ?)
+        ''', phrase_rows)
+        cursor.executemany('''
+            INSERT INTO session_learning (session_id, user_id, interaction_data, learning_insights) VALUES (?, ?, ?, ?)
+        ''', session_rows)
+    conn.commit()
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('ANALYZE')
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def save_learning_fixture(rows, db_path):
+    """Cache a freshly seeded learning DB for later runs"""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    cached = learning_fixture_path(rows)
+    shutil.copyfile(db_path, cached + '.tmp')
+    os.replace(cached + '.tmp', cached)
+
+def stub_completion(prompt_text):
+    """An OpenRouter-shaped chat completion with a deterministic ~2000-token answer"""
+    rng = random.Random(len(prompt_text))
+    return {
+        'id': 'bench',
+        'choices': [{'message': {'role': 'assistant', 'content': synthetic_text(rng)}}],
+        'usage': {'prompt_tokens': len(prompt_text) // 4, 'completion_tokens': RESPONSE_TOKENS}
+    }
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.dumps(stub_completion(body.decode('utf-8', 'replace'))).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub_openrouter():
+    """Serve stub completions on a local port; returns (server, chat-completions URL)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/api/v1/chat/completions'
@@ -22,7 +22,7 @@ class RevolutionaryRelay {
 
             const data = await response.json();
             
-            if (data.status === 'started') {
+            if (data.status === 'started' || data.status === 'queued') {
                 this.activeSession = data.session_id;
                 this.startStatusMonitoring();
                 this.updateUI('expert_panel', 'Expert Panel Mode: 10 pairs analyzing independently...');
@@ -49,7 +49,7 @@ class RevolutionaryRelay {
 
             const data = await response.json();
             
-            if (data.status === 'started') {
+            if (data.status === 'started' || data.status === 'queued') {
                 this.activeSession = data.session_id;
                 this.startStatusMonitoring();
                 this.updateUI('conference_chain', 'Conference Chain Mode: 20 agents building with sticky context...');
@@ -276,6 +276,56 @@ class HumanSimulator {
         }
     }
 
+    // Run every round server-side in one request, streaming progress events
+    async runSession(prompt, strategy = 'balanced', rounds = 5, onEvent = () => {}) {
+        try {
+            const response = await fetch(`${this.baseUrl}/api/human-simulator/run-session`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({
+                    prompt,
+                    strategy,
+                    rounds,
+                    user_id: this.userId
+                })
+            });
+
+            // Errors (bad request, server error) come back as a JSON body, not a stream
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.message || `Human Simulator run failed (${response.status})`);
+            }
+
+            // One NDJSON event per line: session_started, round..., session_completed
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            const events = [];
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    events.push(event);
+                    onEvent(event);
+                }
+            }
+
+            return events;
+        } catch (error) {
+            console.error('Human Simulator run error:', error);
+            throw error;
+        }
+    }
+
     // Get characteristic phrase for context
     async getCharacteristicPhrase(context = 'general') {
         try {
@@ -332,6 +382,94 @@ class HumanSimulator {
     }
 }
 
+// Persistent Human Simulator channel: one WebSocket per user instead of a
+// POST per turn (phrase, learn, simulate, confidence and ping frames). The
+// server closes idle sockets after a short while; the next request reconnects.
+class HumanSimulatorChannel {
+    constructor(baseUrl = 'https://web-production-2816f.up.railway.app', userId = 'default_user') {
+        this.url = `${baseUrl.replace(/^http/, 'ws')}/api/human-simulator/ws?user_id=${encodeURIComponent(userId)}`;
+        this.socket = null;
+        this.nextId = 1;
+        this.pending = new Map();
+        this.ready = null;
+        this.onConfidence = () => {};
+    }
+
+    // Resolves with the server's ready frame (initial clone confidence)
+    connect() {
+        this.ready = new Promise((resolve, reject) => {
+            const socket = new WebSocket(this.url);
+            this.socket = socket;
+            let opened = false;
+            socket.onerror = reject;
+            socket.onclose = () => {
+                if (this.socket === socket) this.ready = null;
+                for (const { reject: fail } of this.pending.values()) fail(new Error('Simulator channel closed'));
+                this.pending.clear();
+                if (!opened) reject(new Error('Simulator channel closed'));
+            };
+            socket.onmessage = (event) => {
+                const message = JSON.parse(event.data);
+                if (message.type === 'ready') {
+                    opened = true;
+                    this.onConfidence(message);
+                    resolve(message);
+                    return;
+                }
+                if (!opened && message.type === 'error') {
+                    // The server is at its socket limit
+                    reject(new Error(message.message));
+                    return;
+                }
+                const waiter = this.pending.get(message.id);
+                if (!waiter) return;
+                this.pending.delete(message.id);
+                if (message.type === 'error') waiter.reject(new Error(message.message));
+                else waiter.resolve(message);
+            };
+        });
+        return this.ready;
+    }
+
+    async request(type, payload = {}) {
+        // Reconnect after an idle close
+        await (this.ready || this.connect());
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            this.socket.send(JSON.stringify({ ...payload, type, id }));
+        });
+    }
+
+    async getCharacteristicPhrase(context = 'general') {
+        return (await this.request('phrase', { context })).phrase;
+    }
+
+    // Acknowledged once stored; carries the updated clone confidence
+    async learnFromInteraction(interactionType, userResponse, aiResponse, effectiveness = 0.7) {
+        const update = await this.request('learn', {
+            interaction_type: interactionType,
+            user_response: userResponse,
+            ai_response: aiResponse,
+            effectiveness
+        });
+        this.onConfidence(update);
+        return update;
+    }
+
+    simulateHumanResponse(context, aiResponse) {
+        return this.request('simulate', { context, ai_response: aiResponse });
+    }
+
+    getCloneConfidence() {
+        return this.request('confidence');
+    }
+
+    close() {
+        if (this.socket) this.socket.close();
+    }
+}
+
 // Initialize revolutionary systems
 const revolutionaryRelay = new RevolutionaryRelay();
 const humanSimulator = new HumanSimulator();
@@ -378,8 +516,12 @@ async function startHumanSimulatorWithLearning() {
     }
 
     try {
-        const result = await humanSimulator.startLearningSession(prompt, strategy, rounds);
-        console.log('Human Simulator started with learning:', result);
+        const events = await humanSimulator.runSession(prompt, strategy, rounds, (event) => {
+            if (event.type === 'round') {
+                console.log(`Round ${event.round} (${event.agent_name}):`, event.human_response);
+            }
+        });
+        console.log('Human Simulator session finished:', events[events.length - 1]);
         
         // Show clone confidence
         const confidence = await humanSimulator.getCloneConfidence();
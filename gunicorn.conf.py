@@ -0,0 +1,64 @@
+# Production server settings: gunicorn -c gunicorn.conf.py
+# One preloaded gthread worker by default: Human Simulator jobs, live model
+# stats and the relay scheduler's concurrency limits still live in process
+# memory, so a second worker would 404 job polls that land on it and multiply
+# the configured caps. Requests are I/O-bound (OpenRouter, Stripe, SQLite), so
+# concurrency comes from threads: a slow upstream call holds one thread, not
+# the process. Raise WEB_CONCURRENCY only once that state is shared.
+import os
+import signal
+import threading
+import time
+
+wsgi_app = 'main:app'
+pythonpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+preload_app = True
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+# Long enough for a synchronous batch-chat call to every agent
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+keepalive = 5
+# On SIGTERM in-flight requests and the relay session drain (RELAY_DRAIN_SECONDS)
+# run side by side; both must end within this before the arbiter SIGKILLs
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '45'))
+
+accesslog = '-'
+errorlog = '-'
+
+# Per worker process (the arbiter's copy stays empty)
+_drain = {}
+
+def start_drain():
+    """Stop admitting relay sessions and let running ones finish or hand them off (once)"""
+    from routes import revolutionary_relay
+
+    if 'thread' in _drain:
+        return
+    drain_seconds = min(revolutionary_relay.RELAY_DRAIN_SECONDS, max(graceful_timeout - 5, 0))
+
+    def drain():
+        _drain['unfinished'] = revolutionary_relay.drain_sessions(drain_seconds)
+
+    _drain['deadline'] = time.monotonic() + drain_seconds + 2
+    _drain['thread'] = threading.Thread(target=drain, name='relay-drain', daemon=True)
+    _drain['thread'].start()
+
+def post_worker_init(worker):
+    """Start the drain as soon as SIGTERM arrives, not after in-flight requests"""
+    def handle_term(sig, frame):
+        start_drain()
+        worker.handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+def worker_exit(server, worker):
+    """Wait for the drain (started here if the worker exits for another reason)"""
+    start_drain()
+    _drain['thread'].join(max(_drain['deadline'] - time.monotonic(), 0))
+    unfinished = _drain.get('unfinished')
+    if unfinished:
+        server.log.info('Worker %s handed off %d relay sessions at their last checkpoint', worker.pid, len(unfinished))
@@ -3,7 +3,7 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory, jsonify
+from flask import Flask, send_from_directory, jsonify, g, request
 from flask_cors import CORS
 from datetime import datetime
 
@@ -12,15 +12,24 @@ from routes.agents import agents_bp
 from routes.human_simulator import human_simulator_bp
 from routes.revolutionary_relay import revolutionary_relay_bp
 from routes.payments import payments_bp
+from routes.profiles import profiles_bp
+from services import http_cache
+from services import json_provider
+from services import profiling
+from services import tracing
 
 from flask_cors import CORS
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+# jsonify through orjson when installed (stdlib otherwise), with pre-serialized catalogs
+app.json = json_provider.FastJSONProvider(app)
 CORS(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'promptlink-ultimate-orchestration-engine-secret-key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# WebSocket channels (flask-sock): keep-alive pings through proxies, small frames only
+app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25, 'max_message_size': 64 * 1024}
 
 # Enable CORS for frontend integration
 CORS(app, origins=[
@@ -40,6 +49,70 @@ app.register_blueprint(agents_bp, url_prefix='/api')
 app.register_blueprint(human_simulator_bp, url_prefix='/api/human-simulator')
 app.register_blueprint(revolutionary_relay_bp, url_prefix='/api/revolutionary-relay')
 app.register_blueprint(payments_bp, url_prefix='/api/payments')
+app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
+
+# Request tracing: every request gets a trace id (or continues the caller's
+# X-Trace-Id) and a root span; relay sessions started by it keep the same id
+@app.before_request
+def start_request_trace():
+    incoming = request.headers.get('X-Trace-Id', '')
+    trace_id = incoming if incoming.isalnum() and len(incoming) <= 64 else None
+    g.trace_span = tracing.Span(
+        f'{request.method} {request.url_rule.rule if request.url_rule else request.path}',
+        trace_id=trace_id or tracing.new_id(),
+        kind='request'
+    ).start()
+
+@app.after_request
+def add_trace_header(response):
+    trace_span = g.get('trace_span')
+    if trace_span is not None:
+        response.headers['X-Trace-Id'] = trace_span.trace_id
+        trace_span.attrs['status'] = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    trace_span = g.pop('trace_span', None)
+    if trace_span is not None:
+        trace_span.finish(f'{type(error).__name__}: {error}' if error else None)
+
+# Opt-in profiling: requests with the admin X-Profile-Token header, or a
+# PROFILE_SAMPLE_RATE share of traffic, are run under cProfile and the profile
+# is stored by route (see /api/profiles)
+@app.before_request
+def start_request_profile():
+    if profiling.should_profile(request.headers.get(profiling.PROFILE_HEADER)):
+        g.request_profile = profiling.RequestProfile().start()
+
+@app.after_request
+def save_request_profile(response):
+    request_profile = g.pop('request_profile', None)
+    if request_profile is not None:
+        trace_span = g.get('trace_span')
+        try:
+            artifact = request_profile.finish(
+                f'{request.method} {request.url_rule.rule if request.url_rule else request.path}',
+                response.status_code,
+                trace_span.trace_id if trace_span else None
+            )
+            response.headers['X-Profile-Id'] = artifact
+        except Exception as e:
+            print(f"Saving request profile failed: {e}")
+    return response
+
+@app.teardown_request
+def discard_request_profile(error=None):
+    # A request that raised past the error handlers never reached after_request
+    request_profile = g.pop('request_profile', None)
+    if request_profile is not None:
+        request_profile.finish(f'{request.method} {request.path}', 500)
+
+# Response middleware: weak ETags from content versions (endpoints answer a
+# matching If-None-Match with 304) and gzip for larger text bodies
+@app.after_request
+def compress_and_tag_response(response):
+    return http_cache.finalize(response)
 
 # Legacy endpoints for backward compatibility
 @app.route('/api/chat', methods=['POST'])
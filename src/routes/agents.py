@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify
-import requests
 import os
 from datetime import datetime
 
+from routes.payments import request_user_id, subscription_error
+from services import http_cache
+from services import json_provider
+from services import openrouter
+
 agents_bp = Blueprint('agents', __name__)
 
 # Complete 20-agent configuration
@@ -152,16 +156,42 @@ AGENTS = {
     }
 }
 
+# Seconds a chat request waits for OpenRouter (the shared call may run longer)
+AGENT_CALL_TIMEOUT = float(os.getenv('AGENT_CALL_TIMEOUT', '90'))
+
+def agent_messages(agent, message):
+    """System + user messages for a direct chat with one agent"""
+    return [
+        {
+            'role': 'system',
+            'content': f'You are {agent["name"]}, specializing in {agent["specialty"]}. {agent["description"]}. Collaborate effectively and provide insightful responses.'
+        },
+        {
+            'role': 'user',
+            'content': message
+        }
+    ]
+
+# Catalog position of each agent (plans unlock agents in this order)
+AGENT_POSITIONS = {agent_id: position for position, agent_id in enumerate(AGENTS)}
+# Content version of the catalog responses (for conditional GETs)
+AGENTS_VERSION = http_cache.content_version(AGENTS)
+# The catalogs never change, so they are encoded once
+AGENTS_JSON = json_provider.preserialize(AGENTS)
+CURRENT_AGENTS_JSON = json_provider.preserialize({k: v for k, v in list(AGENTS.items())[:10]})
+
 @agents_bp.route('/list', methods=['GET'])
 def get_agents():
     """Get all available agents"""
     try:
-        # Return first 10 for current interface compatibility
-        current_agents = {k: v for k, v in list(AGENTS.items())[:10]}
+        not_modified = http_cache.conditional(AGENTS_VERSION)
+        if not_modified:
+            return not_modified
         
+        # Return first 10 for current interface compatibility
         return jsonify({
             'status': 'success',
-            'agents': current_agents,
+            'agents': CURRENT_AGENTS_JSON,
             'total_agents': len(AGENTS),
             'revolutionary_agents': len(AGENTS) - 10,
             'timestamp': datetime.utcnow().isoformat()
@@ -173,9 +203,13 @@ def get_agents():
 def get_all_agents():
     """Get all 20 agents for revolutionary modes"""
     try:
+        not_modified = http_cache.conditional(AGENTS_VERSION)
+        if not_modified:
+            return not_modified
+        
         return jsonify({
             'status': 'success',
-            'agents': AGENTS,
+            'agents': AGENTS_JSON,
             'total_agents': len(AGENTS),
             'current_working': list(AGENTS.keys())[:10],
             'revolutionary_additional': list(AGENTS.keys())[10:],
@@ -198,51 +232,38 @@ def chat_with_agent():
         if agent_id not in AGENTS:
             return jsonify({'status': 'error', 'message': 'Invalid agent_id'}), 400
         
-        agent = AGENTS[agent_id]
+        denied = subscription_error(request_user_id(data), [AGENT_POSITIONS[agent_id]])
+        if denied:
+            return denied
         
-        # Call OpenRouter API
-        openrouter_response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
-            headers={
-                'Authorization': f'Bearer {os.getenv("OPENROUTER_API_KEY")}',
-                'Content-Type': 'application/json',
-                'HTTP-Referer': 'https://thepromptlink.netlify.app',
-                'X-Title': 'PromptLink AI Collaboration'
-            },
-            json={
-                'model': agent['model'],
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': f'You are {agent["name"]}, specializing in {agent["specialty"]}. {agent["description"]}. Collaborate effectively and provide insightful responses.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': message
-                    }
-                ],
-                'max_tokens': 2000,
-                'temperature': 0.7
-            }
-        )
+        agent = AGENTS[agent_id]
         
-        if openrouter_response.status_code == 200:
-            response_data = openrouter_response.json()
-            agent_response = response_data['choices'][0]['message']['content']
-            
-            return jsonify({
-                'status': 'success',
-                'agent_id': agent_id,
-                'agent_name': agent['name'],
-                'response': agent_response,
-                'specialty': agent['specialty'],
-                'timestamp': datetime.utcnow().isoformat()
-            })
-        else:
+        # Call OpenRouter API (identical concurrent requests share one call)
+        try:
+            response_data = openrouter.chat_completion(
+                agent['model'],
+                agent_messages(agent, message),
+                timeout=AGENT_CALL_TIMEOUT
+            )
+        except openrouter.OpenRouterError as e:
             return jsonify({
                 'status': 'error',
-                'message': f'OpenRouter API error: {openrouter_response.status_code}'
+                'message': f'OpenRouter API error: {e.status_code}'
             }), 500
+        except TimeoutError:
+            return jsonify({
+                'status': 'error',
+                'message': f'OpenRouter API timeout after {AGENT_CALL_TIMEOUT}s'
+            }), 504
+        
+        return jsonify({
+            'status': 'success',
+            'agent_id': agent_id,
+            'agent_name': agent['name'],
+            'response': openrouter.completion_text(response_data),
+            'specialty': agent['specialty'],
+            'timestamp': datetime.utcnow().isoformat()
+        })
             
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -258,6 +279,13 @@ def batch_chat():
         if not agent_ids or not message:
             return jsonify({'status': 'error', 'message': 'Missing agent_ids or message'}), 400
         
+        denied = subscription_error(
+            request_user_id(data),
+            [AGENT_POSITIONS[agent_id] for agent_id in agent_ids if agent_id in AGENT_POSITIONS]
+        )
+        if denied:
+            return denied
+        
         responses = []
         
         for agent_id in agent_ids:
@@ -266,42 +294,22 @@ def batch_chat():
                 
             agent = AGENTS[agent_id]
             
-            # Call OpenRouter API for each agent
-            openrouter_response = requests.post(
-                'https://openrouter.ai/api/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {os.getenv("OPENROUTER_API_KEY")}',
-                    'Content-Type': 'application/json',
-                    'HTTP-Referer': 'https://thepromptlink.netlify.app',
-                    'X-Title': 'PromptLink AI Collaboration'
-                },
-                json={
-                    'model': agent['model'],
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': f'You are {agent["name"]}, specializing in {agent["specialty"]}. {agent["description"]}. Collaborate effectively and provide insightful responses.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': message
-                        }
-                    ],
-                    'max_tokens': 2000,
-                    'temperature': 0.7
-                }
-            )
+            # Call OpenRouter API for each agent (failed or timed-out agents are skipped)
+            try:
+                response_data = openrouter.chat_completion(
+                    agent['model'],
+                    agent_messages(agent, message),
+                    timeout=AGENT_CALL_TIMEOUT
+                )
+            except (openrouter.OpenRouterError, TimeoutError):
+                continue
             
-            if openrouter_response.status_code == 200:
-                response_data = openrouter_response.json()
-                agent_response = response_data['choices'][0]['message']['content']
-                
-                responses.append({
-                    'agent_id': agent_id,
-                    'agent_name': agent['name'],
-                    'response': agent_response,
-                    'specialty': agent['specialty']
-                })
+            responses.append({
+                'agent_id': agent_id,
+                'agent_name': agent['name'],
+                'response': openrouter.completion_text(response_data),
+                'specialty': agent['specialty']
+            })
         
         return jsonify({
             'status': 'success',
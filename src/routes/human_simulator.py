@@ -1,19 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, url_for
 import json
 import os
+from collections import OrderedDict
 from datetime import datetime
 import requests
 import sqlite3
 import uuid
+import zlib
+import queue
+import threading
+import time
+
+from services.similarity_index import UserIndexes, add_phrase, add_pattern
+from services import pattern_compaction
+from services import json_provider
+from services import learning_store
+from routes.revolutionary_relay import RELAY_AGENTS, call_openrouter_api
+
+try:
+    from flask_sock import Sock
+except ImportError:  # flask-sock is optional; without it there is no WebSocket channel
+    Sock = None
 
 human_simulator_bp = Blueprint('human_simulator', __name__)
 
-# Database setup for persistent learning
-def init_learning_db():
+# Database setup for persistent learning (runs once per shard, on first use)
+@learning_store.register_initializer
+def init_learning_db(conn, shard=0):
     """Initialize the learning database"""
-    conn = sqlite3.connect('human_simulator_learning.db')
     cursor = conn.cursor()
     
+    # Lets compaction hand freed pages back (only takes effect on a new file)
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    cursor.execute('PRAGMA journal_mode = WAL')
+    
     # User learning patterns table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS user_patterns (
@@ -53,11 +73,44 @@ def init_learning_db():
         )
     ''')
     
+    # Compacted per-(user, pattern_type) rollups of old raw patterns
+    cursor.execute(pattern_compaction.AGGREGATES_SCHEMA)
+    
+    # Per-user lookups (confidence, simulation, export) walk these indexes
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_patterns_user ON user_patterns (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_learning_user ON session_learning (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_characteristic_phrases_user ON characteristic_phrases (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_learning_session ON session_learning (session_id)')
+    
+    # Rounds played by the server-side simulator loop
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS session_rounds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            user_id TEXT,
+            round_number INTEGER,
+            agent_id TEXT,
+            ai_message TEXT,
+            ai_response TEXT,
+            human_response TEXT,
+            decision TEXT,
+            confidence REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_rounds_session ON session_rounds (session_id, round_number)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_rounds_user ON session_rounds (user_id)')
+    
+    # One-off markers such as completed seeding
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS learning_store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     conn.commit()
-    conn.close()
-
-# Initialize database on import
-init_learning_db()
 
 # Your characteristic phrases (starter set)
 STARTER_PHRASES = [
@@ -83,27 +136,75 @@ STARTER_PHRASES = [
     "We're ready to dominate"
 ]
 
-def add_starter_phrases(user_id="default_user"):
-    """Add starter phrases to database"""
-    conn = sqlite3.connect('human_simulator_learning.db')
+def add_starter_phrases(user_id="default_user", conn=None):
+    """Add starter phrases to database (once per user)"""
+    if conn is None:
+        with learning_store.connect(user_id) as conn:
+            return add_starter_phrases(user_id, conn)
+    
     cursor = conn.cursor()
+    seed_key = f'starter_phrases:{user_id}'
     
-    for phrase in STARTER_PHRASES:
-        cursor.execute('''
-            INSERT OR IGNORE INTO characteristic_phrases 
-            (user_id, phrase, context, usage_frequency, effectiveness_score)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, phrase, "general_collaboration", 1, 0.8))
+    # Cheap read-only check first; most starts find seeding already done
+    cursor.execute('SELECT 1 FROM learning_store_meta WHERE key = ?', (seed_key,))
+    if cursor.fetchone():
+        return False
+    
+    # Take the write lock so concurrent workers can't seed twice
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT 1 FROM learning_store_meta WHERE key = ?', (seed_key,))
+    if cursor.fetchone():
+        conn.rollback()
+        return False
+    
+    cursor.executemany('''
+        INSERT INTO characteristic_phrases 
+        (user_id, phrase, context, usage_frequency, effectiveness_score)
+        SELECT ?, ?, ?, ?, ?
+        WHERE NOT EXISTS (
+            SELECT 1 FROM characteristic_phrases WHERE user_id = ? AND phrase = ?
+        )
+    ''', [(user_id, phrase, "general_collaboration", 1, 0.8, user_id, phrase) for phrase in STARTER_PHRASES])
+    cursor.execute('''
+        INSERT INTO learning_store_meta (key, value) VALUES (?, ?)
+    ''', (seed_key, str(len(STARTER_PHRASES))))
     
     conn.commit()
-    conn.close()
+    return True
 
-# Add starter phrases on initialization
-add_starter_phrases()
+@learning_store.register_initializer
+def seed_default_user(conn, shard):
+    """Seed the default user's starter phrases on the shard that holds them"""
+    if shard == learning_store.shard_for('default_user'):
+        add_starter_phrases(conn=conn)
+
+def create_simulator_session(user_id, prompt, strategy, rounds):
+    """Record a new simulator session and return its id and session data"""
+    session_id = str(uuid.uuid4())
+    
+    session_data = {
+        'prompt': prompt,
+        'strategy': strategy,
+        'rounds': rounds,
+        'status': 'started',
+        'current_round': 0
+    }
+    
+    # Store session start in learning database
+    with learning_store.connect(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO session_learning 
+            (session_id, user_id, interaction_data, learning_insights)
+            VALUES (?, ?, ?, ?)
+        ''', (session_id, user_id, json.dumps(session_data), json.dumps({})))
+        conn.commit()
+    
+    return session_id, session_data
 
 @human_simulator_bp.route('/start-session', methods=['POST'])
 def start_human_simulator_session():
-    """Start a Human Simulator session with learning"""
+    """Start a Human Simulator session with learning (run_rounds=true plays it server-side)"""
     try:
         data = request.get_json()
         prompt = data.get('prompt', '')
@@ -111,35 +212,325 @@ def start_human_simulator_session():
         rounds = data.get('rounds', 5)
         user_id = data.get('user_id', 'default_user')
         
-        session_id = str(uuid.uuid4())
-        
-        # Store session start in learning database
-        conn = sqlite3.connect('human_simulator_learning.db')
-        cursor = conn.cursor()
+        session_id, session_data = create_simulator_session(user_id, prompt, strategy, rounds)
         
-        session_data = {
-            'prompt': prompt,
-            'strategy': strategy,
-            'rounds': rounds,
-            'status': 'started',
-            'current_round': 0
+        response = {
+            'status': 'success',
+            'session_id': session_id,
+            'message': 'Human Simulator session started with learning enabled',
+            'learning_active': True,
+            'user_patterns_loaded': True
         }
         
+        if data.get('run_rounds'):
+            start_simulator_job(session_id, user_id, session_data, data.get('context', 'general'), data.get('agent_ids'))
+            response['running'] = True
+            response['events_url'] = url_for('human_simulator.get_simulator_session_events', session_id=session_id)
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# Server-side round loop: agent reply -> simulated human reply -> persist -> publish
+simulator_jobs = {}
+# Finished jobs stay in memory for late readers until they expire or are the
+# least recently finished beyond the cap; the store keeps every round anyway
+finished_simulator_jobs = OrderedDict()  # session_id -> monotonic finish time, oldest first
+simulator_jobs_lock = threading.Lock()
+
+SIMULATOR_DEFAULT_AGENTS = ['gpt-4o', 'chatgpt-4-turbo', 'deepseek-r1', 'meta-llama-3.3', 'mistral-large']
+SIMULATOR_MAX_ROUNDS = int(os.getenv('HUMAN_SIMULATOR_MAX_ROUNDS', '50'))
+SIMULATOR_EVENT_WAIT = 15  # seconds between keep-alive lines on an idle stream
+SIMULATOR_JOB_TTL_SECONDS = float(os.getenv('HUMAN_SIMULATOR_JOB_TTL_SECONDS', '600'))
+SIMULATOR_MAX_FINISHED_JOBS = int(os.getenv('HUMAN_SIMULATOR_MAX_FINISHED_JOBS', '100'))
+
+def resolve_simulator_agents(agent_ids):
+    """Map requested agent ids to relay agent configs (defaults when none are valid)"""
+    agents_by_id = {agent['id']: agent for agent in RELAY_AGENTS}
+    agents = [agents_by_id[agent_id] for agent_id in (agent_ids or []) if agent_id in agents_by_id]
+    return agents or [agents_by_id[agent_id] for agent_id in SIMULATOR_DEFAULT_AGENTS]
+
+def publish_simulator_event(job, event, final=False):
+    """Append an event to a job's log and wake any streaming readers"""
+    with job['condition']:
+        event['sequence'] = len(job['events'])
+        job['events'].append(event)
+        job['finished'] = job['finished'] or final
+        job['condition'].notify_all()
+
+def evict_simulator_jobs(finished_session_id=None):
+    """Record a finished job, then drop finished jobs past their TTL or over the cap"""
+    now = time.monotonic()
+    with simulator_jobs_lock:
+        if finished_session_id is not None:
+            finished_simulator_jobs[finished_session_id] = now
+        while finished_simulator_jobs:
+            session_id, finished_at = next(iter(finished_simulator_jobs.items()))
+            expired = now - finished_at > SIMULATOR_JOB_TTL_SECONDS
+            if not expired and len(finished_simulator_jobs) <= SIMULATOR_MAX_FINISHED_JOBS:
+                break
+            del finished_simulator_jobs[session_id]
+            simulator_jobs.pop(session_id, None)
+
+def public_round(round_result):
+    """A round as exposed to clients (without the full message sent upstream)"""
+    return {key: value for key, value in round_result.items() if key != 'ai_message'}
+
+def save_simulator_round(job, round_result):
+    """Persist one round and the session's progress"""
+    with learning_store.connect(job['user_id']) as conn:
+        cursor = conn.cursor()
+        
         cursor.execute('''
-            INSERT INTO session_learning 
-            (session_id, user_id, interaction_data, learning_insights)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, user_id, json.dumps(session_data), json.dumps({})))
+            INSERT INTO session_rounds 
+            (session_id, user_id, round_number, agent_id, ai_message, ai_response, human_response, decision, confidence)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            job['session_id'], job['user_id'], round_result['round'], round_result['agent_id'],
+            round_result['ai_message'], round_result['ai_response'], round_result['human_response'],
+            round_result['decision'], round_result['confidence']
+        ))
+        save_simulator_progress(cursor, job)
         
         conn.commit()
-        conn.close()
+
+def save_simulator_progress(cursor, job):
+    """Write the job's status and current round into its session_learning row"""
+    session_data = dict(job['session_data'], status=job['status'], current_round=job['current_round'])
+    cursor.execute('''
+        UPDATE session_learning SET interaction_data = ? WHERE session_id = ?
+    ''', (json.dumps(session_data), job['session_id']))
+
+def simulator_worker(job):
+    """Play every round of a simulator session"""
+    session_data = job['session_data']
+    prompt = session_data['prompt']
+    message = prompt
+    
+    try:
+        for round_number in range(1, job['rounds_total'] + 1):
+            if job['status'] == 'stopped':
+                break
+            
+            agent = job['agents'][(round_number - 1) % len(job['agents'])]
+            job['current_round'] = round_number
+            
+            ai_response = call_openrouter_api(agent, message)
+            reply = simulate_reply(job['user_id'], job['context'], ai_response)
+            
+            round_result = {
+                'round': round_number,
+                'agent_id': agent['id'],
+                'agent_name': agent['name'],
+                'ai_message': message,
+                'ai_response': ai_response,
+                'human_response': reply['human_response'],
+                'decision': reply['decision'],
+                'confidence': reply['confidence'],
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            save_simulator_round(job, round_result)
+            job['rounds'].append(round_result)
+            publish_simulator_event(job, dict(public_round(round_result), type='round'))
+            
+            # Next agent sees the prompt, the latest answer and the clone's reaction
+            message = (
+                f"ORIGINAL PROMPT: {prompt}\n\nPREVIOUS RESPONSE: {ai_response}\n\n"
+                f"HUMAN FEEDBACK: {reply['human_response']}\n\nContinue, taking the feedback into account:"
+            )
+        
+        if job['status'] != 'stopped':
+            job['status'] = 'completed'
+    except Exception as e:
+        job['status'] = 'error'
+        job['error'] = str(e)
+    
+    job['completed_at'] = datetime.utcnow().isoformat()
+    try:
+        with learning_store.connect(job['user_id']) as conn:
+            save_simulator_progress(conn.cursor(), job)
+            conn.commit()
+    finally:
+        publish_simulator_event(job, {
+            'type': 'session_' + job['status'],
+            'session_id': job['session_id'],
+            'rounds_completed': len(job['rounds']),
+            'error': job.get('error')
+        }, final=True)
+        evict_simulator_jobs(job['session_id'])
+
+def start_simulator_job(session_id, user_id, session_data, context='general', agent_ids=None):
+    """Run a session's rounds in a background thread and return the job"""
+    rounds = max(1, min(int(session_data.get('rounds') or 1), SIMULATOR_MAX_ROUNDS))
+    job = {
+        'session_id': session_id,
+        'user_id': user_id,
+        'session_data': session_data,
+        'context': context,
+        'agents': resolve_simulator_agents(agent_ids),
+        'rounds_total': rounds,
+        'current_round': 0,
+        'status': 'running',
+        'rounds': [],
+        'events': [],
+        'condition': threading.Condition(),
+        'finished': False,
+        'created_at': datetime.utcnow().isoformat(),
+        'completed_at': None
+    }
+    evict_simulator_jobs()
+    simulator_jobs[session_id] = job
+    publish_simulator_event(job, {'type': 'session_started', 'session_id': session_id, 'rounds': rounds})
+    
+    worker_thread = threading.Thread(target=simulator_worker, args=(job,))
+    worker_thread.daemon = True
+    worker_thread.start()
+    return job
+
+def iter_simulator_events(job, after=0, sse=False):
+    """Stream a job's events from `after` until the session finishes"""
+    position = after
+    while True:
+        with job['condition']:
+            if position >= len(job['events']) and not job['finished']:
+                job['condition'].wait(SIMULATOR_EVENT_WAIT)
+            events = job['events'][position:]
+            finished = job['finished']
         
+        if not events and not finished:
+            # Keep-alive so proxies don't close an idle stream
+            yield ': keep-alive\n\n' if sse else '\n'
+            continue
+        
+        for event in events:
+            payload = json.dumps(event)
+            yield f"id: {event['sequence']}\ndata: {payload}\n\n" if sse else payload + '\n'
+        position += len(events)
+        
+        if finished:
+            break
+
+def simulator_event_response(job, after=0):
+    """NDJSON event stream, or Server-Sent Events when the client asks for them"""
+    sse = 'text/event-stream' in request.headers.get('Accept', '') or request.args.get('format') == 'sse'
+    response = Response(
+        stream_with_context(iter_simulator_events(job, after, sse)),
+        mimetype='text/event-stream' if sse else 'application/x-ndjson'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@human_simulator_bp.route('/run-session', methods=['POST'])
+def run_human_simulator_session():
+    """Start a session and play all its rounds server-side, streaming progress in this response"""
+    try:
+        data = request.get_json()
+        prompt = data.get('prompt', '')
+        strategy = data.get('strategy', 'balanced')
+        rounds = data.get('rounds', 5)
+        user_id = data.get('user_id', 'default_user')
+        
+        if not prompt:
+            return jsonify({'status': 'error', 'message': 'Prompt is required'}), 400
+        
+        session_id, session_data = create_simulator_session(user_id, prompt, strategy, rounds)
+        job = start_simulator_job(session_id, user_id, session_data, data.get('context', 'general'), data.get('agent_ids'))
+        
+        # The job keeps running if the client disconnects; it can re-attach via /session-events
+        return simulator_event_response(job)
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@human_simulator_bp.route('/session-events/<session_id>', methods=['GET'])
+def get_simulator_session_events(session_id):
+    """Stream a running (or finished) simulator session's events from ?after=<sequence>"""
+    try:
+        job = simulator_jobs.get(session_id)
+        if job is None:
+            return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        
+        after = int(request.args.get('after', request.headers.get('Last-Event-ID', -1))) + 1
+        return simulator_event_response(job, max(after, 0))
+        
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'after must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@human_simulator_bp.route('/session-progress/<session_id>', methods=['GET'])
+def get_simulator_session_progress(session_id):
+    """Snapshot of a simulator session's rounds (from memory, or the store after a restart)"""
+    try:
+        job = simulator_jobs.get(session_id)
+        if job is not None:
+            return jsonify({
+                'status': 'success',
+                'session_id': session_id,
+                'session_status': job['status'],
+                'current_round': job['current_round'],
+                'total_rounds': job['rounds_total'],
+                'rounds': [public_round(round_result) for round_result in job['rounds']],
+                'created_at': job['created_at'],
+                'completed_at': job['completed_at']
+            })
+        
+        # Only the session id is known here, so look on every shard
+        def find_session(conn, shard):
+            cursor = conn.cursor()
+            cursor.execute('SELECT interaction_data FROM session_learning WHERE session_id = ?', (session_id,))
+            session_row = cursor.fetchone()
+            if session_row is None:
+                return None
+            cursor.execute('''
+                SELECT round_number, agent_id, ai_response, human_response, decision, confidence, created_at
+                FROM session_rounds
+                WHERE session_id = ?
+                ORDER BY round_number
+            ''', (session_id,))
+            return session_row, cursor.fetchall()
+        
+        found = [result for result in learning_store.map_shards(find_session) if result is not None]
+        if not found:
+            return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        
+        session_row, round_rows = found[0]
+        session_data = json.loads(session_row[0])
         return jsonify({
             'status': 'success',
             'session_id': session_id,
-            'message': 'Human Simulator session started with learning enabled',
-            'learning_active': True,
-            'user_patterns_loaded': True
+            'session_status': session_data.get('status'),
+            'current_round': session_data.get('current_round', 0),
+            'total_rounds': session_data.get('rounds'),
+            'rounds': [
+                {
+                    'round': row[0], 'agent_id': row[1], 'ai_response': row[2], 'human_response': row[3],
+                    'decision': row[4], 'confidence': row[5], 'timestamp': row[6]
+                }
+                for row in round_rows
+            ]
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@human_simulator_bp.route('/stop-session/<session_id>', methods=['POST'])
+def stop_simulator_session(session_id):
+    """Stop a running simulator session after its current round"""
+    try:
+        job = simulator_jobs.get(session_id)
+        if job is None:
+            return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        
+        if job['status'] == 'running':
+            job['status'] = 'stopped'
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Session stopped',
+            'session_id': session_id
         })
         
     except Exception as e:
@@ -153,36 +544,33 @@ def get_characteristic_phrase():
         context = data.get('context', 'general')
         user_id = data.get('user_id', 'default_user')
         
-        conn = sqlite3.connect('human_simulator_learning.db')
-        cursor = conn.cursor()
-        
-        # Get phrases for this context, ordered by effectiveness
-        cursor.execute('''
-            SELECT phrase, effectiveness_score, usage_frequency
-            FROM characteristic_phrases
-            WHERE user_id = ? AND (context = ? OR context = 'general_collaboration')
-            ORDER BY effectiveness_score DESC, usage_frequency DESC
-            LIMIT 5
-        ''', (user_id, context))
-        
-        phrases = cursor.fetchall()
-        conn.close()
+        with learning_store.connect(user_id) as conn:
+            cursor = conn.cursor()
+            
+            # Get phrases for this context, ordered by effectiveness
+            cursor.execute('''
+                SELECT phrase, effectiveness_score, usage_frequency
+                FROM characteristic_phrases
+                WHERE user_id = ? AND (context = ? OR context = 'general_collaboration')
+                ORDER BY effectiveness_score DESC, usage_frequency DESC
+                LIMIT 5
+            ''', (user_id, context))
+            
+            phrases = cursor.fetchall()
+            
+            if phrases:
+                # Update usage frequency of the best phrase
+                cursor.execute('''
+                    UPDATE characteristic_phrases 
+                    SET usage_frequency = usage_frequency + 1
+                    WHERE user_id = ? AND phrase = ?
+                ''', (user_id, phrases[0][0]))
+                conn.commit()
         
         if phrases:
-            # Select best phrase and update usage
+            # Select best phrase
             selected_phrase = phrases[0][0]
             
-            # Update usage frequency
-            conn = sqlite3.connect('human_simulator_learning.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE characteristic_phrases 
-                SET usage_frequency = usage_frequency + 1
-                WHERE user_id = ? AND phrase = ?
-            ''', (user_id, selected_phrase))
-            conn.commit()
-            conn.close()
-            
             return jsonify({
                 'status': 'success',
                 'phrase': selected_phrase,
@@ -200,105 +588,543 @@ def get_characteristic_phrase():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# Learning writes
+INSERT_PATTERN_SQL = '''
+    INSERT INTO user_patterns 
+    (user_id, pattern_type, pattern_data, confidence_score)
+    VALUES (?, ?, ?, ?)
+'''
+
+INSERT_PHRASE_SQL = '''
+    INSERT OR IGNORE INTO characteristic_phrases 
+    (user_id, phrase, context, effectiveness_score)
+    VALUES (?, ?, ?, ?)
+'''
+
+INGEST_CHUNK_SIZE = int(os.getenv('HUMAN_SIMULATOR_INGEST_CHUNK_SIZE', '1000'))
+GROUP_COMMIT_ENABLED = os.getenv('HUMAN_SIMULATOR_GROUP_COMMIT', 'true').lower() == 'true'
+GROUP_COMMIT_MAX_BATCH = int(os.getenv('HUMAN_SIMULATOR_GROUP_COMMIT_MAX_BATCH', '500'))
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('HUMAN_SIMULATOR_GROUP_COMMIT_WINDOW_MS', '2'))
+GROUP_COMMIT_TIMEOUT = 30
+
+def build_learning_rows(user_id, interaction):
+    """Turn one interaction into its user_patterns row and optional phrase row"""
+    interaction_type = interaction.get('interaction_type')
+    user_response = interaction.get('user_response')
+    ai_response = interaction.get('ai_response')
+    effectiveness = interaction.get('effectiveness', 0.5)  # 0-1 scale
+    
+    pattern_data = {
+        'interaction_type': interaction_type,
+        'user_response': user_response,
+        'ai_response': ai_response,
+        'effectiveness': effectiveness,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    pattern_row = (user_id, interaction_type, json.dumps(pattern_data), effectiveness)
+    
+    # If user response contains a new phrase, add it
+    phrase_row = None
+    if isinstance(user_response, str) and len(user_response) < 200:  # Likely a phrase, not a long response
+        phrase_row = (user_id, user_response, interaction_type, effectiveness)
+    
+    return pattern_row, phrase_row
+
+def write_learning_rows(conn, pattern_rows, phrase_rows):
+    """Insert pattern and phrase rows in one transaction"""
+    cursor = conn.cursor()
+    cursor.executemany(INSERT_PATTERN_SQL, pattern_rows)
+    if phrase_rows:
+        cursor.executemany(INSERT_PHRASE_SQL, phrase_rows)
+    conn.commit()
+    
+    index_learning_rows(pattern_rows, phrase_rows)
+    start_compaction_job()
+
+# Background compaction of old raw patterns into aggregates
+_compaction_thread = None
+_compaction_lock = threading.Lock()
+
+def run_pattern_compaction(retention_days=None, size_budget_bytes=None):
+    """Run one compaction pass over every learning shard; returns summed stats"""
+    # The size budget applies to each shard file on its own
+    def compact(conn, shard):
+        return pattern_compaction.compact_patterns(conn, retention_days, size_budget_bytes)
+    
+    with _compaction_lock:
+        shard_results = learning_store.map_shards(compact)
+    
+    stats = {}
+    for shard_stats in shard_results:
+        for key, value in shard_stats.items():
+            stats[key] = stats.get(key, 0) + value
+    stats['shards'] = shard_results
+    return stats
+
+def _compaction_worker():
+    """Compact patterns every PATTERN_COMPACTION_INTERVAL seconds"""
+    while True:
+        try:
+            stats = run_pattern_compaction()
+            if stats['retention_folded'] or stats['budget_folded']:
+                print(f"Pattern compaction: {stats}")
+        except Exception as e:
+            print(f"Pattern compaction failed: {e}")
+        time.sleep(pattern_compaction.COMPACTION_INTERVAL)
+
+def start_compaction_job():
+    """Start the background compaction thread once (disabled when the interval is 0)"""
+    global _compaction_thread
+    
+    if _compaction_thread is not None or pattern_compaction.COMPACTION_INTERVAL <= 0:
+        return
+    with _thread_start_lock:
+        if _compaction_thread is None:
+            _compaction_thread = threading.Thread(target=_compaction_worker, daemon=True)
+            _compaction_thread.start()
+
+# Similarity retrieval over each user's phrases and patterns
+SIMILARITY_PATTERN_LIMIT = int(os.getenv('SIMILARITY_PATTERN_LIMIT', '20000'))
+SIMILARITY_MIN_SCORE = float(os.getenv('SIMILARITY_MIN_SCORE', '0.15'))
+
+def load_similarity_documents(user_id):
+    """Load a user's phrases and most recent patterns for indexing"""
+    with learning_store.connect(user_id) as conn:
+        return _load_similarity_documents(conn.cursor(), user_id)
+
+def _load_similarity_documents(cursor, user_id):
+    """Query a user's phrases, recent patterns and compacted exemplars"""
+    cursor.execute('''
+        SELECT phrase, context, effectiveness_score
+        FROM characteristic_phrases
+        WHERE user_id = ?
+    ''', (user_id,))
+    phrases = [
+        {'phrase': phrase, 'context': context, 'effectiveness_score': effectiveness}
+        for phrase, context, effectiveness in cursor.fetchall()
+        if phrase
+    ]
+    
+    cursor.execute('''
+        SELECT pattern_data, confidence_score
+        FROM user_patterns
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (user_id, SIMILARITY_PATTERN_LIMIT))
+    patterns = [pattern_document(pattern_data, confidence) for pattern_data, confidence in cursor.fetchall()]
+    
+    # Compacted history stays retrievable through its exemplars
+    cursor.execute('''
+        SELECT pattern_type, exemplars
+        FROM user_pattern_aggregates
+        WHERE user_id = ?
+    ''', (user_id,))
+    for pattern_type, exemplars in cursor.fetchall():
+        for exemplar in json.loads(exemplars or '[]'):
+            patterns.append({
+                'interaction_type': pattern_type or None,
+                'user_response': exemplar.get('user_response'),
+                'ai_response': exemplar.get('ai_response'),
+                'confidence_score': exemplar.get('confidence')
+            })
+    
+    return phrases, patterns
+
+def pattern_document(pattern_data, confidence):
+    """Build the index payload for a stored pattern row"""
+    try:
+        pattern = json.loads(pattern_data)
+    except (TypeError, ValueError):
+        pattern = {}
+    return {
+        'interaction_type': pattern.get('interaction_type'),
+        'user_response': pattern.get('user_response'),
+        'ai_response': pattern.get('ai_response'),
+        'confidence_score': confidence
+    }
+
+similarity_indexes = UserIndexes(load_similarity_documents)
+
+def index_learning_rows(pattern_rows, phrase_rows):
+    """Add freshly stored rows to any user index already in memory"""
+    for user_id, phrase, context, effectiveness in phrase_rows:
+        indexes = similarity_indexes.loaded(user_id)
+        if indexes:
+            add_phrase(indexes[0], {'phrase': phrase, 'context': context, 'effectiveness_score': effectiveness})
+    
+    for user_id, _, pattern_data, confidence in pattern_rows:
+        indexes = similarity_indexes.loaded(user_id)
+        if indexes:
+            add_pattern(indexes[1], pattern_document(pattern_data, confidence))
+
+# Group commit: single-item writers queue their rows and one writer thread
+# per shard commits everything that arrived while the previous commit was syncing
+_write_queues = {}
+_thread_start_lock = threading.Lock()
+
+def _group_commit_writer(shard, write_queue):
+    """Drain one shard's queued learning writes and commit them in batches"""
+    while True:
+        batch = [write_queue.get()]
+        deadline = time.monotonic() + GROUP_COMMIT_WINDOW_MS / 1000
+        while len(batch) < GROUP_COMMIT_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(write_queue.get(timeout=remaining))
+                else:
+                    batch.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        pattern_rows = [entry['pattern_row'] for entry in batch]
+        phrase_rows = [entry['phrase_row'] for entry in batch if entry['phrase_row']]
+        
+        try:
+            with learning_store.connect_shard(shard) as conn:
+                write_learning_rows(conn, pattern_rows, phrase_rows)
+        except Exception as e:
+            for entry in batch:
+                entry['error'] = e
+        
+        for entry in batch:
+            entry['done'].set()
+
+def submit_learning_rows(pattern_row, phrase_row):
+    """Queue one interaction for the next group commit and wait until it is durable"""
+    shard = learning_store.shard_for(pattern_row[0])
+    write_queue = _write_queues.get(shard)
+    if write_queue is None:
+        with _thread_start_lock:
+            write_queue = _write_queues.get(shard)
+            if write_queue is None:
+                write_queue = queue.Queue()
+                threading.Thread(target=_group_commit_writer, args=(shard, write_queue), daemon=True).start()
+                _write_queues[shard] = write_queue
+    
+    entry = {
+        'pattern_row': pattern_row,
+        'phrase_row': phrase_row,
+        'done': threading.Event(),
+        'error': None
+    }
+    write_queue.put(entry)
+    
+    if not entry['done'].wait(GROUP_COMMIT_TIMEOUT):
+        raise TimeoutError('Timed out waiting for learning write to commit')
+    if entry['error'] is not None:
+        raise entry['error']
+
 @human_simulator_bp.route('/learn-from-interaction', methods=['POST'])
 def learn_from_interaction():
     """Learn from user interaction patterns"""
     try:
         data = request.get_json()
         user_id = data.get('user_id', 'default_user')
-        interaction_type = data.get('interaction_type')
-        user_response = data.get('user_response')
-        ai_response = data.get('ai_response')
-        effectiveness = data.get('effectiveness', 0.5)  # 0-1 scale
         
-        conn = sqlite3.connect('human_simulator_learning.db')
-        cursor = conn.cursor()
+        pattern_row, phrase_row = build_learning_rows(user_id, data)
         
-        # Store learning pattern
-        pattern_data = {
-            'interaction_type': interaction_type,
-            'user_response': user_response,
-            'ai_response': ai_response,
-            'effectiveness': effectiveness,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        if GROUP_COMMIT_ENABLED:
+            submit_learning_rows(pattern_row, phrase_row)
+        else:
+            with learning_store.connect(user_id) as conn:
+                write_learning_rows(conn, [pattern_row], [phrase_row] if phrase_row else [])
         
-        cursor.execute('''
-            INSERT INTO user_patterns 
-            (user_id, pattern_type, pattern_data, confidence_score)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, interaction_type, json.dumps(pattern_data), effectiveness))
+        return jsonify({
+            'status': 'success',
+            'message': 'Learning pattern stored',
+            'learning_improved': True
+        })
         
-        # If user response contains a new phrase, add it
-        if len(user_response) < 200:  # Likely a phrase, not a long response
-            cursor.execute('''
-                INSERT OR IGNORE INTO characteristic_phrases 
-                (user_id, phrase, context, effectiveness_score)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, user_response, interaction_type, effectiveness))
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+class NDJSONLineError(ValueError):
+    """A request body line that isn't valid JSON (line_number counts from 1)"""
+    
+    def __init__(self, line_number, error):
+        super().__init__(f'line {line_number}: {error}')
+        self.line_number = line_number
+
+def iter_ndjson_body(stream):
+    """Yield one decoded JSON value per non-blank line of a request body"""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise NDJSONLineError(line_number, e) from e
+
+@human_simulator_bp.route('/learn-from-interactions', methods=['POST'])
+def learn_from_interactions():
+    """Bulk-learn from many interactions (JSON array, {"interactions": [...]} or NDJSON)"""
+    try:
+        default_user_id = request.args.get('user_id', 'default_user')
         
-        conn.commit()
-        conn.close()
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            interactions = iter_ndjson_body(request.stream)
+        else:
+            data = request.get_json()
+            if isinstance(data, dict):
+                default_user_id = data.get('user_id', default_user_id)
+                data = data.get('interactions')
+            if not isinstance(data, list):
+                return jsonify({'status': 'error', 'message': 'Expected a list of interactions'}), 400
+            interactions = data
+        
+        ingested = 0
+        chunks = 0
+        rejected = []
+        # Rows are buffered per shard: shard -> (pattern_rows, phrase_rows)
+        pending = {}
+        
+        def flush(shard):
+            pattern_rows, phrase_rows = pending.pop(shard)
+            with learning_store.connect_shard(shard) as conn:
+                write_learning_rows(conn, pattern_rows, phrase_rows)
+            return len(pattern_rows)
+        
+        error = None
+        try:
+            for index, interaction in enumerate(interactions):
+                if not isinstance(interaction, dict):
+                    rejected.append(index)
+                    continue
+                
+                user_id = interaction.get('user_id', default_user_id)
+                pattern_row, phrase_row = build_learning_rows(user_id, interaction)
+                shard = learning_store.shard_for(user_id)
+                pattern_rows, phrase_rows = pending.setdefault(shard, ([], []))
+                pattern_rows.append(pattern_row)
+                if phrase_row:
+                    phrase_rows.append(phrase_row)
+                
+                # One transaction per chunk keeps each write lock short
+                if len(pattern_rows) >= INGEST_CHUNK_SIZE:
+                    ingested += flush(shard)
+                    chunks += 1
+        except NDJSONLineError as e:
+            # Earlier chunks are already committed: store everything before the
+            # bad line too, so the client can resume right after it
+            error = e
+        
+        for shard in list(pending):
+            ingested += flush(shard)
+            chunks += 1
+        
+        if error is not None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid NDJSON at {str(error)}; the lines before it were stored',
+                'error_line': error.line_number,
+                'ingested': ingested,
+                'chunks': chunks,
+                'rejected': rejected[:100],
+                'rejected_count': len(rejected)
+            }), 400
         
         return jsonify({
             'status': 'success',
-            'message': 'Learning pattern stored',
-            'learning_improved': True
+            'message': 'Learning patterns stored',
+            'ingested': ingested,
+            'chunks': chunks,
+            'rejected': rejected[:100],
+            'rejected_count': len(rejected),
+            'learning_improved': ingested > 0
         })
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def load_learning_counts(cursor, user_id):
+    """A user's pattern (raw plus compacted), phrase and session counts"""
+    # Count learning patterns
+    cursor.execute('''
+        SELECT COUNT(*) FROM user_patterns WHERE user_id = ?
+    ''', (user_id,))
+    pattern_count = cursor.fetchone()[0]
+    
+    # Plus patterns already folded into aggregates
+    cursor.execute('''
+        SELECT COALESCE(SUM(pattern_count), 0) FROM user_pattern_aggregates WHERE user_id = ?
+    ''', (user_id,))
+    pattern_count += cursor.fetchone()[0]
+    
+    # Count characteristic phrases
+    cursor.execute('''
+        SELECT COUNT(*) FROM characteristic_phrases WHERE user_id = ?
+    ''', (user_id,))
+    phrase_count = cursor.fetchone()[0]
+    
+    # Count sessions
+    cursor.execute('''
+        SELECT COUNT(*) FROM session_learning WHERE user_id = ?
+    ''', (user_id,))
+    session_count = cursor.fetchone()[0]
+    
+    return {'patterns': pattern_count, 'phrases': phrase_count, 'sessions': session_count}
+
+def clone_confidence(learning_stats):
+    """Clone confidence (0-100%) from learning counts"""
+    base_confidence = min(learning_stats['phrases'] * 2, 40)  # Up to 40% from phrases
+    pattern_confidence = min(learning_stats['patterns'] * 3, 40)  # Up to 40% from patterns
+    session_confidence = min(learning_stats['sessions'] * 2, 20)  # Up to 20% from sessions
+    
+    total_confidence = base_confidence + pattern_confidence + session_confidence
+    
+    return {
+        'clone_confidence': min(total_confidence, 100),
+        'learning_stats': dict(learning_stats),
+        'clone_ready': total_confidence >= 60
+    }
+
 @human_simulator_bp.route('/get-clone-confidence', methods=['GET'])
 def get_clone_confidence():
     """Get confidence level of user clone"""
     try:
         user_id = request.args.get('user_id', 'default_user')
         
-        conn = sqlite3.connect('human_simulator_learning.db')
-        cursor = conn.cursor()
+        with learning_store.connect(user_id) as conn:
+            learning_stats = load_learning_counts(conn.cursor(), user_id)
         
-        # Count learning patterns
-        cursor.execute('''
-            SELECT COUNT(*) FROM user_patterns WHERE user_id = ?
-        ''', (user_id,))
-        pattern_count = cursor.fetchone()[0]
-        
-        # Count characteristic phrases
-        cursor.execute('''
-            SELECT COUNT(*) FROM characteristic_phrases WHERE user_id = ?
-        ''', (user_id,))
-        phrase_count = cursor.fetchone()[0]
+        return jsonify({'status': 'success', **clone_confidence(learning_stats)})
         
-        # Count sessions
-        cursor.execute('''
-            SELECT COUNT(*) FROM session_learning WHERE user_id = ?
-        ''', (user_id,))
-        session_count = cursor.fetchone()[0]
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@human_simulator_bp.route('/compact-patterns', methods=['POST'])
+def compact_patterns():
+    """Fold old raw patterns into aggregates now (same pass the background job runs)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        retention_days = data.get('retention_days')
+        size_budget_mb = data.get('size_budget_mb')
         
-        conn.close()
+        stats = run_pattern_compaction(
+            retention_days=float(retention_days) if retention_days is not None else None,
+            size_budget_bytes=int(float(size_budget_mb) * 1024 * 1024) if size_budget_mb is not None else None
+        )
         
-        # Calculate confidence (0-100%)
-        base_confidence = min(phrase_count * 2, 40)  # Up to 40% from phrases
-        pattern_confidence = min(pattern_count * 3, 40)  # Up to 40% from patterns
-        session_confidence = min(session_count * 2, 20)  # Up to 20% from sessions
+        return jsonify({
+            'status': 'success',
+            'compaction': stats
+        })
         
-        total_confidence = base_confidence + pattern_confidence + session_confidence
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@human_simulator_bp.route('/learning-shards', methods=['GET'])
+def learning_shards():
+    """Row counts and file sizes for every learning store shard"""
+    try:
+        shards = learning_store.map_shards(learning_store.shard_stats)
         
         return jsonify({
             'status': 'success',
-            'clone_confidence': min(total_confidence, 100),
-            'learning_stats': {
-                'patterns': pattern_count,
-                'phrases': phrase_count,
-                'sessions': session_count
-            },
-            'clone_ready': total_confidence >= 60
+            'shard_count': learning_store.SHARD_COUNT,
+            'shards': shards
         })
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def simulate_reply(user_id, context, ai_response):
+    """Pick the clone's reply and decision for an AI response"""
+    # Retrieve phrases and patterns similar to what the AI just said
+    phrase_match = None
+    pattern_match = None
+    if isinstance(ai_response, str) and ai_response.strip():
+        phrase_index, pattern_index = similarity_indexes.get(user_id)
+        
+        # Rank close phrases for this context by similarity weighted by effectiveness
+        candidates = phrase_index.search(
+            ai_response, limit=20,
+            accept=lambda phrase: phrase['context'] in (context, 'general_collaboration')
+        )
+        candidates = [
+            (score * (0.5 + 0.5 * (phrase['effectiveness_score'] or 0)), score, phrase)
+            for score, phrase in candidates if score >= SIMILARITY_MIN_SCORE
+        ]
+        if candidates:
+            phrase_match = max(candidates, key=lambda candidate: candidate[0])
+        
+        pattern_matches = pattern_index.search(ai_response, limit=1)
+        if pattern_matches and pattern_matches[0][0] >= SIMILARITY_MIN_SCORE:
+            pattern_match = pattern_matches[0]
+    
+    patterns = []
+    phrase_result = None
+    if phrase_match is not None:
+        phrase_result = (phrase_match[2]['phrase'], phrase_match[2]['effectiveness_score'])
+    
+    # Fall back to the best-rated rows when nothing similar was found
+    if pattern_match is None or phrase_match is None:
+        with learning_store.connect(user_id) as conn:
+            cursor = conn.cursor()
+            # Get relevant patterns (compacted aggregate first, then recent raw rows)
+            if pattern_match is None:
+                cursor.execute('''
+                    SELECT pattern_type, decayed_confidence
+                    FROM user_pattern_aggregates
+                    WHERE user_id = ? AND pattern_type = ?
+                ''', (user_id, context or ''))
+                aggregate = cursor.fetchone()
+                if aggregate:
+                    patterns = [(json.dumps({'interaction_type': aggregate[0]}), aggregate[1])]
+                else:
+                    cursor.execute('''
+                        SELECT pattern_data, confidence_score
+                        FROM user_patterns
+                        WHERE user_id = ? AND pattern_type = ?
+                        ORDER BY confidence_score DESC, usage_count DESC
+                        LIMIT 3
+                    ''', (user_id, context))
+                    patterns = cursor.fetchall()
+            # Get characteristic phrase
+            if phrase_match is None:
+                cursor.execute('''
+                    SELECT phrase, effectiveness_score
+                    FROM characteristic_phrases
+                    WHERE user_id = ? AND (context = ? OR context = 'general_collaboration')
+                    ORDER BY effectiveness_score DESC, usage_frequency DESC
+                    LIMIT 1
+                ''', (user_id, context))
+                phrase_result = cursor.fetchone()
+    
+    # Generate human-like response
+    if phrase_result:
+        characteristic_phrase = phrase_result[0]
+    else:
+        characteristic_phrase = "That's interesting, let's continue"
+    
+    # Simulate decision making
+    decisions = [
+        "Continue with current approach",
+        "Switch to different agent",
+        "Ask for clarification",
+        "Provide additional guidance"
+    ]
+    
+    # Use learned patterns to influence decision
+    if pattern_match is not None:
+        decision_context = pattern_match[1]['interaction_type'] or 'continue'
+    elif patterns:
+        pattern_data = json.loads(patterns[0][0])
+        decision_context = pattern_data.get('interaction_type', 'continue')
+    else:
+        decision_context = 'continue'
+    
+    return {
+        'human_response': characteristic_phrase,
+        'decision': decision_context,
+        'confidence': phrase_result[1] if phrase_result else 0.5,
+        'learning_applied': pattern_match is not None or len(patterns) > 0,
+        'phrase_similarity': round(phrase_match[1], 4) if phrase_match else None,
+        'pattern_similarity': round(pattern_match[0], 4) if pattern_match else None
+    }
+
 @human_simulator_bp.route('/simulate-human-response', methods=['POST'])
 def simulate_human_response():
     """Simulate human response based on learned patterns"""
@@ -308,100 +1134,303 @@ def simulate_human_response():
         ai_response = data.get('ai_response')
         user_id = data.get('user_id', 'default_user')
         
-        conn = sqlite3.connect('human_simulator_learning.db')
-        cursor = conn.cursor()
+        reply = simulate_reply(user_id, context, ai_response)
         
-        # Get relevant patterns
-        cursor.execute('''
-            SELECT pattern_data, confidence_score
-            FROM user_patterns
-            WHERE user_id = ? AND pattern_type = ?
-            ORDER BY confidence_score DESC, usage_count DESC
-            LIMIT 3
-        ''', (user_id, context))
+        return jsonify({'status': 'success', **reply})
         
-        patterns = cursor.fetchall()
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# Interactive WebSocket channel (/api/human-simulator/ws?user_id=...)
+# One socket serves one user: their phrases and learning counts are loaded
+# when it opens and kept in memory, so a phrase lookup or a confidence
+# update is answered without touching SQLite. Learning events are still
+# committed (through the group commit) before they are acknowledged; phrase
+# usage counts are written back in batches. Frames are JSON text messages,
+# {"type": ..., "id": ...}; every reply echoes the request's id.
+# An open socket holds a server thread, so sockets close after a short idle
+# time (clients reconnect on their next frame) and only SIMULATOR_WS_MAX_SOCKETS
+# may be open per process, leaving the rest of the thread pool to HTTP traffic.
+SIMULATOR_WS_IDLE_SECONDS = float(os.getenv('HUMAN_SIMULATOR_WS_IDLE_SECONDS', '30'))
+SIMULATOR_WS_MAX_SOCKETS = max(int(os.getenv('HUMAN_SIMULATOR_WS_MAX_SOCKETS', '8')), 1)
+SIMULATOR_WS_USAGE_FLUSH_SECONDS = float(os.getenv('HUMAN_SIMULATOR_WS_USAGE_FLUSH_SECONDS', '5'))
+DEFAULT_PHRASE = "Let's continue with this approach"
+
+open_simulator_sockets = threading.BoundedSemaphore(SIMULATOR_WS_MAX_SOCKETS)
+
+class SimulatorChannel:
+    """A user's learning context for the life of one WebSocket"""
+    
+    def __init__(self, user_id):
+        self.user_id = user_id
+        with learning_store.connect(user_id) as conn:
+            cursor = conn.cursor()
+            self.learning_stats = load_learning_counts(cursor, user_id)
+            cursor.execute('''
+                SELECT phrase, context, effectiveness_score, usage_frequency
+                FROM characteristic_phrases
+                WHERE user_id = ?
+            ''', (user_id,))
+            # [phrase, context, effectiveness, usage] rows, ranked like the SQL lookup
+            self.phrases = [list(row) for row in cursor.fetchall() if row[0]]
+        self.pending_usage = {}
+        self.last_flush = time.monotonic()
+        self.handlers = {
+            'phrase': self.handle_phrase,
+            'learn': self.handle_learn,
+            'simulate': self.handle_simulate,
+            'confidence': self.handle_confidence,
+            'ping': lambda message: {}
+        }
+    
+    def handle(self, message):
+        """Reply to one decoded frame"""
+        handler = self.handlers.get(message.get('type'))
+        if handler is None:
+            return {'type': 'error', 'message': f"Unknown message type: {message.get('type')!r}"}
+        reply = handler(message)
+        reply.setdefault('type', 'pong' if message['type'] == 'ping' else message['type'])
+        return reply
+    
+    def handle_phrase(self, message):
+        context = message.get('context', 'general')
+        candidates = [row for row in self.phrases if row[1] in (context, 'general_collaboration')]
+        if not candidates:
+            return {'phrase': DEFAULT_PHRASE, 'context': context, 'learning_applied': False}
         
-        # Get characteristic phrase
-        cursor.execute('''
-            SELECT phrase, effectiveness_score
-            FROM characteristic_phrases
-            WHERE user_id = ? AND (context = ? OR context = 'general_collaboration')
-            ORDER BY effectiveness_score DESC, usage_frequency DESC
-            LIMIT 1
-        ''', (user_id, context))
-        
-        phrase_result = cursor.fetchone()
-        conn.close()
-        
-        # Generate human-like response
-        if phrase_result:
-            characteristic_phrase = phrase_result[0]
+        best = max(candidates, key=lambda row: (row[2] or 0, row[3] or 0))
+        # Same bookkeeping as the HTTP lookup: every row with this phrase gets a use
+        for row in self.phrases:
+            if row[0] == best[0]:
+                row[3] = (row[3] or 0) + 1
+        self.pending_usage[best[0]] = self.pending_usage.get(best[0], 0) + 1
+        return {'phrase': best[0], 'context': context, 'learning_applied': True}
+    
+    def handle_learn(self, message):
+        pattern_row, phrase_row = build_learning_rows(self.user_id, message)
+        if GROUP_COMMIT_ENABLED:
+            submit_learning_rows(pattern_row, phrase_row)
         else:
-            characteristic_phrase = "That's interesting, let's continue"
-        
-        # Simulate decision making
-        decisions = [
-            "Continue with current approach",
-            "Switch to different agent",
-            "Ask for clarification",
-            "Provide additional guidance"
-        ]
+            with learning_store.connect(self.user_id) as conn:
+                write_learning_rows(conn, [pattern_row], [phrase_row] if phrase_row else [])
         
-        # Use learned patterns to influence decision
-        if patterns:
-            pattern_data = json.loads(patterns[0][0])
-            decision_context = pattern_data.get('interaction_type', 'continue')
-        else:
-            decision_context = 'continue'
+        self.learning_stats['patterns'] += 1
+        if phrase_row:
+            self.learning_stats['phrases'] += 1
+            self.phrases.append([phrase_row[1], phrase_row[2], phrase_row[3], 1])
+        return {'type': 'learned', 'learning_improved': True, **clone_confidence(self.learning_stats)}
+    
+    def handle_simulate(self, message):
+        return simulate_reply(self.user_id, message.get('context'), message.get('ai_response'))
+    
+    def handle_confidence(self, message):
+        return clone_confidence(self.learning_stats)
+    
+    def flush_usage(self, force=False):
+        """Write accumulated phrase usage back (at most every SIMULATOR_WS_USAGE_FLUSH_SECONDS)"""
+        if not self.pending_usage or (not force and time.monotonic() - self.last_flush < SIMULATOR_WS_USAGE_FLUSH_SECONDS):
+            return
+        usage, self.pending_usage = self.pending_usage, {}
+        self.last_flush = time.monotonic()
+        with learning_store.connect(self.user_id) as conn:
+            conn.executemany('''
+                UPDATE characteristic_phrases
+                SET usage_frequency = usage_frequency + ?
+                WHERE user_id = ? AND phrase = ?
+            ''', [(count, self.user_id, phrase) for phrase, count in usage.items()])
+            conn.commit()
+
+def serve_simulator_channel(ws, user_id):
+    """Answer frames on an open socket until the client leaves or goes idle"""
+    if not open_simulator_sockets.acquire(blocking=False):
+        ws.send(json.dumps({
+            'type': 'error',
+            'message': 'Too many open simulator channels, retry later',
+            'retry_after': SIMULATOR_WS_IDLE_SECONDS
+        }))
+        return
+    try:
+        channel = SimulatorChannel(user_id)
+        ws.send(json.dumps({'type': 'ready', 'user_id': user_id, **clone_confidence(channel.learning_stats)}))
+        try:
+            while True:
+                data = ws.receive(timeout=SIMULATOR_WS_IDLE_SECONDS)
+                if data is None:
+                    break
+                
+                message_id = None
+                try:
+                    message = json.loads(data)
+                    if not isinstance(message, dict):
+                        raise ValueError('Expected a JSON object')
+                    message_id = message.get('id')
+                    reply = channel.handle(message)
+                except ValueError as e:
+                    reply = {'type': 'error', 'message': f'Invalid message: {str(e)}'}
+                except Exception as e:
+                    reply = {'type': 'error', 'message': str(e)}
+                
+                if message_id is not None:
+                    reply['id'] = message_id
+                ws.send(json.dumps(reply))
+                channel.flush_usage()
+        finally:
+            try:
+                channel.flush_usage(force=True)
+            except Exception as e:
+                print(f"Simulator channel usage flush failed for {user_id}: {e}")
+    finally:
+        open_simulator_sockets.release()
+
+if Sock is not None:
+    sock = Sock()
+    
+    @sock.route('/ws', bp=human_simulator_bp)
+    def human_simulator_socket(ws):
+        """Persistent simulator channel (phrase, learn, simulate, confidence and ping frames)"""
+        serve_simulator_channel(ws, request.args.get('user_id', 'default_user'))
+
+# Clone export streaming (rows are read in fixed-size chunks so memory stays flat)
+EXPORT_CHUNK_SIZE = int(os.getenv('HUMAN_SIMULATOR_EXPORT_CHUNK_SIZE', '500'))
+CLONE_VERSION = '1.0'
+
+# (section name in the export, source table) in export order
+EXPORT_TABLES = [
+    ('patterns', 'user_patterns'),
+    ('phrases', 'characteristic_phrases'),
+    ('sessions', 'session_learning'),
+    ('pattern_aggregates', 'user_pattern_aggregates'),
+    ('session_rounds', 'session_rounds')
+]
+
+def iter_table_rows(conn, table, user_id, offset=0):
+    """Yield a user's rows from one table as dicts, fetched chunk by chunk"""
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT * FROM {table}
+        WHERE user_id = ?
+        ORDER BY rowid
+        LIMIT -1 OFFSET ?
+    ''', (user_id, offset))
+    
+    # Column names come from this cursor, so every table is keyed correctly
+    columns = [col[0] for col in cursor.description]
+    
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(columns, row))
+
+def iter_export_records(conn, user_id, offset=0):
+    """Yield (section, row) for every exported row, skipping the first `offset` rows"""
+    for section, table in EXPORT_TABLES:
+        if offset:
+            # Skip whole tables without reading them
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE user_id = ?', (user_id,))
+            table_count = cursor.fetchone()[0]
+            if offset >= table_count:
+                offset -= table_count
+                continue
         
-        return jsonify({
-            'status': 'success',
-            'human_response': characteristic_phrase,
-            'decision': decision_context,
-            'confidence': phrase_result[1] if phrase_result else 0.5,
-            'learning_applied': len(patterns) > 0
-        })
+        for row in iter_table_rows(conn, table, user_id, offset):
+            yield section, row
+        offset = 0
+
+def iter_ndjson_export(user_id, offset=0):
+    """Stream a clone export as NDJSON: header line, one line per row, end line"""
+    with learning_store.connect(user_id) as conn:
+        yield json.dumps({
+            'type': 'header',
+            'user_id': user_id,
+            'export_timestamp': datetime.utcnow().isoformat(),
+            'clone_version': CLONE_VERSION,
+            'offset': offset
+        }) + '\n'
         
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        position = offset
+        buffer = []
+        for section, row in iter_export_records(conn, user_id, offset):
+            buffer.append(json_provider.dumps({'type': section, 'offset': position, 'data': row}))
+            position += 1
+            if len(buffer) >= EXPORT_CHUNK_SIZE:
+                yield '\n'.join(buffer) + '\n'
+                buffer = []
+        
+        if buffer:
+            yield '\n'.join(buffer) + '\n'
+        
+        # Clients resume an interrupted download with ?offset=<next_offset>
+        yield json.dumps({'type': 'end', 'next_offset': position, 'complete': True}) + '\n'
+
+def iter_json_export(user_id):
+    """Stream a clone export as one JSON document in the legacy response shape"""
+    with learning_store.connect(user_id) as conn:
+        yield '{"status": "success", "exportable": true, "clone_data": {'
+        yield '"user_id": %s, "export_timestamp": %s, "clone_version": %s' % (
+            json.dumps(user_id),
+            json.dumps(datetime.utcnow().isoformat()),
+            json.dumps(CLONE_VERSION)
+        )
+        
+        for section, table in EXPORT_TABLES:
+            yield ', "%s": [' % section
+            buffer = []
+            first = True
+            for row in iter_table_rows(conn, table, user_id):
+                buffer.append(json_provider.dumps(row))
+                if len(buffer) >= EXPORT_CHUNK_SIZE:
+                    yield ('' if first else ', ') + ', '.join(buffer)
+                    buffer = []
+                    first = False
+            if buffer:
+                yield ('' if first else ', ') + ', '.join(buffer)
+            yield ']'
+        
+        yield '}}'
+
+def gzip_stream(chunks):
+    """Gzip-compress a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
 
 @human_simulator_bp.route('/export-clone', methods=['GET'])
 def export_clone():
-    """Export user clone for premium customers"""
+    """Export user clone for premium customers (streamed as JSON or NDJSON)"""
     try:
         user_id = request.args.get('user_id', 'default_user')
+        export_format = request.args.get('format', 'json')
+        offset = int(request.args.get('offset', 0))
+        use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
         
-        conn = sqlite3.connect('human_simulator_learning.db')
-        cursor = conn.cursor()
-        
-        # Get all user data
-        cursor.execute('SELECT * FROM user_patterns WHERE user_id = ?', (user_id,))
-        patterns = cursor.fetchall()
+        if export_format not in ('json', 'ndjson'):
+            return jsonify({'status': 'error', 'message': 'format must be json or ndjson'}), 400
         
-        cursor.execute('SELECT * FROM characteristic_phrases WHERE user_id = ?', (user_id,))
-        phrases = cursor.fetchall()
+        if offset < 0 or (offset and export_format != 'ndjson'):
+            return jsonify({'status': 'error', 'message': 'offset requires format=ndjson and must be >= 0'}), 400
         
-        cursor.execute('SELECT * FROM session_learning WHERE user_id = ?', (user_id,))
-        sessions = cursor.fetchall()
+        if export_format == 'ndjson':
+            chunks = iter_ndjson_export(user_id, offset)
+            mimetype = 'application/x-ndjson'
+        else:
+            chunks = iter_json_export(user_id)
+            mimetype = 'application/json'
         
-        conn.close()
+        if use_gzip:
+            chunks = gzip_stream(chunks)
         
-        clone_data = {
-            'user_id': user_id,
-            'export_timestamp': datetime.utcnow().isoformat(),
-            'patterns': [dict(zip([col[0] for col in cursor.description], row)) for row in patterns],
-            'phrases': [dict(zip([col[0] for col in cursor.description], row)) for row in phrases],
-            'sessions': [dict(zip([col[0] for col in cursor.description], row)) for row in sessions],
-            'clone_version': '1.0'
-        }
-        
-        return jsonify({
-            'status': 'success',
-            'clone_data': clone_data,
-            'exportable': True
-        })
+        response = Response(stream_with_context(chunks), mimetype=mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
         
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'offset must be an integer'}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
-
@@ -1,8 +1,15 @@
 from flask import Blueprint, request, jsonify
 import stripe
+import json
 import os
 from datetime import datetime
 
+from services import admin_auth
+from services import http_cache
+from services import json_provider
+from services import stripe_events
+from services import subscription_store
+
 payments_bp = Blueprint('payments', __name__)
 
 # Configure Stripe
@@ -44,13 +51,22 @@ SUBSCRIPTION_TIERS = {
     }
 }
 
+# Content version of the plans response (for conditional GETs)
+PLANS_VERSION = http_cache.content_version(SUBSCRIPTION_TIERS)
+# Encoded once (the plans never change at runtime)
+PLANS_JSON = json_provider.preserialize(SUBSCRIPTION_TIERS)
+
 @payments_bp.route('/plans', methods=['GET'])
 def get_subscription_plans():
     """Get all subscription plans"""
     try:
+        not_modified = http_cache.conditional(PLANS_VERSION)
+        if not_modified:
+            return not_modified
+        
         return jsonify({
             'status': 'success',
-            'plans': SUBSCRIPTION_TIERS,
+            'plans': PLANS_JSON,
             'timestamp': datetime.utcnow().isoformat()
         })
     except Exception as e:
@@ -63,6 +79,7 @@ def create_checkout_session():
         data = request.get_json()
         plan_id = data.get('plan_id')
         email = data.get('email', 'user@example.com')
+        user_id = request_user_id(data)
         
         if not plan_id:
             return jsonify({'status': 'error', 'message': 'Plan ID is required'}), 400
@@ -96,9 +113,11 @@ def create_checkout_session():
             success_url='https://thepromptlink.netlify.app/success?session_id={CHECKOUT_SESSION_ID}',
             cancel_url='https://thepromptlink.netlify.app/cancel',
             customer_email=email,
+            client_reference_id=user_id,
             metadata={
                 'plan_id': plan_id,
-                'plan_name': plan['name']
+                'plan_name': plan['name'],
+                'user_id': user_id or ''
             }
         )
         
@@ -116,9 +135,145 @@ def create_checkout_session():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# Local invoice state, written only by the webhook event consumer
+# (subscriptions live in services.subscription_store)
+@stripe_events.register_initializer
+def init_invoice_table(conn):
+    """Create the invoice table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invoices (
+            invoice_id TEXT PRIMARY KEY,
+            customer_id TEXT,
+            subscription_id TEXT,
+            status TEXT,
+            amount_due INTEGER,
+            amount_paid INTEGER,
+            currency TEXT,
+            event_created INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def plan_for_price(price_id):
+    """Map a Stripe price id back to a plan id"""
+    for plan_id, plan in SUBSCRIPTION_TIERS.items():
+        if price_id and plan['stripe_price_id'] == price_id:
+            return plan_id
+    return None
+
+def request_user_id(data=None):
+    """Caller's user id: the x-user-id header, else a user_id field in the body"""
+    user_id = request.headers.get('x-user-id')
+    if not user_id and isinstance(data, dict):
+        user_id = data.get('user_id')
+    return user_id
+
+def plan_for_user(user_id):
+    """SUBSCRIPTION_TIERS entry for a user's current tier (local lookup, no Stripe call)"""
+    return SUBSCRIPTION_TIERS.get(subscription_store.tier_for(user_id), SUBSCRIPTION_TIERS['free'])
+
+# Feature gating is opt-in until every client sends x-user-id
+ENFORCE_SUBSCRIPTION_TIERS = os.getenv('ENFORCE_SUBSCRIPTION_TIERS', 'false').lower() == 'true'
+
+# Plans whose features include the Expert Panel and Conference Chain modes
+RELAY_MODE_PLANS = ('professional', 'expert')
+
+def subscription_error(user_id, agent_positions=(), relay_mode=False):
+    """403 response if the user's plan doesn't cover the request, else None"""
+    # Agents are unlocked in catalog order: a plan with N agents gets the first N
+    if not ENFORCE_SUBSCRIPTION_TIERS:
+        return None
+    
+    tier = subscription_store.tier_for(user_id)
+    plan = SUBSCRIPTION_TIERS.get(tier, SUBSCRIPTION_TIERS['free'])
+    
+    if relay_mode and tier not in RELAY_MODE_PLANS:
+        message = f"{plan['name']} does not include revolutionary relay modes"
+    elif any(position >= plan['agents'] for position in agent_positions):
+        message = f"{plan['name']} includes the first {plan['agents']} agents only"
+    else:
+        return None
+    
+    return jsonify({'status': 'error', 'message': message, 'plan_id': tier, 'upgrade_required': True}), 403
+
+# Stripe may deliver events out of order: an upsert only wins if its event is
+# at least as new as the one that last wrote the row
+UPSERT_INVOICE_SQL = '''
+    INSERT INTO invoices
+    (invoice_id, customer_id, subscription_id, status, amount_due, amount_paid, currency, event_created, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (invoice_id) DO UPDATE SET
+        status = excluded.status,
+        amount_due = excluded.amount_due,
+        amount_paid = excluded.amount_paid,
+        event_created = excluded.event_created,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE excluded.event_created >= invoices.event_created
+'''
+
+@stripe_events.handler('checkout.session.completed')
+def apply_checkout_completed(conn, event):
+    """Activate the plan bought in a completed checkout"""
+    session = event['data']['object']
+    metadata = session.get('metadata') or {}
+    plan_id = metadata.get('plan_id')
+    customer_email = session.get('customer_email') or (session.get('customer_details') or {}).get('email')
+    
+    subscription_store.upsert_subscription(
+        conn, session.get('customer') or customer_email, 'active',
+        user_id=session.get('client_reference_id') or metadata.get('user_id'),
+        customer_email=customer_email, subscription_id=session.get('subscription'),
+        checkout_session_id=session.get('id'), plan_id=plan_id,
+        source_created=event.get('created', 0)
+    )
+    print(f"Subscription activated: {customer_email} -> {plan_id}")
+
+@stripe_events.handler('customer.subscription.created')
+@stripe_events.handler('customer.subscription.updated')
+@stripe_events.handler('customer.subscription.deleted')
+def apply_subscription_change(conn, event):
+    """Mirror a subscription's plan, status and period end"""
+    subscription = event['data']['object']
+    items = (subscription.get('items') or {}).get('data') or []
+    price_id = ((items[0].get('price') or {}).get('id')) if items else None
+    status = 'canceled' if event['type'] == 'customer.subscription.deleted' else subscription.get('status')
+    
+    subscription_store.upsert_subscription(
+        conn, subscription['customer'], status,
+        subscription_id=subscription['id'], plan_id=plan_for_price(price_id),
+        current_period_end=subscription.get('current_period_end'),
+        source_created=event.get('created', 0)
+    )
+
+@stripe_events.handler('invoice.payment_succeeded')
+@stripe_events.handler('invoice.payment_failed')
+def apply_invoice_payment(conn, event):
+    """Record an invoice's payment outcome"""
+    invoice = event['data']['object']
+    customer_id = invoice['customer']
+    succeeded = event['type'] == 'invoice.payment_succeeded'
+    
+    conn.execute(UPSERT_INVOICE_SQL, (
+        invoice['id'], customer_id, invoice.get('subscription'),
+        'paid' if succeeded else 'payment_failed',
+        invoice.get('amount_due'), invoice.get('amount_paid'), invoice.get('currency'),
+        event.get('created', 0)
+    ))
+    
+    if succeeded:
+        print(f"Payment succeeded for customer: {customer_id}")
+    else:
+        print(f"Payment failed for customer: {customer_id}")
+
+@payments_bp.before_app_request
+def start_billing_jobs():
+    """Pick up events left pending by a previous run (no-op once started)"""
+    stripe_events.start_consumer()
+    subscription_store.start_reconcile_job(plan_for_price)
+
 @payments_bp.route('/webhook', methods=['POST'])
 def stripe_webhook():
-    """Handle Stripe webhooks"""
+    """Verify a Stripe webhook, store it once by event id and acknowledge immediately"""
     try:
         payload = request.get_data()
         sig_header = request.headers.get('Stripe-Signature')
@@ -127,43 +282,67 @@ def stripe_webhook():
         if not endpoint_secret:
             return jsonify({'status': 'error', 'message': 'Webhook secret not configured'}), 500
         
+        # Only the signature is checked here; building StripeObjects is left out
+        # of the hot path and the consumer works on the raw JSON
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, endpoint_secret
-            )
-        except ValueError:
+            payload_text = payload.decode('utf-8')
+            stripe.WebhookSignature.verify_header(payload_text, sig_header, endpoint_secret)
+            event = json.loads(payload_text)
+            event_id = event['id']
+            event_type = event['type']
+        except (ValueError, KeyError, TypeError):
             return jsonify({'status': 'error', 'message': 'Invalid payload'}), 400
         except stripe.error.SignatureVerificationError:
             return jsonify({'status': 'error', 'message': 'Invalid signature'}), 400
         
-        # Handle the event
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            plan_id = session['metadata'].get('plan_id')
-            customer_email = session['customer_email']
-            
-            # Here you would typically:
-            # 1. Update user's subscription in your database
-            # 2. Grant access to the subscribed features
-            # 3. Send confirmation email
-            
-            print(f"Subscription activated: {customer_email} -> {plan_id}")
-            
-        elif event['type'] == 'invoice.payment_succeeded':
-            invoice = event['data']['object']
-            customer_id = invoice['customer']
-            
-            # Handle successful recurring payment
-            print(f"Payment succeeded for customer: {customer_id}")
-            
-        elif event['type'] == 'invoice.payment_failed':
-            invoice = event['data']['object']
-            customer_id = invoice['customer']
-            
-            # Handle failed payment
-            print(f"Payment failed for customer: {customer_id}")
+        # Handled by the background consumer; retries of a stored event are no-ops
+        queued = stripe_events.enqueue_event(event_id, event_type, payload_text)
         
-        return jsonify({'status': 'success'})
+        return jsonify({'status': 'success', 'event_id': event_id, 'duplicate': not queued})
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@payments_bp.route('/webhook-events', methods=['GET'])
+def get_webhook_events():
+    """List received webhook events (e.g. ?status=failed; admin token required)"""
+    try:
+        denied = admin_auth.admin_error()
+        if denied:
+            return denied
+        
+        status = request.args.get('status')
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        
+        return jsonify({
+            'status': 'success',
+            'events': stripe_events.list_events(status, limit)
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@payments_bp.route('/webhook-events/replay', methods=['POST'])
+def replay_webhook_events():
+    """Re-run failed webhook events, or specific failed/pending ones by id ("force" re-runs done ones too)"""
+    try:
+        denied = admin_auth.admin_error()
+        if denied:
+            return denied
+        
+        data = request.get_json(silent=True) or {}
+        event_ids = data.get('event_ids')
+        
+        if not event_ids and not data.get('failed'):
+            return jsonify({'status': 'error', 'message': 'Provide event_ids or "failed": true'}), 400
+        
+        replayed = stripe_events.replay_events(event_ids, failed=bool(data.get('failed')), force=bool(data.get('force')))
+        
+        return jsonify({
+            'status': 'success',
+            'replayed': replayed,
+            'still_failed': stripe_events.list_events('failed', 100)
+        })
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -178,6 +357,20 @@ def verify_checkout_session():
         if not session_id:
             return jsonify({'status': 'error', 'message': 'Session ID is required'}), 400
         
+        # Already recorded by a webhook or an earlier verification: no Stripe call
+        local = subscription_store.find_checkout(session_id)
+        if local and local['status'] in subscription_store.ENTITLED_STATUSES:
+            plan = SUBSCRIPTION_TIERS.get(local['plan_id'])
+            
+            return jsonify({
+                'status': 'success',
+                'payment_status': 'paid',
+                'plan_id': local['plan_id'],
+                'plan_name': plan['name'] if plan else 'Unknown',
+                'customer_email': local['customer_email'],
+                'subscription_active': True
+            })
+        
         # Retrieve the session from Stripe
         session = stripe.checkout.Session.retrieve(session_id)
         
@@ -185,6 +378,11 @@ def verify_checkout_session():
             plan_id = session.metadata.get('plan_id')
             plan = SUBSCRIPTION_TIERS.get(plan_id)
             
+            subscription_store.record_verified_checkout(
+                session, plan_id,
+                user_id=session.get('client_reference_id') or session.metadata.get('user_id') or request_user_id(data)
+            )
+            
             return jsonify({
                 'status': 'success',
                 'payment_status': 'paid',
@@ -205,6 +403,30 @@ def verify_checkout_session():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@payments_bp.route('/subscription', methods=['GET'])
+def get_subscription():
+    """Current tier for a user (x-user-id header or ?user_id=), from the local store"""
+    try:
+        user_id = request.headers.get('x-user-id') or request.args.get('user_id')
+        
+        if not user_id:
+            return jsonify({'status': 'error', 'message': 'User ID is required'}), 400
+        
+        tier = subscription_store.tier_for(user_id)
+        plan = SUBSCRIPTION_TIERS.get(tier, SUBSCRIPTION_TIERS['free'])
+        
+        return jsonify({
+            'status': 'success',
+            'user_id': user_id,
+            'plan_id': tier,
+            'plan_name': plan['name'],
+            'agents': plan['agents'],
+            'credits': plan['credits']
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @payments_bp.route('/customer-portal', methods=['POST'])
 def create_customer_portal():
     """Create customer portal session for subscription management"""
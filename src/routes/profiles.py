@@ -0,0 +1,68 @@
+from flask import Blueprint, request, jsonify, send_file
+
+from services import profiling
+
+profiles_bp = Blueprint('profiles', __name__)
+
+def admin_error():
+    """403 response unless the request carries the profiling admin token"""
+    if profiling.is_admin(request.headers.get(profiling.PROFILE_HEADER)):
+        return None
+    return jsonify({'status': 'error', 'message': f'{profiling.PROFILE_HEADER} header required'}), 403
+
+@profiles_bp.route('', methods=['GET'])
+def list_request_profiles():
+    """Captured request profiles, grouped by route"""
+    try:
+        denied = admin_error()
+        if denied:
+            return denied
+        
+        route = request.args.get('route')
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify({
+            'status': 'success',
+            'sample_rate': profiling.PROFILE_SAMPLE_RATE,
+            'routes': profiling.list_profiles(route, limit)
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@profiles_bp.route('/<slug>/<name>', methods=['GET'])
+def download_request_profile(slug, name):
+    """Download a profile (pstats format: python -m pstats <file>, snakeviz <file>)"""
+    try:
+        denied = admin_error()
+        if denied:
+            return denied
+        
+        path = profiling.profile_path(slug, name)
+        if path is None:
+            return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+        
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=f'{slug}-{name}')
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@profiles_bp.route('/<slug>/<name>/summary', methods=['GET'])
+def summarize_request_profile(slug, name):
+    """Top functions of a profile (?sort=cumulative|tottime|calls&limit=30)"""
+    try:
+        denied = admin_error()
+        if denied:
+            return denied
+        
+        path = profiling.profile_path(slug, name)
+        if path is None:
+            return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+        
+        return jsonify({
+            'status': 'success',
+            'profile': f'{slug}/{name}',
+            'summary': profiling.summarize(path, request.args.get('sort', 'cumulative'), request.args.get('limit', 30, type=int))
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
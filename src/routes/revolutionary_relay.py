@@ -1,178 +1,605 @@
-from flask import Blueprint, request, jsonify
-import requests
+from flask import Blueprint, request, jsonify, make_response, send_file
+import html
 import os
 import json
 import uuid
 from datetime import datetime
 import sqlite3
-import threading
 import time
+from concurrent import futures
+
+from routes.payments import SUBSCRIPTION_TIERS, request_user_id, subscription_error
+from services import context_budget
+from services import http_cache
+from services import json_provider
+from services import model_stats
+from services import openrouter
+from services import relay_checkpoints
+from services import report_artifacts
+from services.relay_results import ChainResult, PairResult, is_error_text
+from services import subscription_store
+from services import tracing
+from services.relay_scheduler import RelayScheduler, SchedulerClosed, SchedulerFull
 
 revolutionary_relay_bp = Blueprint('revolutionary_relay', __name__)
 
 # Session storage
 active_sessions = {}
 
-# Agent configuration (same as agents.py but organized for relay)
+# Agent configuration (same as agents.py but organized for relay);
+# context_window is the model's total token limit on OpenRouter
 RELAY_AGENTS = [
     # Current working 10 agents
-    {'id': 'gpt-4o', 'name': 'GPT-4o', 'model': 'openai/gpt-4o', 'specialty': 'Strategic Analysis'},
-    {'id': 'chatgpt-4-turbo', 'name': 'ChatGPT 4 Turbo', 'model': 'openai/gpt-4-turbo', 'specialty': 'Business Strategy'},
-    {'id': 'deepseek-r1', 'name': 'DeepSeek R1', 'model': 'deepseek/deepseek-r1', 'specialty': 'Technical Expert'},
-    {'id': 'meta-llama-3.3', 'name': 'Meta Llama 3.3', 'model': 'meta-llama/llama-3.3-70b-instruct', 'specialty': 'Creative Analysis'},
-    {'id': 'mistral-large', 'name': 'Mistral Large', 'model': 'mistralai/mistral-large', 'specialty': 'Analytical Processing'},
-    {'id': 'gemini-2.0-flash', 'name': 'Gemini 2.0 Flash', 'model': 'google/gemini-2.0-flash-exp', 'specialty': 'Creative Synthesis'},
-    {'id': 'perplexity-pro', 'name': 'Perplexity Pro', 'model': 'perplexity/llama-3.1-sonar-huge-128k-online', 'specialty': 'Research Expert'},
-    {'id': 'gemini-pro-1.5', 'name': 'Gemini Pro 1.5', 'model': 'google/gemini-pro-1.5', 'specialty': 'Document Analysis'},
-    {'id': 'command-r-plus', 'name': 'Command R+', 'model': 'cohere/command-r-plus', 'specialty': 'Enterprise Solutions'},
-    {'id': 'qwen-2.5-72b', 'name': 'Qwen 2.5 72B', 'model': 'qwen/qwen-2.5-72b-instruct', 'specialty': 'Multilingual Expert'},
+    {'id': 'gpt-4o', 'name': 'GPT-4o', 'model': 'openai/gpt-4o', 'specialty': 'Strategic Analysis', 'context_window': 128000},
+    {'id': 'chatgpt-4-turbo', 'name': 'ChatGPT 4 Turbo', 'model': 'openai/gpt-4-turbo', 'specialty': 'Business Strategy', 'context_window': 128000},
+    {'id': 'deepseek-r1', 'name': 'DeepSeek R1', 'model': 'deepseek/deepseek-r1', 'specialty': 'Technical Expert', 'context_window': 64000},
+    {'id': 'meta-llama-3.3', 'name': 'Meta Llama 3.3', 'model': 'meta-llama/llama-3.3-70b-instruct', 'specialty': 'Creative Analysis', 'context_window': 131072},
+    {'id': 'mistral-large', 'name': 'Mistral Large', 'model': 'mistralai/mistral-large', 'specialty': 'Analytical Processing', 'context_window': 128000},
+    {'id': 'gemini-2.0-flash', 'name': 'Gemini 2.0 Flash', 'model': 'google/gemini-2.0-flash-exp', 'specialty': 'Creative Synthesis', 'context_window': 1048576},
+    {'id': 'perplexity-pro', 'name': 'Perplexity Pro', 'model': 'perplexity/llama-3.1-sonar-huge-128k-online', 'specialty': 'Research Expert', 'context_window': 127072},
+    {'id': 'gemini-pro-1.5', 'name': 'Gemini Pro 1.5', 'model': 'google/gemini-pro-1.5', 'specialty': 'Document Analysis', 'context_window': 2000000},
+    {'id': 'command-r-plus', 'name': 'Command R+', 'model': 'cohere/command-r-plus', 'specialty': 'Enterprise Solutions', 'context_window': 128000},
+    {'id': 'qwen-2.5-72b', 'name': 'Qwen 2.5 72B', 'model': 'qwen/qwen-2.5-72b-instruct', 'specialty': 'Multilingual Expert', 'context_window': 32768},
     
     # Additional 10 revolutionary agents
-    {'id': 'llama-3.3-70b', 'name': 'Llama 3.3 70B', 'model': 'meta-llama/llama-3.3-70b-instruct', 'specialty': 'Logical Reasoning'},
-    {'id': 'mixtral-8x22b', 'name': 'Mixtral 8x22B', 'model': 'mistralai/mixtral-8x22b-instruct', 'specialty': 'System Design'},
-    {'id': 'yi-large', 'name': 'Yi Large', 'model': '01-ai/yi-large', 'specialty': 'Innovation Expert'},
-    {'id': 'nous-hermes-3', 'name': 'Nous Hermes 3', 'model': 'nousresearch/hermes-3-llama-3.1-405b', 'specialty': 'Free Thinking'},
-    {'id': 'wizardlm-2', 'name': 'WizardLM 2', 'model': 'microsoft/wizardlm-2-8x22b', 'specialty': 'Mathematical Reasoning'},
-    {'id': 'dolphin-mixtral', 'name': 'Dolphin Mixtral', 'model': 'cognitivecomputations/dolphin-2.9-llama3-70b', 'specialty': 'Bold Synthesis'},
-    {'id': 'openhermes-2.5', 'name': 'OpenHermes 2.5', 'model': 'teknium/openhermes-2.5-mistral-7b', 'specialty': 'Collaboration Expert'},
-    {'id': 'starling-7b', 'name': 'Starling 7B', 'model': 'berkeley-nest/starling-lm-7b-alpha', 'specialty': 'Quick Insights'},
-    {'id': 'neural-chat', 'name': 'Neural Chat', 'model': 'intel/neural-chat-7b-v3-3', 'specialty': 'Dialogue Expert'},
-    {'id': 'zephyr-beta', 'name': 'Zephyr Beta', 'model': 'huggingfaceh4/zephyr-7b-beta', 'specialty': 'Final Synthesis'}
+    {'id': 'llama-3.3-70b', 'name': 'Llama 3.3 70B', 'model': 'meta-llama/llama-3.3-70b-instruct', 'specialty': 'Logical Reasoning', 'context_window': 131072},
+    {'id': 'mixtral-8x22b', 'name': 'Mixtral 8x22B', 'model': 'mistralai/mixtral-8x22b-instruct', 'specialty': 'System Design', 'context_window': 65536},
+    {'id': 'yi-large', 'name': 'Yi Large', 'model': '01-ai/yi-large', 'specialty': 'Innovation Expert', 'context_window': 32768},
+    {'id': 'nous-hermes-3', 'name': 'Nous Hermes 3', 'model': 'nousresearch/hermes-3-llama-3.1-405b', 'specialty': 'Free Thinking', 'context_window': 131072},
+    {'id': 'wizardlm-2', 'name': 'WizardLM 2', 'model': 'microsoft/wizardlm-2-8x22b', 'specialty': 'Mathematical Reasoning', 'context_window': 65536},
+    {'id': 'dolphin-mixtral', 'name': 'Dolphin Mixtral', 'model': 'cognitivecomputations/dolphin-2.9-llama3-70b', 'specialty': 'Bold Synthesis', 'context_window': 8192},
+    {'id': 'openhermes-2.5', 'name': 'OpenHermes 2.5', 'model': 'teknium/openhermes-2.5-mistral-7b', 'specialty': 'Collaboration Expert', 'context_window': 4096},
+    {'id': 'starling-7b', 'name': 'Starling 7B', 'model': 'berkeley-nest/starling-lm-7b-alpha', 'specialty': 'Quick Insights', 'context_window': 8192},
+    {'id': 'neural-chat', 'name': 'Neural Chat', 'model': 'intel/neural-chat-7b-v3-3', 'specialty': 'Dialogue Expert', 'context_window': 4096},
+    {'id': 'zephyr-beta', 'name': 'Zephyr Beta', 'model': 'huggingfaceh4/zephyr-7b-beta', 'specialty': 'Final Synthesis', 'context_window': 4096}
 ]
 
-def call_openrouter_api(agent, message):
-    """Call OpenRouter API for specific agent"""
+RELAY_MAX_TOKENS = 2000
+RELAY_TITLE = 'PromptLink Revolutionary AI Relay'
+
+def relay_system_prompt(agent):
+    """System message for a relay agent"""
+    return f'You are {agent["name"]}, specializing in {agent["specialty"]}. Provide insightful, collaborative responses that build upon previous insights when available.'
+
+def call_openrouter_api(agent, message, timeout=None, budget=None):
+    """Call OpenRouter API for specific agent (identical concurrent calls share one request)
+
+    `message` is the user message text, or a message list from budget_messages();
+    token usage (including cached prompt tokens) is added to `budget` if given.
+    """
+    messages = message if isinstance(message, list) else agent_messages(agent, message)
+    with tracing.span('relay.call', agent=agent['id'], message_chars=messages_chars(messages)) as call_span:
+        response = _call_openrouter_api(agent, messages, timeout, budget)
+        call_span.attrs['failed'] = is_error_text(response)
+        return response
+
+def _call_openrouter_api(agent, messages, timeout, budget=None):
     try:
-        response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
-            headers={
-                'Authorization': f'Bearer {os.getenv("OPENROUTER_API_KEY")}',
-                'Content-Type': 'application/json',
-                'HTTP-Referer': 'https://thepromptlink.netlify.app',
-                'X-Title': 'PromptLink Revolutionary AI Relay'
-            },
-            json={
-                'model': agent['model'],
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': f'You are {agent["name"]}, specializing in {agent["specialty"]}. Provide insightful, collaborative responses that build upon previous insights when available.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': message
-                    }
-                ],
-                'max_tokens': 2000,
-                'temperature': 0.7
-            }
+        response_data = openrouter.chat_completion(
+            agent['model'],
+            messages,
+            max_tokens=RELAY_MAX_TOKENS,
+            title=RELAY_TITLE,
+            timeout=timeout
         )
+        if budget is not None:
+            budget.record_usage(response_data.get('usage'))
+        return openrouter.completion_text(response_data)
         
-        if response.status_code == 200:
-            response_data = response.json()
-            return response_data['choices'][0]['message']['content']
-        else:
-            return f"Error: {response.status_code} - {response.text}"
-            
     except Exception as e:
-        return f"API Error: {str(e)}"
+        return relay_error_text(e, timeout)
+
+def agent_messages(agent, message):
+    """The agent's persona as the system message, then one user message"""
+    return [
+        {
+            'role': 'system',
+            'content': relay_system_prompt(agent)
+        },
+        {
+            'role': 'user',
+            'content': message
+        }
+    ]
+
+def messages_chars(messages):
+    return sum(len(openrouter.content_text(message['content'])) for message in messages)
+
+def relay_error_text(error, timeout=None):
+    """The text stored in place of a response when an agent's call fails"""
+    if isinstance(error, openrouter.OpenRouterError):
+        return f"Error: {error.status_code} - {error.text}"
+    if isinstance(error, TimeoutError):
+        return f"API Error: no response within {timeout}s"
+    return f"API Error: {str(error)}"
+
+# Relay messages put the content every agent shares (the original prompt) in a
+# leading system message that is byte-identical across agents and sessions
+# given the same fitted prompt, so providers with prompt caching can reuse it.
+# Everything agent-specific (persona, previous insight, task) comes after it.
+RELAY_SHARED_CONTEXT = (
+    "You are one of several AI experts collaborating in a PromptLink relay. Every expert works from "
+    "the same original prompt, below; your own role and task follow it.\n\nORIGINAL PROMPT:\n"
+)
+PANEL_INSTRUCTION = "Give your own independent analysis of the original prompt."
+CHAIN_INSTRUCTION = "PREVIOUS INSIGHT: {insight}\n\nBuild upon this insight with your expertise:"
+
+# Models whose OpenRouter providers take explicit cache_control breakpoints
+# (others cache long shared prefixes automatically, or not at all)
+CACHE_CONTROL_MODELS = tuple(
+    prefix.strip() for prefix in os.getenv('RELAY_CACHE_CONTROL_MODELS', 'anthropic/,google/gemini').split(',') if prefix.strip()
+)
+
+def shared_context_content(agent, prompt):
+    """The shared system message content, with a cache breakpoint where the provider supports one"""
+    text = RELAY_SHARED_CONTEXT + prompt
+    if CACHE_CONTROL_MODELS and agent['model'].startswith(CACHE_CONTROL_MODELS):
+        return [{'type': 'text', 'text': text, 'cache_control': {'type': 'ephemeral'}}]
+    return text
+
+def budget_messages(agent, budget, prompt, insight=None):
+    """Build an agent's messages, compacted to fit its context window"""
+    started = time.monotonic()
+    instruction = PANEL_INSTRUCTION if insight is None else CHAIN_INSTRUCTION
+    # Fixed text (shared preamble, persona, instruction) is reserved before sizing the parts
+    fixed_text = RELAY_SHARED_CONTEXT + relay_system_prompt(agent) + instruction.format(insight='')
+    fitted_prompt, fitted_insight = context_budget.fit_chain_parts(
+        prompt, insight, agent.get('context_window'), RELAY_MAX_TOKENS,
+        fixed_text=fixed_text, carry_prompt=insight is not None
+    )
+    
+    task = f"{relay_system_prompt(agent)}\n\n{instruction.format(insight=fitted_insight)}"
+    messages = [
+        {'role': 'system', 'content': shared_context_content(agent, fitted_prompt)},
+        {'role': 'user', 'content': task}
+    ]
+    original = prompt + (insight or '')
+    sent = fitted_prompt + (fitted_insight or '')
+    budget.record(original, sent)
+    tracing.record_span('relay.budget', started, time.monotonic(), agent=agent['id'], compacted=len(sent) < len(original))
+    return messages
+
+# Scheduling weight per tier: doubles with each plan up (free 1 ... expert 8),
+# overridable as RELAY_TIER_WEIGHTS="free=1,basic=2,professional=4,expert=8"
+def relay_tier_weights():
+    """Stride-scheduling weight for each subscription tier"""
+    weights = {tier: 2 ** index for index, tier in enumerate(SUBSCRIPTION_TIERS)}
+    for entry in os.getenv('RELAY_TIER_WEIGHTS', '').split(','):
+        tier, _, weight = entry.partition('=')
+        if tier.strip() in weights and weight.strip():
+            weights[tier.strip()] = max(float(weight), 0.01)
+    return weights
+
+relay_scheduler = RelayScheduler(relay_tier_weights())
+
+# On shutdown, running sessions get this long to finish before being handed off
+RELAY_DRAIN_SECONDS = float(os.getenv('RELAY_DRAIN_SECONDS', '25'))
+
+def persist_session(session_id, session):
+    """Checkpoint a session's metadata (a failed write never stops the session)"""
+    try:
+        relay_checkpoints.save_session(session_id, session)
+    except Exception as e:
+        print(f"Relay checkpoint failed for {session_id}: {e}")
+
+def checkpoint_result(session_id, session, result):
+    """Append a completed result in memory and in the durable store"""
+    try:
+        with tracing.span('relay.checkpoint', position=len(session['results'])):
+            stored_status = relay_checkpoints.save_result(session_id, session, len(session['results']), result)
+    except Exception as e:
+        print(f"Relay checkpoint failed for {session_id}: {e}")
+        stored_status = session['status']
+    
+    if stored_status is None:
+        # Another process resumed it (after a stop or a drain hand-off): this run ends here
+        session['status'] = 'stopped'
+        return
+    session['results'].append(result)
+    if stored_status == 'stopped':
+        # Stopped through another worker process
+        session['status'] = 'stopped'
+
+def run_scheduled_session(session_id, worker, *args):
+    """Scheduler entry point: skip sessions stopped while they were queued"""
+    session = active_sessions[session_id]
+    if session.get('status') == 'stopped':
+        return
+    session.pop('queue_position', None)
+    with tracing.span('relay.session', trace_id=session.get('trace_id'), session_id=session_id, mode=session['mode'],
+                      resumed_from=len(session.get('results', []))):
+        if 'queued_at' in session:
+            tracing.record_span('relay.queued', session.pop('queued_at'), time.monotonic(), tier=session.get('tier'))
+        try:
+            worker(session_id, *args)
+        except Exception:
+            # Keep the checkpoints; /resume-session can pick up from the last one
+            session['status'] = 'failed'
+            persist_session(session_id, session)
+            raise
+
+def schedule_session(session_id, user_id, worker, *args):
+    """Admit a session to the relay scheduler, or build a 429 response"""
+    tier = subscription_store.tier_for(user_id)
+    session = active_sessions[session_id]
+    session['tier'] = tier
+    session['queued_at'] = time.monotonic()
+    
+    try:
+        position = relay_scheduler.submit(session_id, tier, user_id, run_scheduled_session, session_id, worker, *args)
+    except SchedulerFull as e:
+        del active_sessions[session_id]
+        response = make_response(jsonify({
+            'status': 'error',
+            'message': str(e),
+            'tier': tier,
+            'queue_position': e.queue_position,
+            'retry_after': e.retry_after
+        }), 503 if isinstance(e, SchedulerClosed) else 429)
+        response.headers['Retry-After'] = str(int(e.retry_after))
+        return None, response
+    
+    if position:
+        session['status'] = 'queued'
+        session['queue_position'] = position
+    persist_session(session_id, session)
+    return position, None
+
+def restore_session(stored):
+    """Rebuild an in-memory session dict from its checkpoint"""
+    session = {
+        'mode': stored['mode'],
+        'prompt': stored['prompt'],
+        'user_id': stored['user_id'],
+        'tier': stored['tier'],
+        'status': stored['status'],
+        'created_at': stored['created_at'],
+        'completed_at': stored['completed_at'],
+        'context_budget': stored['context_budget'],
+        'trace_id': stored['params'].get('trace_id'),
+        'agent_policy': stored['params'].get('agent_policy', 'static')
+    }
+    if stored['mode'] == 'expert_panel':
+        session.update({key: stored['params'].get(key) for key in ('deadline_seconds', 'quorum', 'panel_outcome', 'panel_pairs')})
+        session['results'] = [
+            PairResult.restore(panel_pair_number(index_a), index_a, index_b, response_a, response_b, timestamp)
+            for index_a, index_b, response_a, response_b, timestamp, _ in stored['result_rows']
+        ]
+        session.update(current_pair=len(session['results']), total_pairs=10, current_agents=[])
+    else:
+        session['results'] = [
+            # Rows come back in chain order, so a row's place in the list is its position
+            ChainResult.restore(position, index, response, timestamp, bool(sticky))
+            for position, (index, _, response, _, timestamp, sticky) in enumerate(stored['result_rows'])
+        ]
+        session['max_agents'] = stored['params'].get('max_agents', 20)
+        session['agent_indexes'] = stored['params'].get('agent_indexes') or chain_agent_indexes(session['max_agents'], 'static')
+        session.update(
+            current_agent=len(session['results']),
+            total_agents=len(session['agent_indexes']),
+            current_agent_name=''
+        )
+    return session
+
+def get_session(session_id):
+    """A session from this process's memory, else from the checkpoint store (None if unknown)"""
+    session = active_sessions.get(session_id)
+    if session is not None:
+        return session
+    stored = relay_checkpoints.load_session(session_id)
+    return restore_session(stored) if stored else None
+
+def session_worker(session):
+    """The worker function and arguments that (re)run a session"""
+    if session['mode'] == 'expert_panel':
+        return expert_panel_worker, (session['prompt'],)
+    return conference_chain_worker, (session['prompt'], session.get('max_agents', 20))
+
+def resume_session(session_id):
+    """Reschedule a claimed session from its last checkpoint; returns (position, rejected_response)"""
+    stored = relay_checkpoints.load_session(session_id)
+    session = restore_session(stored)
+    session['status'] = 'starting'
+    session['completed_at'] = None
+    active_sessions[session_id] = session
+    
+    worker, args = session_worker(session)
+    position, rejected = schedule_session(session_id, session['user_id'], worker, *args)
+    if rejected:
+        relay_checkpoints.release(session_id)
+    return position, rejected
+
+def recover_session(session_id):
+    """Recovery-job hook: resume an orphaned session claimed by this process"""
+    if relay_scheduler.is_active(session_id):
+        return True
+    _, rejected = resume_session(session_id)
+    if rejected is None:
+        print(f"Resumed relay session {session_id} from its last checkpoint")
+    return rejected is None
+
+def running_session_ids():
+    """Sessions this process is queueing or running (kept alive by the heartbeat)"""
+    return [
+        session_id for session_id, session in list(active_sessions.items())
+        if session.get('status') in relay_checkpoints.UNFINISHED_STATUSES
+    ]
+
+def drain_sessions(timeout=RELAY_DRAIN_SECONDS):
+    """Graceful shutdown: admit nothing new, let running sessions finish, hand off the rest"""
+    # Queued sessions never started here; another process picks them up right away
+    for session_id in relay_scheduler.close():
+        relay_checkpoints.release(session_id)
+    
+    # Sessions still running at the deadline resume elsewhere from their last checkpoint
+    unfinished = relay_scheduler.wait_idle(timeout)
+    for session_id in unfinished:
+        relay_checkpoints.release(session_id)
+    model_stats.flush()
+    return unfinished
+
+@revolutionary_relay_bp.before_app_request
+def start_relay_recovery():
+    """Resume sessions interrupted by a crash or deploy (no-op once started)"""
+    relay_checkpoints.start_recovery_job(recover_session, running_session_ids)
+
+def result_dicts(session):
+    """A session's results in the API's dict shape (decompressing responses)"""
+    with tracing.span('relay.result_dicts', results=len(session.get('results', []))):
+        results = session.get('results', [])
+        if session['mode'] == 'expert_panel':
+            # A concurrent panel checkpoints pairs in the order they finished
+            results = sorted(results, key=lambda result: result.pair_number)
+        return [result.to_dict(RELAY_AGENTS) for result in results]
+
+# Agent policies: 'static' walks RELAY_AGENTS in registry order; 'adaptive'
+# uses live model stats to minimize expected session latency
+AGENT_POLICIES = ('static', 'adaptive')
+# Adaptive chains leave out agents failing more often than this
+ADAPTIVE_MAX_ERROR_RATE = float(os.getenv('RELAY_ADAPTIVE_MAX_ERROR_RATE', '0.5'))
+
+def expected_agent_seconds():
+    """Expected seconds per useful answer for every agent (unmeasured models get the average)"""
+    known = [model_stats.expected_seconds(agent['model']) for agent in RELAY_AGENTS]
+    known = [seconds for seconds in known if seconds is not None]
+    default = sum(known) / len(known) if known else 0.0
+    return [model_stats.expected_seconds(agent['model'], default) for agent in RELAY_AGENTS]
+
+def chain_agent_indexes(max_agents, policy):
+    """Registry indexes a conference chain walks, in order"""
+    count = min(max_agents, len(RELAY_AGENTS))
+    if policy != 'adaptive':
+        return list(range(count))
+    # A chain's latency is the sum of its agents': take the fastest reliable
+    # ones, keeping registry order so the synthesis agents still come last
+    expected = expected_agent_seconds()
+    reliable = [index for index, agent in enumerate(RELAY_AGENTS)
+                if model_stats.error_rate(agent['model']) <= ADAPTIVE_MAX_ERROR_RATE]
+    chosen = sorted(reliable or range(len(RELAY_AGENTS)), key=lambda index: (expected[index], index))[:count]
+    return sorted(chosen)
+
+def panel_pair_number(index_a):
+    """Pair number of the panel pair whose first agent is RELAY_AGENTS[index_a]"""
+    return index_a // 2 + 1
+
+def panel_pairs(policy):
+    """The 10 expert-panel pairs (registry indexes), in the order they run"""
+    pairs = [[index, index + 1] for index in range(0, 20, 2)]
+    if policy == 'adaptive':
+        # Every pair runs either way; fastest first puts results in front of the user soonest
+        expected = expected_agent_seconds()
+        pairs.sort(key=lambda pair: expected[pair[0]] + expected[pair[1]])
+    return pairs
 
 def expert_panel_worker(session_id, prompt):
     """Worker function for Expert Panel Mode (10 pairs)"""
     session = active_sessions[session_id]
     session['status'] = 'running'
-    session['results'] = []
+    # A resumed session keeps its checkpointed pairs and budget counters
+    session.setdefault('results', [])
+    budget = context_budget.SessionBudget.from_dict(session.get('context_budget'))
+    persist_session(session_id, session)
     
-    # Create 10 pairs from 20 agents
-    pairs = []
-    for i in range(0, 20, 2):
-        pairs.append([RELAY_AGENTS[i], RELAY_AGENTS[i+1]])
+    # 10 pairs from 20 agents (by registry index), in the order the agent policy chose
+    pairs = [tuple(pair) for pair in session.get('panel_pairs') or panel_pairs('static')]
     
     session['total_pairs'] = len(pairs)
     
-    for pair_index, pair in enumerate(pairs):
+    if session.get('deadline_seconds') or session.get('quorum'):
+        # With a deadline or quorum every agent runs at once and stragglers are skipped
+        run_panel_concurrently(session_id, session, prompt, pairs, budget)
+    else:
+        run_panel_pairs(session_id, session, prompt, pairs, budget)
+    
+    finish_session(session_id, session)
+
+def run_panel_pairs(session_id, session, prompt, pairs, budget):
+    """One pair at a time, each waiting for both of its agents"""
+    done_pairs = {result.pair_number for result in session['results']}
+    for pair_index, (index_a, index_b) in enumerate(pairs):
+        pair_number = panel_pair_number(index_a)
+        if pair_number in done_pairs:
+            continue
+        pair = [RELAY_AGENTS[index_a], RELAY_AGENTS[index_b]]
         if session.get('status') == 'stopped':
             break
             
         session['current_pair'] = pair_index + 1
         session['current_agents'] = [pair[0]['name'], pair[1]['name']]
         
-        # Agent A responds to prompt
-        agent_a_response = call_openrouter_api(pair[0], prompt)
-        
-        # Agent B responds to prompt (independent analysis)
-        agent_b_response = call_openrouter_api(pair[1], prompt)
-        
-        # Store pair results
-        pair_result = {
-            'pair_number': pair_index + 1,
-            'agent_a': {
-                'name': pair[0]['name'],
-                'specialty': pair[0]['specialty'],
-                'response': agent_a_response
-            },
-            'agent_b': {
-                'name': pair[1]['name'],
-                'specialty': pair[1]['specialty'],
-                'response': agent_b_response
-            },
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        session['results'].append(pair_result)
+        with tracing.span('relay.pair', pair=pair_number):
+            # Agent A responds to prompt
+            agent_a_response = call_openrouter_api(pair[0], budget_messages(pair[0], budget, prompt), budget=budget)
+            
+            # Agent B responds to prompt (independent analysis)
+            agent_b_response = call_openrouter_api(pair[1], budget_messages(pair[1], budget, prompt), budget=budget)
+            
+            # Store pair results (compact record; see result_dicts for the API shape)
+            session['context_budget'] = budget.to_dict()
+            checkpoint_result(session_id, session, PairResult(pair_number, index_a, index_b, agent_a_response, agent_b_response))
         
         # Small delay between pairs
-        time.sleep(1)
+        with tracing.span('relay.pause'):
+            time.sleep(1)
+
+# How often a concurrent panel re-checks for a stop while waiting on agents
+PANEL_POLL_SECONDS = 1.0
+
+def run_panel_concurrently(session_id, session, prompt, pairs, budget):
+    """Call every remaining agent at once; finish at the deadline or once `quorum` agents answered"""
+    deadline = time.monotonic() + session['deadline_seconds'] if session.get('deadline_seconds') else None
+    quorum = session.get('quorum') or 2 * len(pairs)
+    # Only real responses count towards the quorum (errors are tallied apart),
+    # the same rule PairResult.answered applies to checkpointed pairs
+    answered = sum(result.answered for result in session['results'])
+    errors = sum(result.errors for result in session['results'])
+    done_pairs = {result.pair_number for result in session['results']}
+    
+    # future -> (handle, pair number, slot, agent, started); responses[pair number] = [a, b]
+    pending = {}
+    responses = {}
+    pair_agents = {panel_pair_number(index_a): (index_a, index_b) for index_a, index_b in pairs}
+    for pair_number, (index_a, index_b) in pair_agents.items():
+        if pair_number in done_pairs:
+            continue
+        responses[pair_number] = [None, None]
+        for slot, agent_index in enumerate((index_a, index_b)):
+            agent = RELAY_AGENTS[agent_index]
+            call = openrouter.submit_completion(
+                agent['model'], budget_messages(agent, budget, prompt),
+                max_tokens=RELAY_MAX_TOKENS, title=RELAY_TITLE
+            )
+            pending[call.future] = (call, pair_number, slot, agent, time.monotonic())
+    session['context_budget'] = budget.to_dict()
+    
+    with tracing.span('relay.panel', agents=len(pending), quorum=quorum, deadline_seconds=session.get('deadline_seconds')) as panel_span:
+        reason = 'all_returned'
+        while pending:
+            if session.get('status') == 'stopped':
+                reason = 'stopped'
+                break
+            if answered >= quorum:
+                reason = 'quorum'
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                reason = 'deadline'
+                break
+            
+            session['current_pair'] = len(session['results'])
+            session['current_agents'] = [entry[3]['name'] for entry in pending.values()]
+            finished, _ = futures.wait(
+                list(pending), timeout=PANEL_POLL_SECONDS if remaining is None else min(remaining, PANEL_POLL_SECONDS),
+                return_when=futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                call, pair_number, slot, agent, started = pending.pop(future)
+                try:
+                    response_data = future.result()
+                    budget.record_usage(response_data.get('usage'))
+                    session['context_budget'] = budget.to_dict()
+                    response = openrouter.completion_text(response_data)
+                except Exception as e:
+                    response = relay_error_text(e)
+                failed = is_error_text(response)
+                if failed:
+                    errors += 1
+                else:
+                    answered += 1
+                tracing.record_span('relay.call', started, time.monotonic(), agent=agent['id'], failed=failed)
+                responses[pair_number][slot] = response
+                
+                if None not in responses[pair_number]:
+                    index_a, index_b = pair_agents[pair_number]
+                    checkpoint_result(session_id, session, PairResult(pair_number, index_a, index_b, *responses.pop(pair_number)))
+        
+        # Stragglers: cancel their calls and record them as skipped
+        for call, _, _, _, _ in pending.values():
+            call.cancel()
+        skipped = [entry[3]['name'] for entry in pending.values()]
+        panel_span.attrs.update(reason=reason, answered=answered, errors=errors, skipped=len(skipped))
     
-    session['status'] = 'completed'
-    session['completed_at'] = datetime.utcnow().isoformat()
+    session['current_agents'] = []
+    if session.get('status') == 'stopped':
+        # Unfinished pairs rerun on resume
+        return
+    for pair_number, (response_a, response_b) in sorted(responses.items()):
+        index_a, index_b = pair_agents[pair_number]
+        checkpoint_result(session_id, session, PairResult(pair_number, index_a, index_b, response_a, response_b))
+    session['current_pair'] = len(pairs)
+    session['panel_outcome'] = {
+        'reason': reason,
+        'answered': sum(result.answered for result in session['results']),
+        'errors': sum(result.errors for result in session['results']),
+        'skipped_agents': skipped
+    }
 
 def conference_chain_worker(session_id, prompt, max_agents=20):
     """Worker function for Conference Chain Mode (sticky context)"""
     session = active_sessions[session_id]
     session['status'] = 'running'
-    session['results'] = []
+    session.setdefault('results', [])
     session['sticky_context'] = prompt
+    budget = context_budget.SessionBudget.from_dict(session.get('context_budget'))
+    persist_session(session_id, session)
     
-    session['total_agents'] = min(max_agents, len(RELAY_AGENTS))
+    # Registry indexes of the chain's agents, in order (chosen by the agent policy)
+    agent_indexes = session.get('agent_indexes') or chain_agent_indexes(max_agents, 'static')
+    session['total_agents'] = len(agent_indexes)
     
-    for agent_index in range(session['total_agents']):
+    # A resumed chain continues after its last checkpointed agent
+    for position in range(len(session['results']), session['total_agents']):
         if session.get('status') == 'stopped':
             break
             
+        agent_index = agent_indexes[position]
         agent = RELAY_AGENTS[agent_index]
-        session['current_agent'] = agent_index + 1
+        session['current_agent'] = position + 1
         session['current_agent_name'] = agent['name']
         
-        # Create message with sticky context
-        if agent_index == 0:
-            # First agent gets original prompt
-            message = prompt
-        else:
-            # Subsequent agents get original prompt + latest response
-            latest_response = session['results'][-1]['response']
-            message = f"ORIGINAL PROMPT: {prompt}\n\nPREVIOUS INSIGHT: {latest_response}\n\nBuild upon this insight with your expertise:"
-        
-        # Get agent response
-        agent_response = call_openrouter_api(agent, message)
-        
-        # Store result
-        result = {
-            'agent_number': agent_index + 1,
-            'agent_name': agent['name'],
-            'agent_specialty': agent['specialty'],
-            'response': agent_response,
-            'sticky_context_used': agent_index > 0,
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        session['results'].append(result)
+        with tracing.span('relay.agent', agent_number=position + 1):
+            # Create message with sticky context, compacted to the agent's context window
+            if position == 0:
+                # First agent gets original prompt
+                messages = budget_messages(agent, budget, prompt)
+            else:
+                # Subsequent agents get original prompt + latest response
+                latest_response = session['results'][-1].response
+                messages = budget_messages(agent, budget, prompt, latest_response)
+            
+            # Get agent response
+            agent_response = call_openrouter_api(agent, messages, budget=budget)
+            
+            # Store result (compact record; see result_dicts for the API shape)
+            session['context_budget'] = budget.to_dict()
+            checkpoint_result(session_id, session, ChainResult(position, agent_index, agent_response, position > 0))
         
         # Small delay between agents
-        time.sleep(1)
+        with tracing.span('relay.pause'):
+            time.sleep(1)
     
-    session['status'] = 'completed'
-    session['completed_at'] = datetime.utcnow().isoformat()
+    finish_session(session_id, session)
+
+def agent_policy_option(data):
+    """Validated agent_policy of a start request ('static' unless asked)"""
+    policy = data.get('agent_policy') or 'static'
+    if policy not in AGENT_POLICIES:
+        raise ValueError(f"agent_policy must be one of: {', '.join(AGENT_POLICIES)}")
+    return policy
+
+def panel_options(data):
+    """Validated deadline_seconds and quorum of a panel request (None when not given)"""
+    deadline_seconds = data.get('deadline_seconds')
+    quorum = data.get('quorum')
+    if deadline_seconds is not None:
+        deadline_seconds = float(deadline_seconds)
+        if not deadline_seconds > 0:
+            raise ValueError('deadline_seconds must be greater than 0')
+    if quorum is not None:
+        if isinstance(quorum, bool) or int(quorum) != quorum or not 1 <= quorum <= 20:
+            raise ValueError('quorum must be a whole number of agents from 1 to 20')
+        quorum = int(quorum)
+    return deadline_seconds, quorum
 
 @revolutionary_relay_bp.route('/start-expert-panel', methods=['POST'])
 def start_expert_panel():
@@ -184,12 +611,28 @@ def start_expert_panel():
         if not prompt:
             return jsonify({'status': 'error', 'message': 'Prompt is required'}), 400
         
+        try:
+            deadline_seconds, quorum = panel_options(data)
+            agent_policy = agent_policy_option(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        denied = subscription_error(request_user_id(data), relay_mode=True)
+        if denied:
+            return denied
+        
         session_id = str(uuid.uuid4())
         
         # Initialize session
         active_sessions[session_id] = {
             'mode': 'expert_panel',
+            'deadline_seconds': deadline_seconds,
+            'quorum': quorum,
+            'agent_policy': agent_policy,
+            'panel_pairs': panel_pairs(agent_policy),
             'prompt': prompt,
+            'user_id': request_user_id(data),
+            'trace_id': tracing.current_trace_id(),
             'status': 'starting',
             'created_at': datetime.utcnow().isoformat(),
             'current_pair': 0,
@@ -197,19 +640,20 @@ def start_expert_panel():
             'current_agents': ['Initializing...', 'Waiting...']
         }
         
-        # Start worker thread
-        worker_thread = threading.Thread(
-            target=expert_panel_worker,
-            args=(session_id, prompt)
-        )
-        worker_thread.daemon = True
-        worker_thread.start()
+        # Run on the relay scheduler (bounded, weighted by subscription tier)
+        position, rejected = schedule_session(session_id, request_user_id(data), expert_panel_worker, prompt)
+        if rejected:
+            return rejected
         
         return jsonify({
-            'status': 'started',
+            'status': 'queued' if position else 'started',
             'session_id': session_id,
             'mode': 'expert_panel',
             'total_pairs': 10,
+            'deadline_seconds': deadline_seconds,
+            'quorum': quorum,
+            'agent_policy': agent_policy,
+            'queue_position': position,
             'message': 'Expert Panel Mode started - 10 pairs analyzing independently'
         })
         
@@ -227,32 +671,47 @@ def start_conference_chain():
         if not prompt:
             return jsonify({'status': 'error', 'message': 'Prompt is required'}), 400
         
+        try:
+            agent_policy = agent_policy_option(data)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        denied = subscription_error(request_user_id(data), relay_mode=True)
+        if denied:
+            return denied
+        
         session_id = str(uuid.uuid4())
+        agent_indexes = chain_agent_indexes(max_agents, agent_policy)
         
         # Initialize session
         active_sessions[session_id] = {
             'mode': 'conference_chain',
             'prompt': prompt,
+            'user_id': request_user_id(data),
+            'trace_id': tracing.current_trace_id(),
+            'max_agents': max_agents,
+            'agent_policy': agent_policy,
+            'agent_indexes': agent_indexes,
             'status': 'starting',
             'created_at': datetime.utcnow().isoformat(),
             'current_agent': 0,
-            'total_agents': min(max_agents, len(RELAY_AGENTS)),
+            'total_agents': len(agent_indexes),
             'current_agent_name': 'Initializing...'
         }
         
-        # Start worker thread
-        worker_thread = threading.Thread(
-            target=conference_chain_worker,
-            args=(session_id, prompt, max_agents)
-        )
-        worker_thread.daemon = True
-        worker_thread.start()
+        # Run on the relay scheduler (bounded, weighted by subscription tier)
+        position, rejected = schedule_session(session_id, request_user_id(data), conference_chain_worker, prompt, max_agents)
+        if rejected:
+            return rejected
         
         return jsonify({
-            'status': 'started',
+            'status': 'queued' if position else 'started',
             'session_id': session_id,
             'mode': 'conference_chain',
-            'total_agents': min(max_agents, len(RELAY_AGENTS)),
+            'total_agents': len(agent_indexes),
+            'agent_policy': agent_policy,
+            'agents': [RELAY_AGENTS[index]['name'] for index in agent_indexes],
+            'queue_position': position,
             'message': 'Conference Chain Mode started - agents building with sticky context'
         })
         
@@ -263,11 +722,10 @@ def start_conference_chain():
 def get_session_status(session_id):
     """Get real-time session status"""
     try:
-        if session_id not in active_sessions:
+        session = get_session(session_id)
+        if session is None:
             return jsonify({'status': 'error', 'message': 'Session not found'}), 404
         
-        session = active_sessions[session_id]
-        
         return jsonify({
             'status': 'success',
             'session_data': {
@@ -281,6 +739,10 @@ def get_session_status(session_id):
                 'current_agents': session.get('current_agents', []),
                 'current_agent_name': session.get('current_agent_name', ''),
                 'results_count': len(session.get('results', [])),
+                'queue_position': relay_scheduler.position(session_id) if session['status'] == 'queued' else None,
+                'context_budget': session.get('context_budget'),
+                'panel_outcome': session.get('panel_outcome'),
+                'agent_policy': session.get('agent_policy', 'static'),
                 'created_at': session['created_at'],
                 'completed_at': session.get('completed_at')
             }
@@ -289,22 +751,39 @@ def get_session_status(session_id):
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def results_version(session):
+    """Content version of a session's results response
+
+    Results are append-only, so status and result count (plus the token
+    counters, which move between results in a concurrent panel) identify it.
+    """
+    budget = session.get('context_budget') or {}
+    return '-'.join(str(part) for part in (
+        session['status'], len(session.get('results', [])),
+        budget.get('messages', 0), budget.get('prompt_tokens', 0), budget.get('completion_tokens', 0)
+    ))
+
 @revolutionary_relay_bp.route('/session-results/<session_id>', methods=['GET'])
 def get_session_results(session_id):
     """Get complete session results"""
     try:
-        if session_id not in active_sessions:
+        session = get_session(session_id)
+        if session is None:
             return jsonify({'status': 'error', 'message': 'Session not found'}), 404
         
-        session = active_sessions[session_id]
+        not_modified = http_cache.conditional(results_version(session))
+        if not_modified:
+            return not_modified
         
         return jsonify({
             'status': 'success',
             'session_id': session_id,
             'mode': session['mode'],
             'prompt': session['prompt'],
-            'results': session.get('results', []),
+            'results': result_dicts(session),
             'total_results': len(session.get('results', [])),
+            'context_budget': session.get('context_budget'),
+            'panel_outcome': session.get('panel_outcome'),
             'completed': session['status'] == 'completed',
             'created_at': session['created_at'],
             'completed_at': session.get('completed_at')
@@ -313,111 +792,189 @@ def get_session_results(session_id):
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def panel_response_html(agent_result):
+    """A panel agent's response, or a note that it was skipped"""
+    if agent_result.get('skipped'):
+        return '<em>Skipped: no response before the panel finished (deadline or quorum reached)</em>'
+    return html.escape(agent_result['response'])
+
+def render_html_report(session, results, generated_at):
+    """The session's report as a standalone HTML page (every session value is escaped)"""
+    def esc(value):
+        return html.escape(str(value))
+
+    mode_title = esc(session['mode'].replace('_', ' ').title())
+    html_report = f"""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>PromptLink Revolutionary AI Analysis Report</title>
+        <style>
+            body {{ font-family: 'Playfair Display', serif; background: #0a0f1c; color: #f8fafc; margin: 0; padding: 20px; }}
+            .container {{ max-width: 1200px; margin: 0 auto; }}
+            .header {{ text-align: center; margin-bottom: 40px; }}
+            .header h1 {{ color: #00d4aa; font-size: 2.5em; margin-bottom: 10px; }}
+            .header p {{ color: #cbd5e1; font-size: 1.2em; }}
+            .meta-info {{ background: rgba(15, 23, 42, 0.8); padding: 20px; border-radius: 10px; margin-bottom: 30px; }}
+            .result-card {{ background: rgba(15, 23, 42, 0.8); margin: 20px 0; padding: 25px; border-radius: 10px; border-left: 4px solid #00d4aa; }}
+            .agent-name {{ color: #00d4aa; font-size: 1.3em; font-weight: bold; margin-bottom: 5px; }}
+            .agent-specialty {{ color: #64748b; font-size: 0.9em; margin-bottom: 15px; }}
+            .response {{ line-height: 1.6; color: #f8fafc; white-space: pre-wrap; }}
+            .pair-header {{ color: #00d4aa; font-size: 1.5em; margin: 30px 0 15px 0; }}
+            .timestamp {{ color: #64748b; font-size: 0.8em; margin-top: 15px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>ð Revolutionary AI Analysis Report</h1>
+                <p>PromptLink {mode_title} Results</p>
+            </div>
+            
+            <div class="meta-info">
+                <h3>Session Information</h3>
+                <p><strong>Mode:</strong> {mode_title}</p>
+                <p><strong>Original Prompt:</strong> {esc(session['prompt'])}</p>
+                <p><strong>Total Results:</strong> {len(results)}</p>
+                <p><strong>Generated:</strong> {generated_at.strftime('%Y-%m-%d %H:%M:%S')} UTC</p>
+            </div>
+    """
+    
+    if session['mode'] == 'expert_panel':
+        for i, result in enumerate(results):
+            html_report += f"""
+            <div class="pair-header">Expert Pair {esc(result['pair_number'])}</div>
+            
+            <div class="result-card">
+                <div class="agent-name">{esc(result['agent_a']['name'])}</div>
+                <div class="agent-specialty">{esc(result['agent_a']['specialty'])}</div>
+                <div class="response">{panel_response_html(result['agent_a'])}</div>
+                <div class="timestamp">{esc(result['timestamp'])}</div>
+            </div>
+            
+            <div class="result-card">
+                <div class="agent-name">{esc(result['agent_b']['name'])}</div>
+                <div class="agent-specialty">{esc(result['agent_b']['specialty'])}</div>
+                <div class="response">{panel_response_html(result['agent_b'])}</div>
+                <div class="timestamp">{esc(result['timestamp'])}</div>
+            </div>
+            """
+    else:  # conference_chain
+        for i, result in enumerate(results):
+            html_report += f"""
+            <div class="result-card">
+                <div class="agent-name">Agent {esc(result['agent_number'])}: {esc(result['agent_name'])}</div>
+                <div class="agent-specialty">{esc(result['agent_specialty'])}</div>
+                <div class="response">{esc(result['response'])}</div>
+                <div class="timestamp">{esc(result['timestamp'])}</div>
+            </div>
+            """
+    
+    html_report += """
+        </div>
+    </body>
+    </html>
+    """
+    return html_report
+
+def publish_report(session_id, session):
+    """Render a completed session's report into its static artifact (None if it has no results)"""
+    results = result_dicts(session)
+    if not results:
+        return None
+    # Stamped with the completion time, so every render of the session is byte-identical
+    generated_at = datetime.fromisoformat(session.get('completed_at') or datetime.utcnow().isoformat())
+    html_report = render_html_report(session, results, generated_at)
+    with tracing.span('relay.report', bytes=len(html_report)):
+        report_artifacts.write(session_id, html_report)
+    return html_report
+
+def finish_session(session_id, session):
+    """Mark a session completed unless it was stopped, checkpoint it and publish its report"""
+    # A stopped session stays resumable from its checkpoints
+    if session.get('status') != 'stopped':
+        session['status'] = 'completed'
+        session['completed_at'] = datetime.utcnow().isoformat()
+    persist_session(session_id, session)
+    if session['status'] == 'completed':
+        try:
+            publish_report(session_id, session)
+        except Exception as e:
+            print(f"Report artifact failed for {session_id}: {e}")
+
 @revolutionary_relay_bp.route('/generate-html-report/<session_id>', methods=['GET'])
 def generate_html_report(session_id):
-    """Generate beautiful HTML report"""
+    """Generate beautiful HTML report (completed sessions come from their stored artifact)"""
     try:
-        if session_id not in active_sessions:
+        session = get_session(session_id)
+        if session is None:
             return jsonify({'status': 'error', 'message': 'Session not found'}), 404
         
-        session = active_sessions[session_id]
-        results = session.get('results', [])
+        html_report = None
+        if session['status'] == 'completed':
+            html_report = report_artifacts.read_html(session_id) or publish_report(session_id, session)
+        else:
+            results = result_dicts(session)
+            if results:
+                html_report = render_html_report(session, results, datetime.utcnow())
         
-        if not results:
+        if not html_report:
             return jsonify({'status': 'error', 'message': 'No results to generate report'}), 400
         
-        # Generate HTML report
-        html_report = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>PromptLink Revolutionary AI Analysis Report</title>
-            <style>
-                body {{ font-family: 'Playfair Display', serif; background: #0a0f1c; color: #f8fafc; margin: 0; padding: 20px; }}
-                .container {{ max-width: 1200px; margin: 0 auto; }}
-                .header {{ text-align: center; margin-bottom: 40px; }}
-                .header h1 {{ color: #00d4aa; font-size: 2.5em; margin-bottom: 10px; }}
-                .header p {{ color: #cbd5e1; font-size: 1.2em; }}
-                .meta-info {{ background: rgba(15, 23, 42, 0.8); padding: 20px; border-radius: 10px; margin-bottom: 30px; }}
-                .result-card {{ background: rgba(15, 23, 42, 0.8); margin: 20px 0; padding: 25px; border-radius: 10px; border-left: 4px solid #00d4aa; }}
-                .agent-name {{ color: #00d4aa; font-size: 1.3em; font-weight: bold; margin-bottom: 5px; }}
-                .agent-specialty {{ color: #64748b; font-size: 0.9em; margin-bottom: 15px; }}
-                .response {{ line-height: 1.6; color: #f8fafc; }}
-                .pair-header {{ color: #00d4aa; font-size: 1.5em; margin: 30px 0 15px 0; }}
-                .timestamp {{ color: #64748b; font-size: 0.8em; margin-top: 15px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>ð Revolutionary AI Analysis Report</h1>
-                    <p>PromptLink {session['mode'].replace('_', ' ').title()} Results</p>
-                </div>
-                
-                <div class="meta-info">
-                    <h3>Session Information</h3>
-                    <p><strong>Mode:</strong> {session['mode'].replace('_', ' ').title()}</p>
-                    <p><strong>Original Prompt:</strong> {session['prompt']}</p>
-                    <p><strong>Total Results:</strong> {len(results)}</p>
-                    <p><strong>Generated:</strong> {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC</p>
-                </div>
-        """
-        
-        if session['mode'] == 'expert_panel':
-            for i, result in enumerate(results):
-                html_report += f"""
-                <div class="pair-header">Expert Pair {result['pair_number']}</div>
-                
-                <div class="result-card">
-                    <div class="agent-name">{result['agent_a']['name']}</div>
-                    <div class="agent-specialty">{result['agent_a']['specialty']}</div>
-                    <div class="response">{result['agent_a']['response']}</div>
-                    <div class="timestamp">{result['timestamp']}</div>
-                </div>
-                
-                <div class="result-card">
-                    <div class="agent-name">{result['agent_b']['name']}</div>
-                    <div class="agent-specialty">{result['agent_b']['specialty']}</div>
-                    <div class="response">{result['agent_b']['response']}</div>
-                    <div class="timestamp">{result['timestamp']}</div>
-                </div>
-                """
-        else:  # conference_chain
-            for i, result in enumerate(results):
-                html_report += f"""
-                <div class="result-card">
-                    <div class="agent-name">Agent {result['agent_number']}: {result['agent_name']}</div>
-                    <div class="agent-specialty">{result['agent_specialty']}</div>
-                    <div class="response">{result['response']}</div>
-                    <div class="timestamp">{result['timestamp']}</div>
-                </div>
-                """
-        
-        html_report += """
-            </div>
-        </body>
-        </html>
-        """
-        
         return jsonify({
             'status': 'success',
             'html_report': html_report,
+            'report_url': f'{request.script_root}/api/revolutionary-relay/report/{session_id}' if session['status'] == 'completed' else None,
             'session_id': session_id
         })
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@revolutionary_relay_bp.route('/report/<session_id>', methods=['GET'])
+def download_report(session_id):
+    """A completed session's HTML report as a static file (gzip, ETag and Range aware)"""
+    try:
+        session = get_session(session_id)
+        if session is None:
+            return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        if session['status'] != 'completed':
+            return jsonify({'status': 'error', 'message': 'Report is available once the session completes'}), 409
+        
+        accept_gzip = request.accept_encodings['gzip'] > 0
+        stored = report_artifacts.variant(session_id, accept_gzip)
+        if stored is None:
+            # Completed before artifacts existed, or its artifact was pruned
+            if publish_report(session_id, session) is None:
+                return jsonify({'status': 'error', 'message': 'No results to generate report'}), 400
+            stored = report_artifacts.variant(session_id, accept_gzip)
+        
+        path, etag, encoding = stored
+        response = send_file(path, mimetype='text/html', etag=etag, conditional=True, max_age=3600)
+        # Model output is untrusted: render the page without scripts, forms or our origin
+        response.headers['Content-Security-Policy'] = 'sandbox'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @revolutionary_relay_bp.route('/stop-session/<session_id>', methods=['POST'])
 def stop_session(session_id):
     """Stop running session"""
     try:
-        if session_id not in active_sessions:
+        session = get_session(session_id)
+        if session is None:
             return jsonify({'status': 'error', 'message': 'Session not found'}), 404
         
-        active_sessions[session_id]['status'] = 'stopped'
+        session['status'] = 'stopped'
+        relay_scheduler.cancel(session_id)
+        relay_checkpoints.mark_stopped(session_id)
         
         return jsonify({
             'status': 'success',
@@ -428,13 +985,121 @@ def stop_session(session_id):
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@revolutionary_relay_bp.route('/session-trace/<session_id>', methods=['GET'])
+def get_session_trace(session_id):
+    """A session's timeline (start request, queueing, agents, upstream calls) as a waterfall"""
+    try:
+        session = get_session(session_id)
+        if session is None:
+            return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        
+        trace_id = session.get('trace_id')
+        if not trace_id:
+            return jsonify({'status': 'error', 'message': 'No trace recorded for this session'}), 404
+        
+        return jsonify({
+            'status': 'success',
+            'session_id': session_id,
+            'trace_id': trace_id,
+            'session_status': session['status'],
+            'trace': tracing.waterfall(tracing.load_trace(trace_id))
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@revolutionary_relay_bp.route('/resume-session/<session_id>', methods=['POST'])
+def resume_session_route(session_id):
+    """Resume an interrupted session from its last checkpointed agent or pair"""
+    try:
+        session = get_session(session_id)
+        if session is None:
+            return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        
+        if session['status'] == 'completed':
+            return jsonify({'status': 'error', 'message': 'Session already completed'}), 400
+        
+        # Still queued or running here, or heartbeated by another live process
+        if relay_scheduler.is_active(session_id) or not relay_checkpoints.claim(session_id):
+            return jsonify({'status': 'error', 'message': 'Session is still running'}), 409
+        
+        position, rejected = resume_session(session_id)
+        if rejected:
+            return rejected
+        
+        return jsonify({
+            'status': 'queued' if position else 'started',
+            'session_id': session_id,
+            'mode': session['mode'],
+            'resumed_from': len(session.get('results', [])),
+            'queue_position': position,
+            'message': 'Session resumed from its last checkpoint'
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@revolutionary_relay_bp.route('/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    """Relay scheduler capacity and queues, plus shared OpenRouter call counts"""
+    return jsonify({
+        'status': 'success',
+        'scheduler': relay_scheduler.stats(),
+        'openrouter': openrouter.stats()
+    })
+
+@revolutionary_relay_bp.route('/model-stats', methods=['GET'])
+def get_model_stats():
+    """Live latency, throughput and error rate per relay agent, and the adaptive policy's picks"""
+    try:
+        stats = model_stats.snapshot()
+        expected = expected_agent_seconds()
+        agents = []
+        for index, agent in enumerate(RELAY_AGENTS):
+            agent_stats = stats.get(agent['model'], {})
+            agents.append({
+                'id': agent['id'],
+                'name': agent['name'],
+                'model': agent['model'],
+                'specialty': agent['specialty'],
+                'latency_ms': round(agent_stats['latency_ms'], 1) if agent_stats.get('latency_ms') is not None else None,
+                'tokens_per_second': round(agent_stats['tokens_per_second'], 2) if agent_stats.get('tokens_per_second') is not None else None,
+                'error_rate': round(agent_stats['error_rate'], 4) if agent_stats.get('error_rate') is not None else None,
+                'calls': agent_stats.get('calls') or 0,
+                'errors': agent_stats.get('errors') or 0,
+                'expected_seconds': round(expected[index], 3),
+                'updated_at': agent_stats.get('updated_at')
+            })
+        
+        return jsonify({
+            'status': 'success',
+            'alpha': model_stats.ALPHA,
+            'agents': agents,
+            'adaptive': {
+                'conference_chain': [RELAY_AGENTS[index]['id'] for index in chain_agent_indexes(len(RELAY_AGENTS), 'adaptive')],
+                'expert_panel': [[RELAY_AGENTS[index]['id'] for index in pair] for pair in panel_pairs('adaptive')]
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+RELAY_AGENTS_VERSION = http_cache.content_version(RELAY_AGENTS)
+# The catalog response never changes, so its parts are encoded once
+RELAY_AGENTS_JSON = json_provider.preserialize(RELAY_AGENTS)
+CURRENT_RELAY_AGENTS_JSON = json_provider.preserialize(RELAY_AGENTS[:10])
+ADDITIONAL_RELAY_AGENTS_JSON = json_provider.preserialize(RELAY_AGENTS[10:])
+
 @revolutionary_relay_bp.route('/agents', methods=['GET'])
 def get_relay_agents():
     """Get all 20 relay agents"""
+    not_modified = http_cache.conditional(RELAY_AGENTS_VERSION)
+    if not_modified:
+        return not_modified
     return jsonify({
         'status': 'success',
-        'agents': RELAY_AGENTS,
+        'agents': RELAY_AGENTS_JSON,
         'total_agents': len(RELAY_AGENTS),
-        'current_working': RELAY_AGENTS[:10],
-        'revolutionary_additional': RELAY_AGENTS[10:]
+        'current_working': CURRENT_RELAY_AGENTS_JSON,
+        'revolutionary_additional': ADDITIONAL_RELAY_AGENTS_JSON
     })
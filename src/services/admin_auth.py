@@ -0,0 +1,20 @@
+# Admin access for operational endpoints (webhook inspection and replay).
+# Callers send ADMIN_TOKEN in the X-Admin-Token header; with no token
+# configured every admin request is refused.
+import hmac
+import os
+
+from flask import jsonify, request
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+ADMIN_HEADER = 'X-Admin-Token'
+
+def is_admin(token):
+    """True if token matches ADMIN_TOKEN (never true when no token is configured)"""
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def admin_error():
+    """403 response unless the request carries the admin token"""
+    if is_admin(request.headers.get(ADMIN_HEADER)):
+        return None
+    return jsonify({'status': 'error', 'message': f'{ADMIN_HEADER} header required'}), 403
@@ -0,0 +1,139 @@
+# Context-window budgeting for relay messages.
+# Token counts are estimated locally from UTF-8 length (no tokenizer round
+# trip), rounded up so the estimate errs towards "too big". Text that doesn't
+# fit is compacted by keeping its head and tail at sentence boundaries, with a
+# marker saying how much was dropped from the middle.
+import math
+import os
+import re
+
+# Conservative bytes-per-token for English-ish text on BPE tokenizers
+BYTES_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Share of a model's window that may be filled (headroom for estimator error)
+CONTEXT_BUDGET_FRACTION = float(os.getenv('CONTEXT_BUDGET_FRACTION', '0.9'))
+# Optional hard cap on input tokens for any model (0 = window-based only)
+CONTEXT_BUDGET_TOKENS = int(os.getenv('CONTEXT_BUDGET_TOKENS', '0'))
+# Optional cap on the original prompt carried after the first agent (0 = off:
+# it is only compacted when the message would not fit the model's window)
+CHAIN_PROMPT_CARRY_TOKENS = int(os.getenv('CHAIN_PROMPT_CARRY_TOKENS', '0'))
+# Smallest share of the budget kept for the previous insight when the prompt is long
+MIN_INSIGHT_SHARE = 0.5
+
+DEFAULT_CONTEXT_WINDOW = 8192
+HEAD_SHARE = 0.7
+
+_sentence_end = re.compile(r'[.!?\n]\s')
+
+def estimate_tokens(text):
+    """Estimated token count of a string"""
+    if not text:
+        return 0
+    return math.ceil(len(text.encode('utf-8')) / BYTES_PER_TOKEN)
+
+def input_budget(context_window, max_tokens, fixed_text=''):
+    """Tokens available for variable content once output and fixed text are reserved"""
+    budget = int((context_window or DEFAULT_CONTEXT_WINDOW) * CONTEXT_BUDGET_FRACTION) - max_tokens
+    if CONTEXT_BUDGET_TOKENS:
+        budget = min(budget, CONTEXT_BUDGET_TOKENS)
+    return max(budget - estimate_tokens(fixed_text) - 2 * MESSAGE_OVERHEAD_TOKENS, 0)
+
+def compact_text(text, max_tokens):
+    """Trim text to about max_tokens, keeping its head and tail"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # Work in characters scaled from the byte budget (multi-byte text gets less)
+    max_chars = int(max_tokens * BYTES_PER_TOKEN * len(text) / len(text.encode('utf-8')))
+    if max_chars <= 40:
+        return text[:max(max_chars, 0)]
+
+    head_chars = int(max_chars * HEAD_SHARE)
+    tail_chars = max_chars - head_chars - 40
+
+    # Cut at sentence ends when one is reasonably close to the limit, else at a word
+    head = text[:head_chars]
+    cut = max((match.end() for match in _sentence_end.finditer(head)), default=0)
+    if cut > head_chars * 0.6:
+        head = head[:cut]
+    elif ' ' in head:
+        head = head[:head.rindex(' ')]
+
+    tail = text[len(text) - tail_chars:] if tail_chars > 0 else ''
+    start = _sentence_end.search(tail)
+    if start and start.end() < len(tail) * 0.4:
+        tail = tail[start.end():]
+    elif ' ' in tail:
+        tail = tail[tail.index(' ') + 1:]
+
+    omitted = len(text) - len(head) - len(tail)
+    return f'{head.rstrip()}\n[... {omitted} characters omitted ...]\n{tail.lstrip()}'
+
+class SessionBudget:
+    """Accumulates what compaction saved, and the tokens actually billed, over one relay session"""
+
+    def __init__(self):
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+        self.compacted_messages = 0
+        self.messages = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @classmethod
+    def from_dict(cls, data):
+        """Continue counting from a saved to_dict() snapshot (None starts fresh)"""
+        budget = cls()
+        for key, value in (data or {}).items():
+            if hasattr(budget, key):
+                setattr(budget, key, value)
+        return budget
+
+    def record(self, original, sent):
+        """Count one message's original vs sent size"""
+        self.messages += 1
+        saved_bytes = len(original.encode('utf-8')) - len(sent.encode('utf-8'))
+        if saved_bytes > 0:
+            self.compacted_messages += 1
+            self.bytes_saved += saved_bytes
+            self.tokens_saved += estimate_tokens(original) - estimate_tokens(sent)
+
+    def record_usage(self, usage):
+        """Add one response's reported usage (prompt tokens read from the provider's cache included)"""
+        usage = usage or {}
+        self.prompt_tokens += usage.get('prompt_tokens') or 0
+        self.cached_prompt_tokens += ((usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0)
+        self.completion_tokens += usage.get('completion_tokens') or 0
+
+    def to_dict(self):
+        return {
+            'messages': self.messages,
+            'compacted_messages': self.compacted_messages,
+            'bytes_saved': self.bytes_saved,
+            'tokens_saved': self.tokens_saved,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_prompt_tokens': self.cached_prompt_tokens,
+            'completion_tokens': self.completion_tokens
+        }
+
+def fit_chain_parts(prompt, insight, context_window, max_tokens, fixed_text='', carry_prompt=True):
+    """Compact (prompt, insight) so a chain message fits the model's budget"""
+    budget = input_budget(context_window, max_tokens, fixed_text)
+
+    # When the message doesn't fit, the carried prompt is capped by the window
+    # alone, not by the insight, so it compacts the same way for every agent
+    # with the same window and stays a stable, cacheable message prefix; the
+    # insight gets whatever the prompt leaves over
+    prompt_cap = budget
+    if carry_prompt:
+        if estimate_tokens(prompt) + estimate_tokens(insight) > budget:
+            prompt_cap = int(budget * (1 - MIN_INSIGHT_SHARE))
+        if CHAIN_PROMPT_CARRY_TOKENS:
+            prompt_cap = min(prompt_cap, CHAIN_PROMPT_CARRY_TOKENS)
+
+    prompt = compact_text(prompt, prompt_cap)
+    if insight:
+        insight = compact_text(insight, budget - estimate_tokens(prompt))
+    return prompt, insight
@@ -0,0 +1,64 @@
+# Response compression and conditional GETs for the JSON APIs.
+# Endpoints that poll or serve catalogs declare a content version: a cheap
+# string that changes whenever their body would (a catalog's digest taken once
+# at import, a relay session's status and result count). The version becomes a
+# weak ETag, so a matching If-None-Match is answered with 304 before the body
+# is even built, and no response body is ever hashed. Weak, because the gzip
+# and identity encodings of one version share it.
+# finalize() runs on every response (registered in main.py): it adds the ETag
+# and gzips compressible bodies over HTTP_GZIP_MIN_BYTES for clients that
+# accept it. Streamed and file responses (which set their own encoding and
+# validators) pass through untouched.
+import gzip
+import hashlib
+import json
+import os
+
+from flask import g, request, make_response
+
+HTTP_GZIP_MIN_BYTES = int(os.getenv('HTTP_GZIP_MIN_BYTES', '1024'))
+HTTP_GZIP_LEVEL = min(max(int(os.getenv('HTTP_GZIP_LEVEL', '5')), 1), 9)
+HTTP_GZIP_ENABLED = os.getenv('HTTP_GZIP_ENABLED', 'true').lower() != 'false'
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/csv')
+
+def content_version(value):
+    """Version of static content (a catalog): a short digest, computed once by the caller"""
+    body = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+
+def conditional(version):
+    """Tag this response with a content version; returns a 304 response if the client already has it
+
+    Call before building the body:
+        not_modified = http_cache.conditional(version)
+        if not_modified:
+            return not_modified
+    """
+    g.content_version = str(version)
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains_weak(g.content_version):
+        return make_response('', 304)
+    return None
+
+def finalize(response):
+    """Add the weak ETag of a versioned response, and gzip it when worthwhile"""
+    version = g.get('content_version')
+    if version is not None and response.status_code in (200, 304):
+        response.set_etag(version, weak=True)
+        # Cacheable, but always revalidated (the 304 costs almost nothing)
+        response.headers.setdefault('Cache-Control', 'no-cache')
+
+    if response.status_code == 200 and response.mimetype in COMPRESSIBLE_MIMETYPES:
+        response.vary.add('Accept-Encoding')
+        if should_compress(response):
+            body = gzip.compress(response.get_data(), compresslevel=HTTP_GZIP_LEVEL)
+            response.set_data(body)
+            response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def should_compress(response):
+    if not HTTP_GZIP_ENABLED or request.accept_encodings['gzip'] <= 0:
+        return False
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return False
+    return (response.content_length or 0) >= HTTP_GZIP_MIN_BYTES
@@ -0,0 +1,101 @@
+# Fast JSON encoding for Flask responses and streamed exports.
+# FastJSONProvider (installed on the app in main.py) encodes with orjson when
+# it is installed and with the stdlib json module otherwise (JSON_ENCODER=
+# auto|orjson|stdlib). Output keeps Flask's conventions (sorted keys, dates
+# as HTTP dates, __html__ objects as strings), except that orjson writes
+# non-ASCII text as UTF-8 rather than \u escapes. Values that never change
+# (the agent catalogs, the plans) can be wrapped with preserialize() once at
+# import: their encoded bytes are then spliced into every response that
+# contains them instead of being re-encoded.
+import json
+import os
+import re
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pinned in requirements.txt; without it encoding falls back to the stdlib
+    orjson = None
+
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto').lower()
+USE_ORJSON = orjson is not None and JSON_ENCODER in ('auto', 'orjson')
+
+# Stands in for a pre-serialized value while the rest of the document is
+# encoded; random per process so no real string can collide with it
+_MARKER = f'__preserialized_{uuid.uuid4().hex}_'
+_marker_pattern = re.compile(rb'"' + re.escape(_MARKER.encode('ascii')) + rb'(\d+)"')
+
+class PreSerialized:
+    """A value encoded once, embedded verbatim wherever it appears in a document"""
+    __slots__ = ('raw',)
+
+    def __init__(self, value):
+        self.raw = encode(value)
+
+def preserialize(value):
+    return PreSerialized(value)
+
+def backend():
+    return 'orjson' if USE_ORJSON else 'stdlib'
+
+def encode(value, indent=False, sort_keys=True):
+    """Serialize to UTF-8 JSON bytes (compact unless indent)"""
+    fragments = []
+
+    def default(obj):
+        if isinstance(obj, PreSerialized):
+            fragments.append(obj.raw)
+            return f'{_MARKER}{len(fragments) - 1}'
+        return DefaultJSONProvider.default(obj)
+
+    body = None
+    if USE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            body = orjson.dumps(value, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # Beyond orjson's range (e.g. integers over 64 bits): let the stdlib try
+            fragments.clear()
+    if body is None:
+        body = json.dumps(
+            value, default=default, sort_keys=sort_keys,
+            indent=2 if indent else None, separators=None if indent else (',', ':')
+        ).encode('utf-8')
+
+    if fragments:
+        body = _marker_pattern.sub(lambda match: fragments[int(match.group(1))], body)
+    return body
+
+def dumps(value):
+    """Compact, unsorted JSON text (for streamed rows)"""
+    return encode(value, sort_keys=False).decode('utf-8')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by encode() (orjson when available)"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'indent', 'sort_keys', 'separators'}:
+            # Options only the stdlib understands (cls, default, ...)
+            kwargs.setdefault('default', self.default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return encode(obj, indent=bool(kwargs.get('indent')), sort_keys=kwargs.get('sort_keys', self.sort_keys)).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if USE_ORJSON and not kwargs:
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError (and ValueError)
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = encode(obj, indent=indent, sort_keys=self.sort_keys)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,229 @@
+# Sharded SQLite learning store for the Human Simulator.
+# Users are partitioned across HUMAN_SIMULATOR_DB_SHARDS files by a stable hash
+# of user_id, so writers for different users don't share one database lock.
+# Each shard has a small pool of reusable connections. With one shard the
+# store is the original single human_simulator_learning.db file.
+#
+# Rebalance offline (app stopped), then restart with the new shard count:
+#     cd src && python -m services.learning_store rebalance --from 1 --to 4
+import argparse
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Base path (absolute, so it doesn't depend on the working directory)
+LEARNING_DB_PATH = os.path.abspath(os.getenv(
+    'HUMAN_SIMULATOR_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'human_simulator_learning.db')
+))
+SHARD_COUNT = max(1, int(os.getenv('HUMAN_SIMULATOR_DB_SHARDS', '1')))
+POOL_SIZE = int(os.getenv('HUMAN_SIMULATOR_DB_POOL_SIZE', '8'))
+CONNECT_TIMEOUT = 30
+
+# Schema/seed callbacks, run once per shard on first use: fn(conn, shard)
+_initializers = []
+_ready_shards = set()
+_init_lock = threading.Lock()
+
+# Pools are per process; a forked worker starts with fresh ones
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+def register_initializer(initializer):
+    """Run `initializer(conn, shard)` the first time each shard is used"""
+    _initializers.append(initializer)
+    return initializer
+
+def shard_path(shard, shard_count=None):
+    """File path of one shard for a given shard count"""
+    shard_count = SHARD_COUNT if shard_count is None else shard_count
+    if shard_count == 1:
+        return LEARNING_DB_PATH
+    root, ext = os.path.splitext(LEARNING_DB_PATH)
+    return f'{root}.shard-{shard}-of-{shard_count}{ext or ".db"}'
+
+def shard_for(user_id, shard_count=None):
+    """Stable shard number for a user (same on every process and restart)"""
+    shard_count = SHARD_COUNT if shard_count is None else shard_count
+    if shard_count == 1:
+        return 0
+    digest = hashlib.blake2b(str(user_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+def open_connection(shard, shard_count=None):
+    """Open a new (unpooled) connection to a shard"""
+    conn = sqlite3.connect(shard_path(shard, shard_count), timeout=CONNECT_TIMEOUT, check_same_thread=False)
+    # WAL (set at init) lets readers run during writes; NORMAL syncs at checkpoints, not every commit
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+def ensure_shard(shard):
+    """Create and seed a shard once per process"""
+    if shard in _ready_shards:
+        return
+    with _init_lock:
+        if shard in _ready_shards:
+            return
+        conn = open_connection(shard)
+        try:
+            for initializer in _initializers:
+                initializer(conn, shard)
+        finally:
+            conn.close()
+        _ready_shards.add(shard)
+
+def _pool(shard):
+    """Connection pool for a shard in this process"""
+    global _pools, _pools_pid
+
+    pid = os.getpid()
+    if _pools_pid != pid:
+        with _pools_lock:
+            if _pools_pid != pid:
+                _pools = {}
+                _pools_pid = pid
+    pool = _pools.get(shard)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(shard, queue.LifoQueue(maxsize=POOL_SIZE))
+    return pool
+
+@contextmanager
+def connect_shard(shard):
+    """Borrow a pooled connection to one shard"""
+    ensure_shard(shard)
+    pool = _pool(shard)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection(shard)
+
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def connect(user_id):
+    """Borrow a pooled connection to the shard holding a user's data"""
+    return connect_shard(shard_for(user_id))
+
+def map_shards(fn):
+    """Run `fn(conn, shard)` on every shard in parallel; results in shard order"""
+    def run(shard):
+        with connect_shard(shard) as conn:
+            return fn(conn, shard)
+
+    if SHARD_COUNT == 1:
+        return [run(0)]
+    with ThreadPoolExecutor(max_workers=min(SHARD_COUNT, 8)) as executor:
+        return list(executor.map(run, range(SHARD_COUNT)))
+
+def shard_stats(conn, shard):
+    """Row counts and file size for one shard"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    tables = [row[0] for row in cursor.fetchall()]
+    counts = {}
+    for table in tables:
+        cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+        counts[table] = cursor.fetchone()[0]
+    path = shard_path(shard)
+    return {
+        'shard': shard,
+        'path': path,
+        'size_bytes': os.path.getsize(path) if os.path.exists(path) else 0,
+        'rows': counts
+    }
+
+def _table_columns(conn):
+    """Map table name -> column names for every table in a database"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    tables = {}
+    for (table,) in cursor.fetchall():
+        cursor.execute(f'PRAGMA table_info("{table}")')
+        columns = [row[1] for row in cursor.fetchall()]
+        tables[table] = columns
+    return tables
+
+def rebalance(source_count, target_count, batch_size=5000):
+    """Copy every row from `source_count` shard files into `target_count` shard files"""
+    # Rows with a user_id are routed by shard_for(); other rows (store metadata)
+    # go to every target. Source files are left untouched for verification.
+    if source_count == target_count:
+        raise ValueError('Source and target shard counts are the same')
+
+    targets = [sqlite3.connect(shard_path(shard, target_count)) for shard in range(target_count)]
+    moved = {}
+    try:
+        for source_shard in range(source_count):
+            source = sqlite3.connect(shard_path(source_shard, source_count))
+            try:
+                # Recreate the schema (tables and indexes) on every target
+                schema = source.execute('''
+                    SELECT sql FROM sqlite_master
+                    WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                    ORDER BY CASE type WHEN 'table' THEN 0 ELSE 1 END
+                ''').fetchall()
+                for target in targets:
+                    target.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    target.execute('PRAGMA journal_mode = WAL')
+                    for (sql,) in schema:
+                        target.execute(sql.replace('CREATE TABLE ', 'CREATE TABLE IF NOT EXISTS ', 1)
+                                          .replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1))
+                    target.commit()
+
+                for table, columns in _table_columns(source).items():
+                    # Autoincrement ids are reassigned by the target to avoid collisions
+                    copy_columns = [column for column in columns if column != 'id']
+                    column_list = ', '.join(f'"{column}"' for column in copy_columns)
+                    placeholders = ', '.join('?' for _ in copy_columns)
+                    insert_sql = f'INSERT OR IGNORE INTO "{table}" ({column_list}) VALUES ({placeholders})'
+                    user_index = copy_columns.index('user_id') if 'user_id' in copy_columns else None
+
+                    cursor = source.execute(f'SELECT {column_list} FROM "{table}" ORDER BY rowid')
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        if user_index is None:
+                            for target in targets:
+                                target.executemany(insert_sql, rows)
+                        else:
+                            routed = {}
+                            for row in rows:
+                                routed.setdefault(shard_for(row[user_index], target_count), []).append(row)
+                            for shard, shard_rows in routed.items():
+                                targets[shard].executemany(insert_sql, shard_rows)
+                        for target in targets:
+                            target.commit()
+                        moved[table] = moved.get(table, 0) + len(rows)
+            finally:
+                source.close()
+    finally:
+        for target in targets:
+            target.close()
+    return moved
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Human Simulator learning store tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    rebalance_parser = subcommands.add_parser('rebalance', help='move users from N shard files to M shard files')
+    rebalance_parser.add_argument('--from', dest='source_count', type=int, required=True)
+    rebalance_parser.add_argument('--to', dest='target_count', type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == 'rebalance':
+        for table, count in rebalance(args.source_count, args.target_count).items():
+            print(f'{table}: {count} rows copied')
+        print(f'Done. Restart with HUMAN_SIMULATOR_DB_SHARDS={args.target_count} once verified.')
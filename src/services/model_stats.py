@@ -0,0 +1,144 @@
+# Live per-model performance, learned from every upstream OpenRouter call.
+# Each call updates its model's exponentially weighted moving averages:
+# latency (successful calls), output tokens per second and error rate. Stats
+# are kept in memory and written to the relay store at most every
+# MODEL_STATS_FLUSH_SECONDS, so they survive restarts. Each process writes the
+# models it called since its last flush and adopts other processes' numbers
+# for the rest. The relay's adaptive agent policy ranks agents with
+# expected_seconds().
+import os
+import threading
+import time
+
+from services import relay_checkpoints
+
+# Weight of the newest sample in each moving average
+ALPHA = min(max(float(os.getenv('MODEL_STATS_ALPHA', '0.2')), 0.01), 1.0)
+FLUSH_SECONDS = float(os.getenv('MODEL_STATS_FLUSH_SECONDS', '30'))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS model_stats (
+        model TEXT PRIMARY KEY,
+        latency_ms REAL,
+        tokens_per_second REAL,
+        error_rate REAL,
+        calls INTEGER,
+        errors INTEGER,
+        updated_at REAL
+    )
+'''
+FIELDS = ('latency_ms', 'tokens_per_second', 'error_rate', 'calls', 'errors', 'updated_at')
+
+# model -> {field: value}; models changed since the last flush are dirty
+_stats = {}
+_dirty = set()
+_lock = threading.Lock()
+_loaded_pid = None
+_last_flush = 0.0
+_flushing = threading.Lock()
+
+def _ewma(previous, sample):
+    return sample if previous is None else previous + ALPHA * (sample - previous)
+
+def _ensure_loaded():
+    """Read persisted stats once per process (after a fork, the child reloads)"""
+    global _loaded_pid, _last_flush
+
+    if _loaded_pid == os.getpid():
+        return
+    with _lock:
+        if _loaded_pid == os.getpid():
+            return
+        try:
+            rows = _read_rows()
+        except Exception as e:
+            print(f"Model stats load failed: {e}")
+            rows = []
+        _stats.clear()
+        _dirty.clear()
+        for row in rows:
+            _stats[row[0]] = dict(zip(FIELDS, row[1:]))
+        _loaded_pid = os.getpid()
+        _last_flush = time.monotonic()
+
+def _read_rows():
+    with relay_checkpoints.connect() as conn:
+        conn.execute(SCHEMA)
+        return conn.execute(f'SELECT model, {", ".join(FIELDS)} FROM model_stats').fetchall()
+
+def record_call(model, seconds, completion_tokens=None, failed=False):
+    """Fold one upstream call into the model's moving averages"""
+    _ensure_loaded()
+    with _lock:
+        stats = _stats.setdefault(model, dict.fromkeys(FIELDS))
+        stats['calls'] = (stats['calls'] or 0) + 1
+        stats['error_rate'] = _ewma(stats['error_rate'], 1.0 if failed else 0.0)
+        if failed:
+            stats['errors'] = (stats['errors'] or 0) + 1
+        else:
+            # A failure's duration says nothing about generation speed
+            stats['latency_ms'] = _ewma(stats['latency_ms'], seconds * 1000)
+            if completion_tokens and seconds > 0:
+                stats['tokens_per_second'] = _ewma(stats['tokens_per_second'], completion_tokens / seconds)
+        stats['updated_at'] = time.time()
+        _dirty.add(model)
+        due = time.monotonic() - _last_flush >= FLUSH_SECONDS
+    if due:
+        flush()
+
+def flush():
+    """Write this process's changed models and pick up everyone else's"""
+    global _last_flush
+
+    _ensure_loaded()
+    if not _flushing.acquire(blocking=False):
+        return
+    try:
+        with _lock:
+            changed = {model: dict(_stats[model]) for model in _dirty}
+            _dirty.clear()
+            _last_flush = time.monotonic()
+        try:
+            with relay_checkpoints.connect() as conn:
+                conn.execute(SCHEMA)
+                conn.executemany(f'''
+                    INSERT OR REPLACE INTO model_stats (model, {", ".join(FIELDS)})
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [(model,) + tuple(stats[field] for field in FIELDS) for model, stats in changed.items()])
+                conn.commit()
+                rows = conn.execute(f'SELECT model, {", ".join(FIELDS)} FROM model_stats').fetchall()
+        except Exception as e:
+            print(f"Model stats flush failed: {e}")
+            with _lock:
+                _dirty.update(changed)
+            return
+        with _lock:
+            for row in rows:
+                if row[0] not in _dirty:
+                    _stats[row[0]] = dict(zip(FIELDS, row[1:]))
+    finally:
+        _flushing.release()
+
+def snapshot():
+    """Current stats of every model seen, by model"""
+    _ensure_loaded()
+    with _lock:
+        return {model: dict(stats) for model, stats in _stats.items()}
+
+def expected_seconds(model, default_seconds=None):
+    """Expected seconds per successful answer: latency (default_seconds before any success) over the success rate"""
+    _ensure_loaded()
+    with _lock:
+        stats = _stats.get(model) or {}
+        latency_ms = stats.get('latency_ms')
+        if latency_ms is None:
+            if default_seconds is None:
+                return None
+            latency_ms = default_seconds * 1000
+        return latency_ms / 1000 / (1 - min(stats.get('error_rate') or 0.0, 0.95))
+
+def error_rate(model):
+    _ensure_loaded()
+    with _lock:
+        stats = _stats.get(model)
+        return (stats or {}).get('error_rate') or 0.0
@@ -0,0 +1,213 @@
+# Shared OpenRouter chat-completions client with single-flight coalescing.
+# Identical concurrent requests (same model, messages and sampling settings)
+# share one upstream call: the first caller starts it, later callers attach to
+# the same future, and everyone gets its result or its exception. Each caller
+# waits with its own timeout; giving up doesn't cancel the call for the others.
+# submit_completion() returns a handle instead of blocking; cancelling the last
+# handle on a call cancels it if it hasn't been sent yet, or abandons it.
+# Every request asks for usage accounting, so prompt tokens served from the
+# provider's prompt cache are counted alongside the totals.
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from services import model_stats
+from services import tracing
+
+OPENROUTER_URL = 'https://openrouter.ai/api/v1/chat/completions'
+UPSTREAM_TIMEOUT = float(os.getenv('OPENROUTER_TIMEOUT', '120'))
+MAX_CONCURRENT_CALLS = int(os.getenv('OPENROUTER_MAX_CONCURRENT_CALLS', '64'))
+
+class OpenRouterError(Exception):
+    """Non-200 response from OpenRouter"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f'{status_code} - {text}')
+        self.status_code = status_code
+        self.text = text
+
+# request key -> Future of the in-flight upstream call
+_in_flight = {}
+_in_flight_lock = threading.RLock()  # re-entered by done callbacks that fire immediately
+# request key -> handles still interested in the in-flight call
+_waiters = {}
+_executor = None
+_stats = {
+    'upstream_calls': 0, 'coalesced_calls': 0, 'cancelled_calls': 0, 'abandoned_calls': 0,
+    'prompt_tokens': 0, 'cached_prompt_tokens': 0, 'completion_tokens': 0
+}
+
+# One keep-alive HTTP session per executor thread
+_local = threading.local()
+
+def request_key(payload):
+    """Stable key for a request body (dict key order doesn't matter)"""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+def _session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+def _post(payload, title):
+    """Make the upstream call and return the decoded response body"""
+    started = time.monotonic()
+    try:
+        data = _request(payload, title)
+    except Exception:
+        model_stats.record_call(payload['model'], time.monotonic() - started, failed=True)
+        raise
+    usage = data.get('usage') or {}
+    model_stats.record_call(payload['model'], time.monotonic() - started, usage.get('completion_tokens'))
+    with _in_flight_lock:
+        _stats['prompt_tokens'] += usage.get('prompt_tokens') or 0
+        _stats['cached_prompt_tokens'] += cached_tokens(usage)
+        _stats['completion_tokens'] += usage.get('completion_tokens') or 0
+    return data
+
+def _request(payload, title):
+    with tracing.span('openrouter.http', model=payload['model']) as http_span:
+        response = _session().post(
+            OPENROUTER_URL,
+            headers={
+                'Authorization': f'Bearer {os.getenv("OPENROUTER_API_KEY")}',
+                'Content-Type': 'application/json',
+                'HTTP-Referer': 'https://thepromptlink.netlify.app',
+                'X-Title': title
+            },
+            json=payload,
+            timeout=UPSTREAM_TIMEOUT
+        )
+        # Without streaming the model generates before the headers arrive, so
+        # time-to-headers is TTFB + generation; the rest is download and decode
+        http_span.attrs['status'] = response.status_code
+        http_span.attrs['headers_ms'] = round(response.elapsed.total_seconds() * 1000, 3)
+        if response.status_code != 200:
+            raise OpenRouterError(response.status_code, response.text)
+        decode_started = time.monotonic()
+        data = response.json()
+        tracing.record_span('openrouter.decode', decode_started, time.monotonic(), bytes=len(response.content))
+        usage = data.get('usage') or {}
+        http_span.attrs['prompt_tokens'] = usage.get('prompt_tokens')
+        http_span.attrs['completion_tokens'] = usage.get('completion_tokens')
+        http_span.attrs['cached_tokens'] = cached_tokens(usage)
+        return data
+
+def cached_tokens(usage):
+    """Prompt tokens the provider read from its prompt cache (0 if not reported)"""
+    details = (usage or {}).get('prompt_tokens_details') or {}
+    return details.get('cached_tokens') or 0
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _in_flight_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS, thread_name_prefix='openrouter')
+    return _executor
+
+class PendingCompletion:
+    """One caller's handle on a (possibly shared) upstream call"""
+    __slots__ = ('key', 'future', 'coalesced', 'cancelled')
+
+    def __init__(self, key, future, coalesced):
+        self.key = key
+        self.future = future
+        self.coalesced = coalesced
+        self.cancelled = False
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """The decoded response body (raises like chat_completion)"""
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """Stop waiting; the call itself is cancelled once no other caller wants it
+
+        A call not sent yet is dropped from the executor queue. One already on
+        the wire can't be interrupted (requests has no abort), so it is
+        abandoned: it finishes in the background and its result is discarded.
+        Returns True if the upstream call was cancelled.
+        """
+        with _in_flight_lock:
+            if self.cancelled or self.future.done():
+                return False
+            self.cancelled = True
+            remaining = _waiters.get(self.key, 1) - 1
+            _waiters[self.key] = remaining
+            if remaining > 0:
+                return False
+            if self.future.cancel():
+                _stats['cancelled_calls'] += 1
+                return True
+            _stats['abandoned_calls'] += 1
+            return False
+
+def submit_completion(model, messages, max_tokens=2000, temperature=0.7,
+                      title='PromptLink AI Collaboration'):
+    """Start a chat completion (or join an identical one in flight) without waiting"""
+    payload = {
+        'model': model,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+        'usage': {'include': True}
+    }
+    key = request_key(payload)
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        coalesced = future is not None
+        if future is None:
+            # The upstream call runs in the first caller's trace
+            future = _get_executor().submit(contextvars.copy_context().run, _post, payload, title)
+            _in_flight[key] = future
+            _stats['upstream_calls'] += 1
+            # Once settled, the next identical request makes a fresh call
+            future.add_done_callback(lambda done, key=key: _settle(key, done))
+        else:
+            _stats['coalesced_calls'] += 1
+        _waiters[key] = _waiters.get(key, 0) + 1
+    return PendingCompletion(key, future, coalesced)
+
+def chat_completion(model, messages, max_tokens=2000, temperature=0.7,
+                    title='PromptLink AI Collaboration', timeout=None):
+    """POST a chat completion, sharing the call with identical in-flight requests"""
+    # Raises OpenRouterError on a non-200 response, concurrent.futures.TimeoutError
+    # if this caller's timeout passes first, or whatever the request raised
+    with tracing.span('openrouter.call', model=model) as call_span:
+        pending = submit_completion(model, messages, max_tokens, temperature, title)
+        call_span.attrs['coalesced'] = pending.coalesced
+        return pending.result(timeout)
+
+def _settle(key, future):
+    with _in_flight_lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+            _waiters.pop(key, None)
+
+def completion_text(response_data):
+    """Assistant message text from a chat-completions response body"""
+    return response_data['choices'][0]['message']['content']
+
+def content_text(content):
+    """Text of a message's content, whether a string or a list of content parts"""
+    if isinstance(content, str):
+        return content
+    return ''.join(part.get('text', '') for part in content)
+
+def stats():
+    """Upstream vs coalesced call counts, token totals and calls currently in flight"""
+    with _in_flight_lock:
+        return dict(_stats, in_flight=len(_in_flight))
@@ -0,0 +1,203 @@
+# Rolling compaction of raw user_patterns into per-(user, pattern_type) aggregates.
+# Raw rows older than the retention window (or the oldest rows, while the
+# store is over its size budget) are folded into user_pattern_aggregates and
+# deleted, so hot reads scan a small table instead of the full history.
+import json
+import math
+import os
+from datetime import datetime, timedelta
+
+RAW_RETENTION_DAYS = float(os.getenv('PATTERN_RAW_RETENTION_DAYS', '30'))
+DECAY_HALF_LIFE_DAYS = float(os.getenv('PATTERN_DECAY_HALF_LIFE_DAYS', '30'))
+SIZE_BUDGET_BYTES = int(float(os.getenv('LEARNING_DB_SIZE_BUDGET_MB', '1024')) * 1024 * 1024)
+COMPACTION_INTERVAL = float(os.getenv('PATTERN_COMPACTION_INTERVAL', '3600'))
+EXEMPLARS_PER_AGGREGATE = int(os.getenv('PATTERN_EXEMPLARS', '5'))
+COMPACTION_BATCH_SIZE = 5000
+
+# Raw rows that are never folded by the size budget (only by retention)
+MIN_RAW_PATTERNS = 1000
+
+EXEMPLAR_TEXT_LIMIT = 500
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+AGGREGATES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS user_pattern_aggregates (
+        user_id TEXT NOT NULL,
+        pattern_type TEXT NOT NULL,
+        pattern_count INTEGER DEFAULT 0,
+        confidence_sum REAL DEFAULT 0,
+        decayed_confidence REAL DEFAULT 0,
+        decayed_sum REAL DEFAULT 0,
+        decay_weight REAL DEFAULT 0,
+        decayed_at REAL,
+        exemplars TEXT,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, pattern_type)
+    )
+'''
+
+def parse_timestamp(value):
+    """Return epoch seconds for a SQLite CURRENT_TIMESTAMP string"""
+    try:
+        return (datetime.strptime(value, TIMESTAMP_FORMAT) - datetime(1970, 1, 1)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+def as_confidence(value):
+    """Coerce a stored confidence score to a float (client-supplied, so untrusted)"""
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return 0.5
+    return confidence if math.isfinite(confidence) else 0.5
+
+def used_bytes(conn):
+    """Bytes of the database file actually holding data (excludes free pages)"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return (page_count - freelist_count) * page_size
+
+def merge_aggregate(aggregate, rows, now):
+    """Fold raw (confidence, created_ts, pattern_data, created_at) rows into an aggregate dict"""
+    half_life = DECAY_HALF_LIFE_DAYS * 86400
+
+    # Bring the stored decayed sums forward to `now` before adding new rows
+    if aggregate['decayed_at'] is not None:
+        factor = 0.5 ** (max(now - aggregate['decayed_at'], 0) / half_life)
+        aggregate['decayed_sum'] *= factor
+        aggregate['decay_weight'] *= factor
+    aggregate['decayed_at'] = now
+
+    exemplars = aggregate['exemplars']
+    for confidence, created_ts, pattern_data, created_at in rows:
+        weight = 0.5 ** (max(now - (created_ts or now), 0) / half_life)
+        aggregate['decayed_sum'] += weight * confidence
+        aggregate['decay_weight'] += weight
+        aggregate['pattern_count'] += 1
+        aggregate['confidence_sum'] += confidence
+
+        if created_at:
+            if not aggregate['first_seen'] or created_at < aggregate['first_seen']:
+                aggregate['first_seen'] = created_at
+            if not aggregate['last_seen'] or created_at > aggregate['last_seen']:
+                aggregate['last_seen'] = created_at
+
+        try:
+            pattern = json.loads(pattern_data)
+        except (TypeError, ValueError):
+            pattern = {}
+        exemplars.append({
+            'user_response': (pattern.get('user_response') or '')[:EXEMPLAR_TEXT_LIMIT],
+            'ai_response': (pattern.get('ai_response') or '')[-EXEMPLAR_TEXT_LIMIT:],
+            'confidence': confidence,
+            'timestamp': created_at
+        })
+
+    # Keep the highest-confidence, most recent exemplars
+    exemplars.sort(key=lambda exemplar: (exemplar['confidence'], exemplar['timestamp'] or ''), reverse=True)
+    del exemplars[EXEMPLARS_PER_AGGREGATE:]
+
+    if aggregate['decay_weight'] > 0:
+        aggregate['decayed_confidence'] = aggregate['decayed_sum'] / aggregate['decay_weight']
+    elif aggregate['pattern_count']:
+        aggregate['decayed_confidence'] = aggregate['confidence_sum'] / aggregate['pattern_count']
+    return aggregate
+
+def load_aggregate(cursor, user_id, pattern_type):
+    """Read one aggregate row as a dict (empty aggregate if missing)"""
+    cursor.execute('''
+        SELECT pattern_count, confidence_sum, decayed_confidence, decayed_sum,
+               decay_weight, decayed_at, exemplars, first_seen, last_seen
+        FROM user_pattern_aggregates
+        WHERE user_id = ? AND pattern_type = ?
+    ''', (user_id, pattern_type))
+    row = cursor.fetchone()
+    if row is None:
+        return {
+            'pattern_count': 0, 'confidence_sum': 0.0, 'decayed_confidence': 0.0,
+            'decayed_sum': 0.0, 'decay_weight': 0.0, 'decayed_at': None,
+            'exemplars': [], 'first_seen': None, 'last_seen': None
+        }
+    return {
+        'pattern_count': row[0], 'confidence_sum': row[1], 'decayed_confidence': row[2],
+        'decayed_sum': row[3], 'decay_weight': row[4], 'decayed_at': row[5],
+        'exemplars': json.loads(row[6] or '[]'), 'first_seen': row[7], 'last_seen': row[8]
+    }
+
+def fold_rows(conn, rows, now):
+    """Fold a batch of raw pattern rows into aggregates and delete them, in one transaction"""
+    groups = {}
+    for row_id, user_id, pattern_type, pattern_data, confidence, created_at in rows:
+        groups.setdefault((user_id, pattern_type or ''), []).append(
+            (as_confidence(confidence), parse_timestamp(created_at), pattern_data, created_at)
+        )
+
+    cursor = conn.cursor()
+    for (user_id, pattern_type), group in groups.items():
+        aggregate = merge_aggregate(load_aggregate(cursor, user_id, pattern_type), group, now)
+        cursor.execute('''
+            INSERT OR REPLACE INTO user_pattern_aggregates
+            (user_id, pattern_type, pattern_count, confidence_sum, decayed_confidence,
+             decayed_sum, decay_weight, decayed_at, exemplars, first_seen, last_seen, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (
+            user_id, pattern_type, aggregate['pattern_count'], aggregate['confidence_sum'],
+            aggregate['decayed_confidence'], aggregate['decayed_sum'], aggregate['decay_weight'],
+            aggregate['decayed_at'], json.dumps(aggregate['exemplars']),
+            aggregate['first_seen'], aggregate['last_seen']
+        ))
+
+    cursor.executemany('DELETE FROM user_patterns WHERE id = ?', [(row[0],) for row in rows])
+    conn.commit()
+    return len(groups)
+
+def compact_patterns(conn, retention_days=None, size_budget_bytes=None, now=None):
+    """Run one compaction pass; returns counts of what was folded"""
+    retention_days = RAW_RETENTION_DAYS if retention_days is None else retention_days
+    size_budget_bytes = SIZE_BUDGET_BYTES if size_budget_bytes is None else size_budget_bytes
+    now_dt = now or datetime.utcnow()
+    now_ts = (now_dt - datetime(1970, 1, 1)).total_seconds()
+    cutoff = (now_dt - timedelta(days=retention_days)).strftime(TIMESTAMP_FORMAT)
+
+    stats = {'retention_folded': 0, 'budget_folded': 0, 'aggregates_touched': 0}
+    cursor = conn.cursor()
+
+    # 1. Everything past the retention window
+    while True:
+        cursor.execute('''
+            SELECT id, user_id, pattern_type, pattern_data, confidence_score, created_at
+            FROM user_patterns
+            WHERE created_at < ?
+            ORDER BY id
+            LIMIT ?
+        ''', (cutoff, COMPACTION_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        stats['aggregates_touched'] += fold_rows(conn, rows, now_ts)
+        stats['retention_folded'] += len(rows)
+
+    # 2. Oldest remaining rows while the store is over its size budget
+    if size_budget_bytes:
+        while used_bytes(conn) > size_budget_bytes:
+            cursor.execute('SELECT COUNT(*) FROM user_patterns')
+            foldable = cursor.fetchone()[0] - MIN_RAW_PATTERNS
+            if foldable <= 0:
+                break
+            cursor.execute('''
+                SELECT id, user_id, pattern_type, pattern_data, confidence_score, created_at
+                FROM user_patterns
+                ORDER BY id
+                LIMIT ?
+            ''', (min(foldable, COMPACTION_BATCH_SIZE),))
+            rows = cursor.fetchall()
+            stats['aggregates_touched'] += fold_rows(conn, rows, now_ts)
+            stats['budget_folded'] += len(rows)
+
+    # Hand freed pages back to the OS (no-op unless auto_vacuum=INCREMENTAL)
+    conn.execute('PRAGMA incremental_vacuum')
+    stats['used_bytes'] = used_bytes(conn)
+    return stats
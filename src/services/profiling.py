@@ -0,0 +1,166 @@
+# Opt-in cProfile capture for individual requests.
+# A request is profiled when it carries the admin token in X-Profile-Token or
+# is picked by PROFILE_SAMPLE_RATE. Each profile is a pstats dump stored under
+# PROFILE_DIR/<route>/, so the directory tree is the index: profiles of one
+# route sit together and the newest PROFILE_MAX_PER_ROUTE are kept. Only one
+# request is profiled at a time per process (cProfile is process-wide on newer
+# Pythons); others pass through unprofiled.
+import cProfile
+import glob
+import hmac
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.path.abspath(os.getenv(
+    'PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'profiles')
+))
+PROFILE_MAX_PER_ROUTE = max(int(os.getenv('PROFILE_MAX_PER_ROUTE', '50')), 1)
+
+_profiling = threading.Lock()
+# A path part of word characters, dots and dashes, but not '.' or '..'
+_safe_name = re.compile(r'^(?!\.+$)[\w.-]+$')
+_repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def is_admin(token):
+    """True if token matches PROFILE_ADMIN_TOKEN (never true when no token is configured)"""
+    return bool(PROFILE_ADMIN_TOKEN and token) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+def should_profile(token):
+    """Profile this request? (admin header, else the sampling rate)"""
+    return is_admin(token) or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+def route_slug(route):
+    """Directory name for a route like 'GET /api/x/<session_id>'"""
+    return re.sub(r'[^\w-]+', '_', route).strip('_') or 'root'
+
+class RequestProfile:
+    """cProfile around one request"""
+
+    def __init__(self):
+        self.profiler = None
+        self.started = None
+
+    def start(self):
+        """Begin profiling; returns None if another request is being profiled"""
+        if not _profiling.acquire(blocking=False):
+            return None
+        try:
+            self.profiler = cProfile.Profile()
+            self.started = time.monotonic()
+            self.profiler.enable()
+        except Exception:
+            _profiling.release()
+            raise
+        return self
+
+    def finish(self, route, status=None, trace_id=None):
+        """Stop profiling and store the artifact; returns its '<route>/<name>' id"""
+        try:
+            self.profiler.disable()
+        finally:
+            _profiling.release()
+        duration_ms = int((time.monotonic() - self.started) * 1000)
+        return save(self.profiler, route, duration_ms, status, trace_id)
+
+def save(profiler, route, duration_ms, status=None, trace_id=None):
+    """Write a profile under its route's directory and prune old ones"""
+    slug = route_slug(route)
+    route_dir = os.path.join(PROFILE_DIR, slug)
+    os.makedirs(route_dir, exist_ok=True)
+    label_path = os.path.join(route_dir, 'route.txt')
+    if not os.path.exists(label_path):
+        with open(label_path, 'w', encoding='utf-8') as handle:
+            handle.write(route)
+
+    # <epoch ms>-<duration ms>ms-<status>-<trace id>.prof sorts oldest first
+    name = f'{int(time.time() * 1000)}-{duration_ms}ms-{status or 0}-{trace_id or "none"}.prof'
+    path = os.path.join(route_dir, name)
+    profiler.dump_stats(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    for old in sorted(glob.glob(os.path.join(route_dir, '*.prof')))[:-PROFILE_MAX_PER_ROUTE]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return f'{slug}/{name}'
+
+def _describe(path):
+    created_ms, duration, status, trace_id = os.path.basename(path)[:-len('.prof')].split('-', 3)
+    return {
+        'name': os.path.basename(path),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(int(created_ms) / 1000)),
+        'duration_ms': int(duration[:-2]),
+        'status': int(status),
+        'trace_id': None if trace_id == 'none' else trace_id,
+        'bytes': os.path.getsize(path)
+    }
+
+def list_profiles(slug=None, limit=20):
+    """Stored profiles by route (newest first), with the slowest per route"""
+    if slug and not _safe_name.match(slug):
+        return []
+    index = []
+    for route_dir in sorted(glob.glob(os.path.join(PROFILE_DIR, slug or '*'))):
+        if not os.path.isdir(route_dir):
+            continue
+        try:
+            with open(os.path.join(route_dir, 'route.txt'), encoding='utf-8') as handle:
+                route = handle.read()
+        except OSError:
+            route = os.path.basename(route_dir)
+        profiles = []
+        for path in glob.glob(os.path.join(route_dir, '*.prof')):
+            try:
+                profiles.append(_describe(path))
+            except (OSError, ValueError):
+                continue
+        if not profiles:
+            continue
+        profiles.sort(key=lambda item: item['name'], reverse=True)
+        index.append({
+            'route': route,
+            'slug': os.path.basename(route_dir),
+            'count': len(profiles),
+            'max_duration_ms': max(item['duration_ms'] for item in profiles),
+            'profiles': profiles[:limit]
+        })
+    return index
+
+def profile_path(slug, name):
+    """Filesystem path of a stored profile, or None if the id is invalid or missing"""
+    if not (_safe_name.match(slug) and _safe_name.match(name) and name.endswith('.prof')):
+        return None
+    path = os.path.realpath(os.path.join(PROFILE_DIR, slug, name))
+    # Symlinks or odd names must still resolve inside the profile directory
+    if os.path.commonpath([path, os.path.realpath(PROFILE_DIR)]) != os.path.realpath(PROFILE_DIR):
+        return None
+    return path if os.path.isfile(path) else None
+
+def summarize(path, sort='cumulative', limit=30):
+    """Top functions of a stored profile"""
+    stats = pstats.Stats(path)
+    sort_index = {'cumulative': 3, 'tottime': 2, 'calls': 1}.get(sort, 3)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][sort_index], reverse=True)[:limit]
+    return {
+        'total_ms': round(stats.total_tt * 1000, 3),
+        'sort': sort if sort in ('cumulative', 'tottime', 'calls') else 'cumulative',
+        'functions': [
+            {
+                'function': f'{os.path.relpath(filename, _repo_root) if filename.startswith(_repo_root) else filename}:{line}({function})',
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'own_ms': round(own_time * 1000, 3),
+                'cumulative_ms': round(cumulative_time * 1000, 3)
+            }
+            for (filename, line, function), (primitive_calls, calls, own_time, cumulative_time, _) in rows
+        ]
+    }
@@ -0,0 +1,348 @@
+# Durable checkpoints for relay sessions.
+# Session metadata and every completed agent/pair result are written to SQLite
+# as they happen, so a restart loses at most the call that was in flight.
+# Each process stamps the sessions it runs with its owner id and refreshes a
+# heartbeat; sessions whose owner stopped heartbeating (crash, deploy) are
+# claimed and resumed by whichever process notices first.
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+RELAY_DB_PATH = os.path.abspath(os.getenv(
+    'RELAY_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'relay_sessions.db')
+))
+HEARTBEAT_SECONDS = float(os.getenv('RELAY_HEARTBEAT_SECONDS', '15'))
+# A running session whose heartbeat is this old is considered orphaned
+STALE_SECONDS = float(os.getenv('RELAY_STALE_SECONDS', '45'))
+RETENTION_DAYS = float(os.getenv('RELAY_SESSION_RETENTION_DAYS', '7'))
+POOL_SIZE = 4
+CONNECT_TIMEOUT = 30
+
+# Statuses of sessions that still have work to do
+UNFINISHED_STATUSES = ('starting', 'queued', 'running')
+# Session settings (beyond mode and prompt) needed to rerun a session, and its panel outcome
+SESSION_PARAMS = (
+    'max_agents', 'trace_id', 'agent_policy', 'agent_indexes', 'panel_pairs',
+    'deadline_seconds', 'quorum', 'panel_outcome'
+)
+
+def _new_owner_id():
+    global OWNER_ID
+    OWNER_ID = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+# Identifies this process's claims; a restarted process gets a new one, and so
+# does every worker forked from a preloaded app
+_new_owner_id()
+os.register_at_fork(after_in_child=_new_owner_id)
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS relay_sessions (
+        session_id TEXT PRIMARY KEY,
+        mode TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        params TEXT,
+        user_id TEXT,
+        tier TEXT,
+        status TEXT NOT NULL,
+        created_at TEXT,
+        completed_at TEXT,
+        context_budget TEXT,
+        owner TEXT,
+        heartbeat_at REAL DEFAULT 0,
+        updated_at REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS relay_results (
+        session_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        agent_index INTEGER NOT NULL,
+        agent_b_index INTEGER,
+        response_a,
+        response_b,
+        timestamp REAL,
+        sticky_context_used INTEGER,
+        PRIMARY KEY (session_id, position)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_relay_sessions_status ON relay_sessions (status, heartbeat_at)'
+]
+
+# Sessions this process handed off (see release); its leftover threads must not write them
+_released = set()
+
+_ready = False
+_init_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+def open_connection():
+    """Open a new connection to the relay session store"""
+    conn = sqlite3.connect(RELAY_DB_PATH, timeout=CONNECT_TIMEOUT, check_same_thread=False)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+def ensure_db():
+    """Create the relay tables once per process"""
+    global _ready
+
+    if _ready:
+        return
+    with _init_lock:
+        if _ready:
+            return
+        conn = open_connection()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+        _ready = True
+
+@contextmanager
+def connect():
+    """Borrow a pooled connection to the relay session store"""
+    global _pool, _pool_pid
+
+    ensure_db()
+    if _pool_pid != os.getpid():
+        with _init_lock:
+            if _pool_pid != os.getpid():
+                _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+                _pool_pid = os.getpid()
+    pool = _pool
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def save_session(session_id, session):
+    """Insert or update a session's metadata
+
+    An unfinished session is owned by this process; a finished one has no owner.
+    A session another process has since claimed is left alone.
+    """
+    if session_id in _released:
+        return
+    params = {key: session[key] for key in SESSION_PARAMS if key in session}
+    owner = OWNER_ID if session['status'] in UNFINISHED_STATUSES else None
+    now = time.time()
+    with connect() as conn:
+        conn.execute('''
+            INSERT INTO relay_sessions
+            (session_id, mode, prompt, params, user_id, tier, status, created_at, completed_at,
+             context_budget, owner, heartbeat_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET
+                params = excluded.params,
+                tier = excluded.tier,
+                status = excluded.status,
+                completed_at = excluded.completed_at,
+                context_budget = excluded.context_budget,
+                owner = excluded.owner,
+                heartbeat_at = excluded.heartbeat_at,
+                updated_at = excluded.updated_at
+            WHERE relay_sessions.owner IS NULL OR relay_sessions.owner = ?
+        ''', (
+            session_id, session['mode'], session['prompt'], json.dumps(params),
+            session.get('user_id'), session.get('tier'), session['status'],
+            session.get('created_at'), session.get('completed_at'),
+            json.dumps(session.get('context_budget')), owner, now if owner else 0, now, OWNER_ID
+        ))
+        conn.commit()
+
+def save_result(session_id, session, position, result):
+    """Checkpoint one completed result (and the session's progress) atomically
+
+    Returns the session's stored status ('stopped' if it was stopped from any
+    process meanwhile), or None, writing nothing, if another process now owns it.
+    """
+    # ChainResult and PairResult share this table: a pair fills the *_b columns
+    if hasattr(result, 'packed_response'):
+        row = (result.agent_index, None, result.packed_response, None, result.timestamp, int(result.sticky_context_used))
+    else:
+        row = (result.agent_a_index, result.agent_b_index, result.packed_a, result.packed_b, result.timestamp, None)
+
+    if session_id in _released:
+        return None
+    now = time.time()
+    with connect() as conn:
+        cursor = conn.execute('''
+            UPDATE relay_sessions
+            SET status = CASE WHEN status = 'stopped' THEN status ELSE ? END,
+                context_budget = ?, heartbeat_at = ?, updated_at = ?
+            WHERE session_id = ? AND (owner = ? OR (owner IS NULL AND status = 'stopped'))
+        ''', (session['status'], json.dumps(session.get('context_budget')), now, now, session_id, OWNER_ID))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return None
+        conn.execute('''
+            INSERT OR REPLACE INTO relay_results
+            (session_id, position, agent_index, agent_b_index, response_a, response_b, timestamp, sticky_context_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (session_id, position) + row)
+        status = conn.execute('SELECT status FROM relay_sessions WHERE session_id = ?', (session_id,)).fetchone()[0]
+        conn.commit()
+        return status
+
+def mark_stopped(session_id):
+    """Stop a session whichever process runs it (it notices at its next checkpoint)"""
+    with connect() as conn:
+        conn.execute('''
+            UPDATE relay_sessions SET status = 'stopped', owner = NULL, heartbeat_at = 0, updated_at = ?
+            WHERE session_id = ?
+        ''', (time.time(), session_id))
+        conn.commit()
+
+def load_session(session_id):
+    """Session metadata and raw result rows, or None if unknown"""
+    with connect() as conn:
+        row = conn.execute('''
+            SELECT mode, prompt, params, user_id, tier, status, created_at, completed_at,
+                   context_budget, owner, heartbeat_at
+            FROM relay_sessions
+            WHERE session_id = ?
+        ''', (session_id,)).fetchone()
+        if row is None:
+            return None
+        results = conn.execute('''
+            SELECT agent_index, agent_b_index, response_a, response_b, timestamp, sticky_context_used
+            FROM relay_results
+            WHERE session_id = ?
+            ORDER BY position
+        ''', (session_id,)).fetchall()
+
+    mode, prompt, params, user_id, tier, status, created_at, completed_at, budget, owner, heartbeat_at = row
+    return {
+        'mode': mode,
+        'prompt': prompt,
+        'params': json.loads(params) if params else {},
+        'user_id': user_id,
+        'tier': tier,
+        'status': status,
+        'created_at': created_at,
+        'completed_at': completed_at,
+        'context_budget': json.loads(budget) if budget else None,
+        'owner': owner,
+        'heartbeat_at': heartbeat_at,
+        'result_rows': results
+    }
+
+def claim(session_id):
+    """Take ownership of a session if it has no live owner; False if another process holds it"""
+    now = time.time()
+    with connect() as conn:
+        cursor = conn.execute('''
+            UPDATE relay_sessions SET owner = ?, heartbeat_at = ?, updated_at = ?
+            WHERE session_id = ? AND (owner IS NULL OR owner = ? OR heartbeat_at < ?)
+        ''', (OWNER_ID, now, now, session_id, OWNER_ID, now - STALE_SECONDS))
+        conn.commit()
+        if cursor.rowcount != 1:
+            return False
+    _released.discard(session_id)
+    return True
+
+def release(session_id):
+    """Give up ownership so another process (or a later tick) can resume it"""
+    _released.add(session_id)
+    with connect() as conn:
+        conn.execute('''
+            UPDATE relay_sessions SET owner = NULL, heartbeat_at = 0
+            WHERE session_id = ? AND owner = ?
+        ''', (session_id, OWNER_ID))
+        conn.commit()
+
+def heartbeat(session_ids):
+    """Refresh this process's claim on the sessions it is running"""
+    if not session_ids:
+        return
+    now = time.time()
+    with connect() as conn:
+        conn.executemany('''
+            UPDATE relay_sessions SET heartbeat_at = ?
+            WHERE session_id = ? AND owner = ?
+        ''', [(now, session_id, OWNER_ID) for session_id in session_ids])
+        conn.commit()
+
+def orphaned_session_ids(limit=50):
+    """Unfinished sessions whose owner stopped heartbeating"""
+    with connect() as conn:
+        rows = conn.execute(f'''
+            SELECT session_id FROM relay_sessions
+            WHERE status IN ({', '.join('?' for _ in UNFINISHED_STATUSES)})
+              AND heartbeat_at < ?
+            ORDER BY updated_at
+            LIMIT ?
+        ''', (*UNFINISHED_STATUSES, time.time() - STALE_SECONDS, limit)).fetchall()
+    return [row[0] for row in rows]
+
+def purge_finished(retention_days=RETENTION_DAYS):
+    """Delete finished sessions (and their results) older than the retention window"""
+    cutoff = time.time() - retention_days * 86400
+    with connect() as conn:
+        conn.execute(f'''
+            DELETE FROM relay_results WHERE session_id IN (
+                SELECT session_id FROM relay_sessions
+                WHERE status NOT IN ({', '.join('?' for _ in UNFINISHED_STATUSES)}) AND updated_at < ?
+            )
+        ''', (*UNFINISHED_STATUSES, cutoff))
+        cursor = conn.execute(f'''
+            DELETE FROM relay_sessions
+            WHERE status NOT IN ({', '.join('?' for _ in UNFINISHED_STATUSES)}) AND updated_at < ?
+        ''', (*UNFINISHED_STATUSES, cutoff))
+        conn.commit()
+        return cursor.rowcount
+
+_recovery_thread = None
+_recovery_lock = threading.Lock()
+
+def _recovery_worker(resume, running_ids):
+    """Heartbeat our sessions, adopt orphaned ones, purge old ones"""
+    # The first pass runs immediately so a restart resumes its sessions right away
+    last_purge = 0
+    while True:
+        try:
+            heartbeat(running_ids())
+            for session_id in orphaned_session_ids():
+                if claim(session_id) and not resume(session_id):
+                    release(session_id)
+            if time.time() - last_purge > 3600:
+                last_purge = time.time()
+                purge_finished()
+        except Exception as e:
+            print(f"Relay session recovery error: {e}")
+        time.sleep(HEARTBEAT_SECONDS)
+
+def start_recovery_job(resume, running_ids):
+    """Start the heartbeat/recovery thread once per process
+
+    resume(session_id) -> bool restarts a claimed session from its checkpoint;
+    running_ids() -> ids of the sessions this process is queueing or running.
+    """
+    global _recovery_thread
+
+    if _recovery_thread is not None:
+        return
+    with _recovery_lock:
+        if _recovery_thread is None:
+            _recovery_thread = threading.Thread(target=_recovery_worker, args=(resume, running_ids), daemon=True)
+            _recovery_thread.start()
@@ -0,0 +1,137 @@
+# Compact in-memory records for relay session results.
+# Agents are referenced by their index in RELAY_AGENTS (not copied name and
+# specialty strings), timestamps are epoch floats, and response bodies above
+# RESULT_COMPRESS_THRESHOLD bytes are kept zlib-compressed until read.
+# to_dict() rebuilds the exact dict shape the API has always returned (plus
+# 'skipped' on panel agents cut off by a deadline or quorum).
+import os
+import time
+import zlib
+from datetime import datetime
+
+COMPRESS_THRESHOLD = int(os.getenv('RESULT_COMPRESS_THRESHOLD', '1024'))
+COMPRESS_LEVEL = 6
+
+# A failed agent call is stored as text starting with one of these
+ERROR_PREFIXES = ('Error:', 'API Error:')
+
+def is_error_text(text):
+    """True if a stored response is the error text of a failed call"""
+    return isinstance(text, str) and text.startswith(ERROR_PREFIXES)
+
+def pack_text(text):
+    """Store text as-is, or as zlib bytes when it is long enough to be worth it"""
+    if not isinstance(text, str):
+        return text
+    data = text.encode('utf-8')
+    if len(data) < COMPRESS_THRESHOLD:
+        return text
+    compressed = zlib.compress(data, COMPRESS_LEVEL)
+    return compressed if len(compressed) < len(data) else text
+
+def unpack_text(value):
+    """Inverse of pack_text"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+def iso_timestamp(timestamp):
+    """Epoch seconds -> the naive UTC ISO string the API has always used"""
+    return datetime.utcfromtimestamp(timestamp).isoformat()
+
+class ChainResult:
+    """One conference-chain agent's contribution
+
+    agent_index is the agent's place in RELAY_AGENTS; position is its place in
+    this chain (they differ when an adaptive policy reorders the agents).
+    """
+    __slots__ = ('position', 'agent_index', 'packed_response', 'timestamp', 'sticky_context_used')
+
+    def __init__(self, position, agent_index, response, sticky_context_used):
+        self.position = position
+        self.agent_index = agent_index
+        self.packed_response = pack_text(response)
+        self.timestamp = time.time()
+        self.sticky_context_used = sticky_context_used
+
+    @classmethod
+    def restore(cls, position, agent_index, packed_response, timestamp, sticky_context_used):
+        """Rebuild a checkpointed record without re-compressing it"""
+        result = cls.__new__(cls)
+        result.position = position
+        result.agent_index = agent_index
+        result.packed_response = packed_response
+        result.timestamp = timestamp
+        result.sticky_context_used = sticky_context_used
+        return result
+
+    @property
+    def response(self):
+        return unpack_text(self.packed_response)
+
+    def to_dict(self, agents):
+        agent = agents[self.agent_index]
+        return {
+            'agent_number': self.position + 1,
+            'agent_name': agent['name'],
+            'agent_specialty': agent['specialty'],
+            'response': self.response,
+            'sticky_context_used': self.sticky_context_used,
+            'timestamp': iso_timestamp(self.timestamp)
+        }
+
+class PairResult:
+    """One expert-panel pair's two independent responses"""
+    __slots__ = ('pair_number', 'agent_a_index', 'agent_b_index', 'packed_a', 'packed_b', 'timestamp')
+
+    def __init__(self, pair_number, agent_a_index, agent_b_index, response_a, response_b):
+        self.pair_number = pair_number
+        self.agent_a_index = agent_a_index
+        self.agent_b_index = agent_b_index
+        self.packed_a = pack_text(response_a)
+        self.packed_b = pack_text(response_b)
+        self.timestamp = time.time()
+
+    @classmethod
+    def restore(cls, pair_number, agent_a_index, agent_b_index, packed_a, packed_b, timestamp):
+        """Rebuild a checkpointed record without re-compressing it"""
+        result = cls.__new__(cls)
+        result.pair_number = pair_number
+        result.agent_a_index = agent_a_index
+        result.agent_b_index = agent_b_index
+        result.packed_a = packed_a
+        result.packed_b = packed_b
+        result.timestamp = timestamp
+        return result
+
+    @property
+    def answered(self):
+        """How many of the pair's two agents returned a response (not skipped, not an error)"""
+        return sum(
+            packed is not None and not is_error_text(unpack_text(packed))
+            for packed in (self.packed_a, self.packed_b)
+        )
+
+    @property
+    def errors(self):
+        """How many of the pair's two agents returned an error instead of a response"""
+        return sum(is_error_text(unpack_text(packed)) for packed in (self.packed_a, self.packed_b))
+
+    def to_dict(self, agents):
+        return {
+            'pair_number': self.pair_number,
+            'agent_a': _panel_agent(agents[self.agent_a_index], self.packed_a),
+            'agent_b': _panel_agent(agents[self.agent_b_index], self.packed_b),
+            'timestamp': iso_timestamp(self.timestamp)
+        }
+
+def _panel_agent(agent, packed):
+    entry = {
+        'name': agent['name'],
+        'specialty': agent['specialty'],
+        'response': unpack_text(packed)
+    }
+    if packed is None:
+        # Cut off by the panel's deadline or quorum
+        entry['skipped'] = True
+    return entry
@@ -0,0 +1,231 @@
+# Admission control and weighted-fair scheduling for relay sessions.
+# A fixed pool of RELAY_MAX_CONCURRENT_SESSIONS worker threads runs sessions;
+# everything else waits in one queue per subscription tier. Tiers are served
+# by stride scheduling (a tier with weight 8 starts 8 sessions for every 1 of
+# a weight-1 tier while both are backlogged), so a burst of free sessions only
+# delays paid sessions by a bounded share of capacity. Per-user and per-tier
+# queue caps reject work up front with a retry estimate instead of queueing
+# without bound.
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+
+MAX_CONCURRENT_SESSIONS = int(os.getenv('RELAY_MAX_CONCURRENT_SESSIONS', '8'))
+QUEUE_LIMIT_PER_TIER = int(os.getenv('RELAY_QUEUE_LIMIT_PER_TIER', '50'))
+MAX_SESSIONS_PER_USER = int(os.getenv('RELAY_MAX_SESSIONS_PER_USER', '2'))
+
+# Until real durations are observed, assume this long per session
+DEFAULT_SESSION_SECONDS = 60.0
+DURATION_SMOOTHING = 0.2
+# Retry hint for clients turned away while a process shuts down
+DRAIN_RETRY_SECONDS = 5
+
+class SchedulerFull(Exception):
+    """Raised when a session can't be admitted; carries a retry estimate"""
+
+    def __init__(self, message, retry_after, queue_position=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+
+class SchedulerClosed(SchedulerFull):
+    """Raised once the scheduler is draining for shutdown"""
+
+class RelayScheduler:
+    """Bounded worker pool fed by weighted-fair per-tier queues"""
+
+    def __init__(self, tier_weights, capacity=MAX_CONCURRENT_SESSIONS,
+                 queue_limit=QUEUE_LIMIT_PER_TIER, user_limit=MAX_SESSIONS_PER_USER):
+        self.tier_weights = dict(tier_weights)
+        self.capacity = capacity
+        self.queue_limit = queue_limit
+        self.user_limit = user_limit
+
+        self.condition = threading.Condition()
+        self.queues = {tier: deque() for tier in self.tier_weights}
+        self.passes = {tier: 0.0 for tier in self.tier_weights}
+        self.virtual_time = 0.0
+        self.jobs = {}              # job id -> job dict (queued or running)
+        self.user_jobs = {}         # user id -> count of queued + running jobs
+        self.running = 0
+        self.average_seconds = DEFAULT_SESSION_SECONDS
+        self.workers = []
+        self.closed = False
+
+    def _start_workers(self):
+        """Start the worker pool on first use"""
+        while len(self.workers) < self.capacity:
+            worker = threading.Thread(target=self._worker, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, job_id, tier, user_id, fn, *args):
+        """Queue fn(*args) under a tier; returns its queue position (0 = starting now, 1 = next)"""
+        tier = tier if tier in self.queues else min(self.tier_weights, key=self.tier_weights.get)
+
+        with self.condition:
+            if self.closed:
+                raise SchedulerClosed('Server is shutting down', DRAIN_RETRY_SECONDS)
+
+            if self.user_limit and user_id and self.user_jobs.get(user_id, 0) >= self.user_limit:
+                raise SchedulerFull(
+                    f'At most {self.user_limit} relay sessions per user can be queued or running',
+                    self.average_seconds
+                )
+
+            tier_queue = self.queues[tier]
+            if len(tier_queue) >= self.queue_limit:
+                position = self._position(tier, len(tier_queue)) + 1
+                raise SchedulerFull('Relay queue is full', self._wait_seconds(position), position)
+
+            # A tier that was idle rejoins at the current virtual time, so it
+            # can't cash in credit for the time it had nothing queued
+            if not tier_queue:
+                self.passes[tier] = max(self.passes[tier], self.virtual_time)
+
+            job = {
+                'id': job_id,
+                'tier': tier,
+                'user_id': user_id,
+                'fn': fn,
+                'args': args,
+                # Runs with the submitter's context variables (e.g. its trace)
+                'context': contextvars.copy_context(),
+                'state': 'queued',
+                'queued_at': time.monotonic()
+            }
+            tier_queue.append(job)
+            self.jobs[job_id] = job
+            if user_id:
+                self.user_jobs[user_id] = self.user_jobs.get(user_id, 0) + 1
+
+            self._start_workers()
+            self.condition.notify()
+            if self.running + self._queued_count() <= self.capacity:
+                return 0
+            return self._position(tier, len(tier_queue) - 1) + 1
+
+    def cancel(self, job_id):
+        """Drop a queued job; returns False if it is unknown or already running"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != 'queued':
+                return False
+            self.queues[job['tier']].remove(job)
+            self._forget(job)
+            return True
+
+    def position(self, job_id):
+        """Estimated queue position of a job (1 = next to start, None if not queued)"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != 'queued':
+                return None
+            return self._position(job['tier'], self.queues[job['tier']].index(job)) + 1
+
+    def is_active(self, job_id):
+        """True while a job is queued or running"""
+        with self.condition:
+            return job_id in self.jobs
+
+    def close(self):
+        """Stop admitting work; returns the ids of queued jobs, which are dropped"""
+        with self.condition:
+            self.closed = True
+            dropped = []
+            for tier_queue in self.queues.values():
+                while tier_queue:
+                    job = tier_queue.popleft()
+                    self._forget(job)
+                    dropped.append(job['id'])
+            return dropped
+
+    def wait_idle(self, timeout):
+        """Wait up to timeout seconds for running jobs; returns the ids still running"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return [job_id for job_id, job in self.jobs.items() if job['state'] == 'running']
+
+    def stats(self):
+        """Snapshot of capacity and per-tier queue lengths"""
+        with self.condition:
+            return {
+                'capacity': self.capacity,
+                'running': self.running,
+                'queued': {tier: len(tier_queue) for tier, tier_queue in self.queues.items()},
+                'weights': self.tier_weights,
+                'average_session_seconds': round(self.average_seconds, 1),
+                'closed': self.closed
+            }
+
+    def _queued_count(self):
+        return sum(len(tier_queue) for tier_queue in self.queues.values())
+
+    def _position(self, tier, ahead):
+        """Sessions that start before one with `ahead` jobs in front of it in its tier"""
+        # While this tier drains ahead + 1 jobs, every other tier gets its
+        # weighted share of starts (but no more than it has queued)
+        rounds = (ahead + 1) / self.tier_weights[tier]
+        position = ahead
+        for other, other_queue in self.queues.items():
+            if other != tier:
+                position += min(len(other_queue), math.ceil(rounds * self.tier_weights[other]))
+        return position
+
+    def _wait_seconds(self, position):
+        """Rough seconds until a slot frees up for a job at `position`"""
+        return max(1, math.ceil(self.average_seconds * (position / self.capacity + 1)))
+
+    def _next_job(self):
+        """Pop the next job by stride scheduling (lowest pass among backlogged tiers)"""
+        backlogged = [tier for tier, tier_queue in self.queues.items() if tier_queue]
+        if not backlogged:
+            return None
+        tier = min(backlogged, key=lambda t: (self.passes[t], -self.tier_weights[t]))
+        self.virtual_time = self.passes[tier]
+        self.passes[tier] += 1.0 / self.tier_weights[tier]
+        return self.queues[tier].popleft()
+
+    def _forget(self, job):
+        """Release a job's bookkeeping (caller holds the lock)"""
+        self.jobs.pop(job['id'], None)
+        user_id = job['user_id']
+        if user_id:
+            remaining = self.user_jobs.get(user_id, 0) - 1
+            if remaining > 0:
+                self.user_jobs[user_id] = remaining
+            else:
+                self.user_jobs.pop(user_id, None)
+
+    def _worker(self):
+        """Run jobs one at a time, forever"""
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self._next_job()
+                job['state'] = 'running'
+                self.running += 1
+
+            started = time.monotonic()
+            try:
+                job['context'].run(job['fn'], *job['args'])
+            except Exception as e:
+                print(f"Relay session {job['id']} failed: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                with self.condition:
+                    self.running -= 1
+                    self.average_seconds += DURATION_SMOOTHING * (elapsed - self.average_seconds)
+                    self._forget(job)
+                    # Wake wait_idle() (and idle workers, which just re-check the queues)
+                    self.condition.notify_all()
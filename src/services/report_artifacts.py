@@ -0,0 +1,153 @@
+# Static HTML report artifacts for finished relay sessions.
+# A completed session's report is rendered once and stored under
+# REPORT_DIR/<session_id>/ as report.html plus a pre-compressed report.html.gz,
+# with a manifest holding each variant's strong ETag (a content hash). Downloads
+# are then plain file sends: no rendering, no compression, and the WSGI server
+# can use sendfile. Files are replaced atomically, so readers never see a
+# partial artifact; rendering is deterministic, so concurrent writers agree.
+# Expired artifacts are pruned at most hourly, from both the write and the
+# read path. Manifests from an older FORMAT_VERSION (e.g. reports rendered
+# before their content was escaped) read as missing, so they get re-rendered.
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+REPORT_DIR = os.path.abspath(os.getenv(
+    'REPORT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'reports')
+))
+REPORT_GZIP_LEVEL = min(max(int(os.getenv('REPORT_GZIP_LEVEL', '9')), 1), 9)
+# Artifacts are pruned with the sessions they belong to
+REPORT_RETENTION_DAYS = float(os.getenv('REPORT_RETENTION_DAYS', os.getenv('RELAY_SESSION_RETENTION_DAYS', '7')))
+PURGE_INTERVAL_SECONDS = 3600
+# Bump when the rendered HTML changes incompatibly
+FORMAT_VERSION = 2
+
+HTML_NAME = 'report.html'
+GZIP_NAME = 'report.html.gz'
+MANIFEST_NAME = 'manifest.json'
+
+_safe_id = re.compile(r'^[\w-]+$')
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+def session_dir(session_id):
+    """Artifact directory of a session (None for ids that aren't safe path parts)"""
+    if not _safe_id.match(session_id or ''):
+        return None
+    return os.path.join(REPORT_DIR, session_id)
+
+def _write_atomic(path, data):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as temp:
+            temp.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+def write(session_id, html):
+    """Store a rendered report and its gzip variant; returns the manifest"""
+    directory = session_dir(session_id)
+    if directory is None:
+        raise ValueError(f'Invalid session id: {session_id!r}')
+    os.makedirs(directory, exist_ok=True)
+
+    body = html.encode('utf-8')
+    # mtime=0 keeps the compressed bytes (and their ETag) identical across renders
+    compressed = gzip.compress(body, compresslevel=REPORT_GZIP_LEVEL, mtime=0)
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    manifest = {
+        'format': FORMAT_VERSION,
+        'etag': digest,
+        'gzip_etag': f'{digest}-gz',
+        'bytes': len(body),
+        'gzip_bytes': len(compressed),
+        'rendered_at': time.time()
+    }
+    _write_atomic(os.path.join(directory, HTML_NAME), body)
+    _write_atomic(os.path.join(directory, GZIP_NAME), compressed)
+    # The manifest goes last: its presence means both variants are complete
+    _write_atomic(os.path.join(directory, MANIFEST_NAME), json.dumps(manifest).encode('utf-8'))
+
+    purge_expired_if_due()
+    return manifest
+
+def manifest(session_id):
+    """A session's artifact manifest, or None if it has no report yet"""
+    directory = session_dir(session_id)
+    if directory is None:
+        return None
+    purge_expired_if_due()
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as handle:
+            current = json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return None
+    return current if current.get('format') == FORMAT_VERSION else None
+
+def variant(session_id, accept_gzip):
+    """(path, etag, content_encoding) of the best stored variant, or None"""
+    current = manifest(session_id)
+    if current is None:
+        return None
+    directory = session_dir(session_id)
+    if accept_gzip:
+        return os.path.join(directory, GZIP_NAME), current['gzip_etag'], 'gzip'
+    return os.path.join(directory, HTML_NAME), current['etag'], None
+
+def read_html(session_id):
+    """The stored report's HTML text, or None"""
+    if manifest(session_id) is None:
+        return None
+    try:
+        with open(os.path.join(session_dir(session_id), HTML_NAME), encoding='utf-8') as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return None
+
+def remove(session_id):
+    directory = session_dir(session_id)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def purge_expired(retention_days=REPORT_RETENTION_DAYS):
+    """Delete artifacts rendered longer ago than the retention window; returns how many"""
+    cutoff = time.time() - retention_days * 86400
+    removed = 0
+    try:
+        entries = list(os.scandir(REPORT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        try:
+            expired = os.path.getmtime(os.path.join(entry.path, MANIFEST_NAME)) < cutoff
+        except FileNotFoundError:
+            # Half-written or foreign directory: judge it by its own age
+            expired = entry.stat().st_mtime < cutoff
+        if expired:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def purge_expired_if_due():
+    global _last_purge
+
+    if time.monotonic() - _last_purge < PURGE_INTERVAL_SECONDS or not _purge_lock.acquire(blocking=False):
+        return
+    try:
+        _last_purge = time.monotonic()
+        purge_expired()
+    except Exception as e:
+        print(f"Report artifact purge failed: {e}")
+    finally:
+        _purge_lock.release()
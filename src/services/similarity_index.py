@@ -0,0 +1,203 @@
+# Per-user similarity index over characteristic phrases and learned patterns.
+# Texts become hashed character n-gram vectors kept in an inverted index of
+# compact array posting lists; scoring is one batched numpy accumulation
+# (pure-Python fallback when numpy is not installed).
+import heapq
+import math
+import os
+import threading
+from array import array
+from collections import Counter, OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; scoring falls back to pure Python
+    np = None
+
+NGRAM_SIZE = 3
+
+# Only the tail of long texts is indexed/queried (where the question usually is)
+DOC_MAX_CHARS = 1000
+QUERY_MAX_CHARS = 500
+
+# Query terms are ranked by weight and capped (by count and by total postings
+# scored); n-grams present in most documents carry no signal and are skipped
+MAX_QUERY_TERMS = 64
+MAX_QUERY_POSTINGS = 20000
+STOP_FRACTION = 0.5
+
+MAX_INDEXED_USERS = int(os.getenv('SIMILARITY_INDEX_MAX_USERS', '256'))
+
+def text_features(text):
+    """Return {feature: weight} for a text's L2-normalised n-gram counts"""
+    normalized = ' ' + ' '.join(text.lower().split()) + ' '
+    counts = Counter()
+    for start in range(len(normalized) - NGRAM_SIZE + 1):
+        counts[hash(normalized[start:start + NGRAM_SIZE])] += 1
+
+    # Sublinear term frequency, then unit length
+    weights = {feature: (1 + math.log(count) if count > 1 else 1.0) for feature, count in counts.items()}
+    scale = 1 / (math.sqrt(sum(w * w for w in weights.values())) or 1.0)
+    return {feature: w * scale for feature, w in weights.items()}
+
+class SimilarityIndex:
+    """Incremental n-gram index over one user's documents"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.payloads = []       # doc id -> payload dict
+        self.keys = {}           # dedupe key -> doc id
+        self.postings = {}       # feature -> (array('i') doc ids, array('f') weights)
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def add(self, key, text, payload):
+        """Index a document; re-adding an existing key only refreshes its payload"""
+        with self.lock:
+            doc_id = self.keys.get(key)
+            if doc_id is not None:
+                self.payloads[doc_id] = payload
+                return doc_id
+
+            doc_id = len(self.payloads)
+            self.keys[key] = doc_id
+            self.payloads.append(payload)
+
+            for feature, weight in text_features(text[-DOC_MAX_CHARS:]).items():
+                postings = self.postings.get(feature)
+                if postings is None:
+                    postings = self.postings[feature] = (array('i'), array('f'))
+                postings[0].append(doc_id)
+                postings[1].append(weight)
+            return doc_id
+
+    def _query_terms(self, text):
+        """Pick the most informative (postings, weight) pairs for a query"""
+        doc_count = len(self.payloads)
+        stop_df = doc_count * STOP_FRACTION if doc_count > 50 else doc_count + 1
+        log_docs = math.log(doc_count + 1) + 1
+        get_postings = self.postings.get
+
+        # idf-weight every query n-gram; unseen ones only count towards the norm
+        candidates = []
+        norm = 0.0
+        for feature, weight in text_features(text[-QUERY_MAX_CHARS:]).items():
+            postings = get_postings(feature)
+            if postings is None:
+                w = weight * log_docs
+            else:
+                df = len(postings[0])
+                w = weight * (log_docs - math.log(df + 1))
+                if df <= stop_df:
+                    candidates.append((w, df, postings))
+            norm += w * w
+        norm = math.sqrt(norm) or 1.0
+
+        terms = []
+        budget = MAX_QUERY_POSTINGS
+        for w, df, postings in heapq.nlargest(MAX_QUERY_TERMS, candidates, key=lambda term: term[0]):
+            if df > budget:
+                continue
+            budget -= df
+            terms.append((postings, w / norm))
+        return terms
+
+    def search(self, text, limit=5, accept=None):
+        """Return [(score, payload)] for the best matches, best first"""
+        with self.lock:
+            doc_count = len(self.payloads)
+            if not doc_count or not text:
+                return []
+
+            terms = self._query_terms(text)
+            if not terms:
+                return []
+
+            if np is not None:
+                doc_ids = np.concatenate([np.frombuffer(postings[0], dtype=np.intc) for postings, _ in terms])
+                weights = np.concatenate([np.frombuffer(postings[1], dtype=np.float32) * w for postings, w in terms])
+                scores = np.bincount(doc_ids, weights=weights, minlength=doc_count)
+
+                candidates = np.flatnonzero(scores)
+                # Over-fetch so a filter still leaves `limit` results most of the time
+                fetch = min(len(candidates), max(limit * 4, 32))
+                if fetch < len(candidates):
+                    candidates = candidates[np.argpartition(scores[candidates], -fetch)[-fetch:]]
+                ranked = sorted(((float(scores[i]), int(i)) for i in candidates), reverse=True)
+            else:
+                accumulated = {}
+                for (ids, doc_weights), w in terms:
+                    for doc_id, doc_weight in zip(ids, doc_weights):
+                        accumulated[doc_id] = accumulated.get(doc_id, 0.0) + doc_weight * w
+                ranked = sorted(((score, doc_id) for doc_id, score in accumulated.items()), reverse=True)
+
+            results = []
+            for score, doc_id in ranked:
+                payload = self.payloads[doc_id]
+                if accept is not None and not accept(payload):
+                    continue
+                results.append((score, payload))
+                if len(results) >= limit:
+                    break
+            return results
+
+class UserIndexes:
+    """LRU of per-user phrase and pattern indexes, loaded on first use"""
+
+    def __init__(self, loader, max_users=MAX_INDEXED_USERS):
+        self.loader = loader
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+
+    def get(self, user_id):
+        """Return (phrase_index, pattern_index) for a user, loading it if needed"""
+        with self.lock:
+            entry = self.indexes.get(user_id)
+            if entry is not None:
+                self.indexes.move_to_end(user_id)
+                return entry
+
+        phrase_index = SimilarityIndex()
+        pattern_index = SimilarityIndex()
+        phrases, patterns = self.loader(user_id)
+        for phrase in phrases:
+            add_phrase(phrase_index, phrase)
+        for pattern in patterns:
+            add_pattern(pattern_index, pattern)
+
+        with self.lock:
+            # Another thread may have loaded the same user meanwhile
+            entry = self.indexes.setdefault(user_id, (phrase_index, pattern_index))
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+            return entry
+
+    def loaded(self, user_id):
+        """Return a user's indexes if they are already in memory, else None"""
+        with self.lock:
+            return self.indexes.get(user_id)
+
+    def discard(self, user_id=None):
+        """Drop one user's indexes (or all) so they reload from the store"""
+        with self.lock:
+            if user_id is None:
+                self.indexes.clear()
+            else:
+                self.indexes.pop(user_id, None)
+
+def add_phrase(index, phrase):
+    """Index a phrase dict (phrase, context, effectiveness_score)"""
+    # The same phrase learned in two contexts is two documents
+    index.add((phrase['phrase'], phrase.get('context')), phrase['phrase'], phrase)
+
+def add_pattern(index, pattern):
+    """Index a pattern dict by the AI response that prompted it"""
+    ai_response = pattern.get('ai_response')
+    if not isinstance(ai_response, str) or not ai_response.strip():
+        return
+    # Identical interactions collapse into one document
+    key = (pattern.get('interaction_type'), pattern.get('user_response'), ai_response)
+    index.add(key, ai_response, pattern)
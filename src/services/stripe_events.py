@@ -0,0 +1,304 @@
+# Durable, idempotent Stripe webhook pipeline.
+# The webhook endpoint only verifies the signature and inserts the raw event
+# keyed by event.id (duplicates from Stripe retries are ignored), then returns.
+# A background consumer applies each event's handlers and marks it done in the
+# same SQLite transaction, so every event's state changes land exactly once.
+# Events that keep failing are parked as 'failed' until they are replayed:
+#     cd src && python -m services.stripe_events replay --failed
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+BILLING_DB_PATH = os.path.abspath(os.getenv(
+    'BILLING_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'billing.db')
+))
+MAX_ATTEMPTS = int(os.getenv('STRIPE_EVENT_MAX_ATTEMPTS', '5'))
+RETRY_BASE_SECONDS = float(os.getenv('STRIPE_EVENT_RETRY_SECONDS', '2'))
+CONSUMER_POLL_SECONDS = 5
+POOL_SIZE = 4
+CONNECT_TIMEOUT = 30
+
+EVENTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stripe_events (
+        event_id TEXT PRIMARY KEY,
+        event_type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        received_at REAL NOT NULL,
+        processed_at REAL
+    )
+'''
+
+# Event type -> [fn(conn, event)] registered by the payments routes
+_handlers = {}
+
+# fn(event) called after an event's changes are committed (e.g. cache invalidation)
+_listeners = []
+
+# Extra schema for handler-owned tables: fn(conn)
+_initializers = []
+_ready = False
+_init_lock = threading.Lock()
+
+_pool = None
+_pool_pid = None
+
+_consumer_thread = None
+_consumer_lock = threading.Lock()
+_wakeup = threading.Event()
+
+def handler(event_type):
+    """Register `fn(conn, event)` to apply one Stripe event type"""
+    def register(fn):
+        _handlers.setdefault(event_type, []).append(fn)
+        return fn
+    return register
+
+def on_applied(listener):
+    """Call `listener(event)` after each event is committed"""
+    _listeners.append(listener)
+    return listener
+
+def register_initializer(initializer):
+    """Run `initializer(conn)` when the billing database is first opened"""
+    _initializers.append(initializer)
+    return initializer
+
+def open_connection():
+    """Open a new connection to the billing database"""
+    conn = sqlite3.connect(BILLING_DB_PATH, timeout=CONNECT_TIMEOUT, check_same_thread=False)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+def ensure_db():
+    """Create the billing tables once per process"""
+    global _ready
+
+    if _ready:
+        return
+    with _init_lock:
+        if _ready:
+            return
+        conn = open_connection()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute(EVENTS_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_stripe_events_due ON stripe_events (status, next_attempt_at)')
+            for initializer in _initializers:
+                initializer(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        _ready = True
+
+@contextmanager
+def connect():
+    """Borrow a pooled connection to the billing database"""
+    global _pool, _pool_pid
+
+    ensure_db()
+    if _pool_pid != os.getpid():
+        with _init_lock:
+            if _pool_pid != os.getpid():
+                _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+                _pool_pid = os.getpid()
+    pool = _pool
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def enqueue_event(event_id, event_type, payload):
+    """Durably store a verified event; returns False if it was already received"""
+    with connect() as conn:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO stripe_events (event_id, event_type, payload, received_at)
+            VALUES (?, ?, ?, ?)
+        ''', (event_id, event_type, payload, time.time()))
+        conn.commit()
+        inserted = cursor.rowcount == 1
+
+    if inserted:
+        start_consumer()
+        _wakeup.set()
+    return inserted
+
+def process_event(conn, event_id):
+    """Apply one due event and mark it done in a single transaction"""
+    # BEGIN IMMEDIATE takes the write lock first, so two consumers (e.g. two
+    # gunicorn workers) can never both apply the same event
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('''
+            SELECT event_type, payload, attempts FROM stripe_events
+            WHERE event_id = ? AND status = 'pending'
+        ''', (event_id,)).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+
+        event_type, payload, attempts = row
+        event = json.loads(payload)
+        for fn in _handlers.get(event_type, []):
+            fn(conn, event)
+
+        conn.execute('''
+            UPDATE stripe_events
+            SET status = 'done', attempts = ?, last_error = NULL, processed_at = ?
+            WHERE event_id = ?
+        ''', (attempts + 1, time.time(), event_id))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        record_failure(conn, event_id, e)
+        return False
+
+    for listener in _listeners:
+        listener(event)
+    return True
+
+def record_failure(conn, event_id, error):
+    """Schedule a retry with exponential backoff, or park the event as failed"""
+    row = conn.execute('SELECT attempts FROM stripe_events WHERE event_id = ?', (event_id,)).fetchone()
+    attempts = (row[0] if row else 0) + 1
+    status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+    conn.execute('''
+        UPDATE stripe_events
+        SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?
+        WHERE event_id = ?
+    ''', (status, attempts, f'{type(error).__name__}: {error}',
+          time.time() + RETRY_BASE_SECONDS * 2 ** (attempts - 1), event_id))
+    conn.commit()
+    print(f"Stripe event {event_id} failed (attempt {attempts}/{MAX_ATTEMPTS}): {error}")
+
+def process_due_events(limit=100):
+    """Process pending events whose retry time has come; returns how many ran"""
+    with connect() as conn:
+        due = conn.execute('''
+            SELECT event_id FROM stripe_events
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY received_at
+            LIMIT ?
+        ''', (time.time(), limit)).fetchall()
+        for (event_id,) in due:
+            process_event(conn, event_id)
+    return len(due)
+
+def _consumer():
+    """Drain the event table, sleeping until woken by a new event or the poll interval"""
+    while True:
+        try:
+            if process_due_events():
+                continue
+        except Exception as e:
+            print(f"Stripe event consumer error: {e}")
+        _wakeup.wait(CONSUMER_POLL_SECONDS)
+        _wakeup.clear()
+
+def start_consumer():
+    """Start the background consumer once per process"""
+    global _consumer_thread
+
+    if _consumer_thread is not None and _consumer_thread.is_alive():
+        return
+    with _consumer_lock:
+        if _consumer_thread is None or not _consumer_thread.is_alive():
+            _consumer_thread = threading.Thread(target=_consumer, daemon=True)
+            _consumer_thread.start()
+
+def list_events(status=None, limit=100):
+    """Recent events (newest first), optionally filtered by status"""
+    with connect() as conn:
+        rows = conn.execute('''
+            SELECT event_id, event_type, status, attempts, last_error, received_at, processed_at
+            FROM stripe_events
+            WHERE ? IS NULL OR status = ?
+            ORDER BY received_at DESC
+            LIMIT ?
+        ''', (status, status, limit)).fetchall()
+    return [
+        {
+            'event_id': event_id,
+            'type': event_type,
+            'status': event_status,
+            'attempts': attempts,
+            'last_error': last_error,
+            'received_at': received_at,
+            'processed_at': processed_at
+        }
+        for event_id, event_type, event_status, attempts, last_error, received_at, processed_at in rows
+    ]
+
+def replay_events(event_ids=None, failed=False, force=False):
+    """Reset failed (or specific) events to pending and process them now"""
+    # Only failed and pending events are re-run: a 'done' event's handlers
+    # already ran, so it is replayed only when named explicitly with force
+    replayable = ('failed', 'pending')
+    with connect() as conn:
+        if event_ids:
+            placeholders = ', '.join('?' for _ in event_ids)
+            cursor = conn.execute(f'''
+                UPDATE stripe_events
+                SET status = 'pending', attempts = 0, next_attempt_at = 0
+                WHERE event_id IN ({placeholders}) AND (status IN (?, ?) OR ?)
+            ''', (*event_ids, *replayable, int(bool(force))))
+        elif failed:
+            cursor = conn.execute('''
+                UPDATE stripe_events
+                SET status = 'pending', attempts = 0, next_attempt_at = 0
+                WHERE status = 'failed'
+            ''')
+        else:
+            return 0
+        conn.commit()
+        replayed = cursor.rowcount
+
+    while process_due_events():
+        pass
+    return replayed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stripe webhook event tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    list_parser = subcommands.add_parser('list', help='show recent events')
+    list_parser.add_argument('--status', choices=['pending', 'done', 'failed'])
+    list_parser.add_argument('--limit', type=int, default=50)
+    replay_parser = subcommands.add_parser('replay', help='re-run failed or specific events')
+    replay_parser.add_argument('event_ids', nargs='*')
+    replay_parser.add_argument('--failed', action='store_true', help='replay every failed event')
+    replay_parser.add_argument('--force', action='store_true', help='also re-run named events that already succeeded')
+    args = parser.parse_args()
+
+    # Handlers register on the importable module, not on this __main__ copy
+    import routes.payments  # noqa: F401
+    from services import stripe_events
+
+    if args.command == 'list':
+        for event in stripe_events.list_events(args.status, args.limit):
+            print(f"{event['event_id']}  {event['type']:<32} {event['status']:<8} "
+                  f"attempts={event['attempts']}  {event['last_error'] or ''}")
+    elif args.command == 'replay':
+        if not args.event_ids and not args.failed:
+            parser.error('give event ids or --failed')
+        print(f'{stripe_events.replay_events(args.event_ids, args.failed, args.force)} events replayed')
+        for event in stripe_events.list_events('failed', 10):
+            print(f"still failing: {event['event_id']} {event['last_error']}")
@@ -0,0 +1,253 @@
+# Local subscription state, so feature gating never waits on Stripe.
+# Rows are written by the webhook consumer, by verified checkouts and by the
+# reconciliation job; reads go through an in-process TTL cache, so
+# tier_for(user_id) is a dict lookup on the hot path.
+#
+# Reconcile against Stripe (or a stripe-mock stand-in):
+#     cd src && python -m services.subscription_store reconcile --api-base http://localhost:12111
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import stripe
+
+from services import stripe_events
+
+CACHE_TTL_SECONDS = float(os.getenv('SUBSCRIPTION_CACHE_TTL', '60'))
+CACHE_MAX_USERS = max(int(os.getenv('SUBSCRIPTION_CACHE_MAX_USERS', '10000')), 1)
+RECONCILE_INTERVAL = float(os.getenv('SUBSCRIPTION_RECONCILE_INTERVAL', '0'))
+DEFAULT_TIER = 'free'
+
+# Statuses that keep a paid plan's features (past_due while Stripe retries the card)
+ENTITLED_STATUSES = ('active', 'trialing', 'past_due')
+
+SUBSCRIPTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        customer_id TEXT PRIMARY KEY,
+        user_id TEXT,
+        customer_email TEXT,
+        subscription_id TEXT,
+        checkout_session_id TEXT,
+        plan_id TEXT,
+        status TEXT,
+        current_period_end INTEGER,
+        event_created INTEGER DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Stripe may deliver events out of order: an upsert only wins if its source is
+# at least as new as the one that last wrote the row
+UPSERT_SUBSCRIPTION_SQL = '''
+    INSERT INTO subscriptions
+    (customer_id, user_id, customer_email, subscription_id, checkout_session_id,
+     plan_id, status, current_period_end, event_created, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (customer_id) DO UPDATE SET
+        user_id = COALESCE(excluded.user_id, user_id),
+        customer_email = COALESCE(excluded.customer_email, customer_email),
+        subscription_id = COALESCE(excluded.subscription_id, subscription_id),
+        checkout_session_id = COALESCE(excluded.checkout_session_id, checkout_session_id),
+        plan_id = COALESCE(excluded.plan_id, plan_id),
+        status = excluded.status,
+        current_period_end = COALESCE(excluded.current_period_end, current_period_end),
+        event_created = excluded.event_created,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE excluded.event_created >= subscriptions.event_created
+'''
+
+# user_id -> (tier, expires_at), in expiry order (every entry gets the same TTL)
+_tier_cache = OrderedDict()
+_tier_cache_lock = threading.Lock()
+
+_reconcile_thread = None
+_reconcile_lock = threading.Lock()
+
+@stripe_events.register_initializer
+def init_subscription_table(conn):
+    """Create the subscriptions table (and add columns missing from older files)"""
+    conn.execute(SUBSCRIPTIONS_SCHEMA)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(subscriptions)')}
+    for column in ('user_id', 'checkout_session_id'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE subscriptions ADD COLUMN {column} TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_email ON subscriptions (customer_email)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_checkout ON subscriptions (checkout_session_id)')
+
+@stripe_events.on_applied
+def invalidate_cache(event=None):
+    """Forget cached tiers once new billing state is committed"""
+    # Events are keyed by customer, not user, so drop everything; the cache
+    # refills with one indexed lookup per active user
+    _tier_cache.clear()
+
+def upsert_subscription(conn, customer_id, status, user_id=None, customer_email=None,
+                        subscription_id=None, checkout_session_id=None, plan_id=None,
+                        current_period_end=None, source_created=0):
+    """Write one customer's subscription state (caller commits)"""
+    conn.execute(UPSERT_SUBSCRIPTION_SQL, (
+        customer_id, user_id, customer_email, subscription_id, checkout_session_id,
+        plan_id, status, current_period_end, source_created or 0
+    ))
+
+def record_verified_checkout(session, plan_id, user_id=None):
+    """Store a checkout session that Stripe reported as paid"""
+    customer_email = session.get('customer_email') or (session.get('customer_details') or {}).get('email')
+    with stripe_events.connect() as conn:
+        upsert_subscription(
+            conn, session.get('customer') or customer_email, 'active',
+            user_id=user_id, customer_email=customer_email,
+            subscription_id=session.get('subscription'), checkout_session_id=session.get('id'),
+            plan_id=plan_id, source_created=session.get('created', 0)
+        )
+        conn.commit()
+    invalidate_cache()
+
+def find_checkout(checkout_session_id):
+    """Locally known subscription for a checkout session id, or None"""
+    with stripe_events.connect() as conn:
+        row = conn.execute('''
+            SELECT plan_id, status, customer_email, user_id
+            FROM subscriptions
+            WHERE checkout_session_id = ?
+        ''', (checkout_session_id,)).fetchone()
+    if row is None:
+        return None
+    plan_id, status, customer_email, user_id = row
+    return {'plan_id': plan_id, 'status': status, 'customer_email': customer_email, 'user_id': user_id}
+
+def load_tier(user_id):
+    """Read a user's tier from the database (matched by the authenticated user id only)"""
+    with stripe_events.connect() as conn:
+        row = conn.execute(f'''
+            SELECT plan_id FROM subscriptions
+            WHERE user_id = ?
+              AND status IN ({', '.join('?' for _ in ENTITLED_STATUSES)})
+              AND plan_id IS NOT NULL
+            ORDER BY event_created DESC
+            LIMIT 1
+        ''', (user_id, *ENTITLED_STATUSES)).fetchone()
+    return row[0] if row else DEFAULT_TIER
+
+def tier_for(user_id):
+    """Plan id for a user ('free' if unknown), cached for SUBSCRIPTION_CACHE_TTL seconds"""
+    if not user_id:
+        return DEFAULT_TIER
+
+    now = time.monotonic()
+    cached = _tier_cache.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    tier = load_tier(user_id)
+    with _tier_cache_lock:
+        _tier_cache[user_id] = (tier, now + CACHE_TTL_SECONDS)
+        _tier_cache.move_to_end(user_id)
+        # User ids come from clients: drop expired entries and cap the size
+        while _tier_cache:
+            oldest_user, (_, expires_at) = next(iter(_tier_cache.items()))
+            if expires_at > now and len(_tier_cache) <= CACHE_MAX_USERS:
+                break
+            del _tier_cache[oldest_user]
+    return tier
+
+def subscription_preference(subscription):
+    """Sort key for a customer's subscriptions: entitled ones first, then the newest"""
+    return (subscription.get('status') in ENTITLED_STATUSES, subscription.get('created') or 0)
+
+def subscription_source_time(subscription):
+    """Latest moment Stripe reports for a subscription (creation, renewal, cancellation)"""
+    stamps = [subscription.get(key) for key in ('created', 'current_period_start', 'canceled_at', 'ended_at')]
+    return max((stamp for stamp in stamps if stamp), default=0)
+
+def reconcile(plan_for_price, limit=None):
+    """Overwrite local rows with the subscription Stripe reports for each customer"""
+    # Page through Stripe first: the write transaction below must not stay
+    # open across network calls, or webhook enqueues would wait on it.
+    # A customer may have several subscriptions (e.g. an old canceled one and
+    # an active one): keep the entitled one, else the newest
+    best = {}
+    seen = 0
+    for subscription in stripe.Subscription.list(status='all', limit=100).auto_paging_iter():
+        seen += 1
+        customer_id = subscription['customer']
+        current = best.get(customer_id)
+        if current is None or subscription_preference(subscription) > subscription_preference(current):
+            best[customer_id] = subscription
+        if limit and seen >= limit:
+            break
+
+    # Each row is stamped with the subscription's own latest change, so it
+    # replaces older state but never a newer webhook event for the customer
+    stats = {'seen': seen, 'customers': len(best), 'changed': 0}
+    with stripe_events.connect() as conn:
+        before = {
+            customer_id: (plan_id, status)
+            for customer_id, plan_id, status in conn.execute('SELECT customer_id, plan_id, status FROM subscriptions')
+        }
+        for customer_id, subscription in best.items():
+            items = (subscription.get('items') or {}).get('data') or []
+            price_id = ((items[0].get('price') or {}).get('id')) if items else None
+            plan_id = plan_for_price(price_id)
+            status = subscription.get('status')
+            upsert_subscription(
+                conn, customer_id, status,
+                subscription_id=subscription['id'], plan_id=plan_id,
+                current_period_end=subscription.get('current_period_end'),
+                source_created=subscription_source_time(subscription)
+            )
+
+            # An unknown price keeps the stored plan (COALESCE in the upsert)
+            previous = before.get(customer_id)
+            if previous != (plan_id or (previous[0] if previous else None), status):
+                stats['changed'] += 1
+        conn.commit()
+    invalidate_cache()
+    return stats
+
+def _reconcile_worker(plan_for_price):
+    """Reconcile every SUBSCRIPTION_RECONCILE_INTERVAL seconds"""
+    while True:
+        time.sleep(RECONCILE_INTERVAL)
+        try:
+            stats = reconcile(plan_for_price)
+            if stats['changed']:
+                print(f"Subscription reconciliation: {stats}")
+        except Exception as e:
+            print(f"Subscription reconciliation failed: {e}")
+
+def start_reconcile_job(plan_for_price):
+    """Start the periodic reconciliation thread once (disabled when the interval is 0)"""
+    global _reconcile_thread
+
+    if _reconcile_thread is not None or RECONCILE_INTERVAL <= 0 or not stripe.api_key:
+        return
+    with _reconcile_lock:
+        if _reconcile_thread is None:
+            _reconcile_thread = threading.Thread(target=_reconcile_worker, args=(plan_for_price,), daemon=True)
+            _reconcile_thread.start()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local subscription store tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    reconcile_parser = subcommands.add_parser('reconcile', help='sync local subscriptions from Stripe')
+    reconcile_parser.add_argument('--api-base', help='Stripe API base URL (e.g. a stripe-mock instance)')
+    reconcile_parser.add_argument('--limit', type=int, help='stop after this many subscriptions')
+    tier_parser = subcommands.add_parser('tier', help='print the tier for a user id')
+    tier_parser.add_argument('user_id')
+    args = parser.parse_args()
+
+    # Work on the importable modules, where the payments routes registered their hooks
+    from routes.payments import plan_for_price
+    from services import subscription_store
+
+    if args.command == 'reconcile':
+        if args.api_base:
+            stripe.api_base = args.api_base
+            stripe.api_key = stripe.api_key or 'sk_test_123'
+        print(subscription_store.reconcile(plan_for_price, args.limit))
+    elif args.command == 'tier':
+        print(subscription_store.tier_for(args.user_id))
@@ -0,0 +1,209 @@
+# Lightweight request/session tracing.
+# The current trace and span live in a contextvar, so they follow a request
+# through its handler and are copied into scheduler and OpenRouter threads.
+# Finished spans are appended as JSON lines to a size-rotated file per process
+# (TRACE_DIR/spans-<pid>.jsonl); load_trace() gathers one trace from all of
+# them. Durations come from the monotonic clock; span start times are wall
+# clock anchored once per process, so spans from a resumed session (another
+# process) still line up on one timeline.
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+TRACE_DIR = os.path.abspath(os.getenv(
+    'TRACE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'traces')
+))
+TRACE_FILE_MAX_BYTES = int(os.getenv('TRACE_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv('TRACE_FILE_BACKUPS', '3'))
+# Span files of processes that stopped writing this long ago are deleted
+TRACE_RETENTION_HOURS = float(os.getenv('TRACE_RETENTION_HOURS', '48'))
+
+# (trace_id, span_id) of the innermost open span
+_current = contextvars.ContextVar('trace_span', default=None)
+
+_mono_anchor = time.monotonic()
+_wall_anchor = time.time()
+
+_logger = None
+_logger_pid = None
+_logger_lock = threading.Lock()
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+def wall_time(monotonic_time):
+    """Wall-clock time of a monotonic reading (anchored once per process)"""
+    return _wall_anchor + (monotonic_time - _mono_anchor)
+
+def current_trace_id():
+    """Trace id of the active span, or None outside any trace"""
+    current = _current.get()
+    return current[0] if current else None
+
+def _get_logger():
+    """Per-process rotating span writer (created after fork, on first use)"""
+    global _logger, _logger_pid
+
+    if _logger_pid == os.getpid():
+        return _logger
+    with _logger_lock:
+        if _logger_pid != os.getpid():
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            _purge_old_files()
+            logger = logging.getLogger(f'promptlink.trace.{os.getpid()}')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(
+                os.path.join(TRACE_DIR, f'spans-{os.getpid()}.jsonl'),
+                maxBytes=TRACE_FILE_MAX_BYTES,
+                backupCount=TRACE_FILE_BACKUPS,
+                encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.handlers = [handler]
+            _logger = logger
+            _logger_pid = os.getpid()
+    return _logger
+
+def _purge_old_files():
+    cutoff = time.time() - TRACE_RETENTION_HOURS * 3600
+    for path in glob.glob(os.path.join(TRACE_DIR, 'spans-*.jsonl*')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _emit(trace_id, span_id, parent_id, name, started, finished, attrs, error=None):
+    record = {
+        'trace_id': trace_id,
+        'span_id': span_id,
+        'parent_id': parent_id,
+        'name': name,
+        'start': round(wall_time(started), 6),
+        'duration_ms': round((finished - started) * 1000, 3),
+        'thread': threading.current_thread().name,
+        'attrs': attrs
+    }
+    if error:
+        record['error'] = error
+    try:
+        _get_logger().info(json.dumps(record, default=str))
+    except Exception as e:
+        print(f"Trace write failed: {e}")
+
+def record_span(name, started, finished, trace_id=None, **attrs):
+    """Write an already-timed span (time.monotonic() readings) under the current span"""
+    if not TRACING_ENABLED:
+        return
+    current = _current.get()
+    parent_id = None
+    if current and trace_id in (None, current[0]):
+        trace_id, parent_id = current
+    if trace_id is None:
+        return
+    _emit(trace_id, new_id(), parent_id, name, started, finished, attrs)
+
+class Span:
+    """A timed operation; use as a context manager or start()/finish() around a request"""
+    __slots__ = ('name', 'attrs', 'trace_id', 'span_id', 'parent_id', 'started', 'token')
+
+    def __init__(self, name, trace_id=None, **attrs):
+        self.name = name
+        self.attrs = attrs
+        current = _current.get()
+        # A span joins the current trace unless told to start or continue another
+        if trace_id is None or (current and current[0] == trace_id):
+            self.trace_id = current[0] if current else (trace_id or new_id())
+            self.parent_id = current[1] if current else None
+        else:
+            self.trace_id = trace_id
+            self.parent_id = None
+        self.span_id = new_id()
+        self.started = None
+        self.token = None
+
+    def start(self):
+        self.started = time.monotonic()
+        self.token = _current.set((self.trace_id, self.span_id))
+        return self
+
+    def finish(self, error=None):
+        finished = time.monotonic()
+        if self.token is not None:
+            _current.reset(self.token)
+            self.token = None
+        if TRACING_ENABLED:
+            _emit(self.trace_id, self.span_id, self.parent_id, self.name, self.started, finished, self.attrs, error)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(f'{exc_type.__name__}: {exc}' if exc_type else None)
+        return False
+
+def span(name, trace_id=None, **attrs):
+    """Context manager timing a block as a child of the current span"""
+    return Span(name, trace_id=trace_id, **attrs)
+
+def load_trace(trace_id):
+    """All recorded spans of a trace, from every process's span files, by start time"""
+    spans = []
+    needle = f'"trace_id": "{trace_id}"'
+    for path in glob.glob(os.path.join(TRACE_DIR, 'spans-*.jsonl*')):
+        try:
+            with open(path, encoding='utf-8') as handle:
+                for line in handle:
+                    if needle in line:
+                        spans.append(json.loads(line))
+        except (OSError, ValueError):
+            continue
+    spans.sort(key=lambda item: item['start'])
+    return spans
+
+def waterfall(spans):
+    """Spans as offsets from the trace start, nested by parent, with per-name totals"""
+    if not spans:
+        return {'total_ms': 0, 'spans': [], 'totals_ms': {}}
+    trace_start = spans[0]['start']
+    trace_end = max(item['start'] + item['duration_ms'] / 1000 for item in spans)
+
+    by_id = {item['span_id']: item for item in spans}
+    def depth(item):
+        level = 0
+        parent = by_id.get(item.get('parent_id'))
+        while parent is not None and level < 32:
+            level += 1
+            parent = by_id.get(parent.get('parent_id'))
+        return level
+
+    totals = {}
+    rows = []
+    for item in spans:
+        totals[item['name']] = round(totals.get(item['name'], 0) + item['duration_ms'], 3)
+        row = {
+            'name': item['name'],
+            'span_id': item['span_id'],
+            'parent_id': item.get('parent_id'),
+            'depth': depth(item),
+            'offset_ms': round((item['start'] - trace_start) * 1000, 3),
+            'duration_ms': item['duration_ms'],
+            'attrs': item.get('attrs', {})
+        }
+        if item.get('error'):
+            row['error'] = item['error']
+        rows.append(row)
+    return {
+        'total_ms': round((trace_end - trace_start) * 1000, 3),
+        'spans': rows,
+        'totals_ms': totals
+    }